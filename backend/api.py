@@ -45,12 +45,24 @@ load_env_from_file()
 from datetime import datetime
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from routers import chat_router
 from services.extraction_service import extract_criteria, OpenRouterExtractorError
-from services.activity_matcher import get_activity_matcher
-from services.location_matcher import get_location_matcher
+from services.metrics import metrics
+from services.cache import cache_stats, open_shared_cache, close_shared_cache
+from services.cache_snapshot import start_cache_persistence, stop_cache_persistence
+from services.cache_warmup import start_background_warmup
+from services.llm_client import open_llm_client, close_llm_client, usage_stats, hedge_stats
+from services.company_api_client import open_company_api_client, close_company_api_client, count_cache_stats
+from services.load_monitor import load_monitor
+from services.readiness import (
+    readiness,
+    start_background_initialization,
+    ACTIVITY_MATCHER,
+    LOCATION_MATCHER,
+)
 
 # ============================================================================
 # FastAPI Application
@@ -122,36 +134,61 @@ async def root():
 
 @app.get("/health", response_model=HealthResponse)
 async def health():
-    """Health check endpoint with component status"""
-    # Check activity matcher
-    try:
-        matcher = await get_activity_matcher()
-        if matcher._initialized:
-            embeddings_status = "file-based"
-        else:
-            embeddings_status = "not initialized"
-    except Exception as e:
-        embeddings_status = f"error: {str(e)}"
-
-    # Check location matcher
-    try:
-        loc_matcher = get_location_matcher()
-        if loc_matcher._initialized:
-            locations_status = f"{len(loc_matcher.communes)} communes, {len(loc_matcher.departements)} deps, {len(loc_matcher.regions)} regions"
-        else:
-            locations_status = "not initialized"
-    except Exception as e:
-        locations_status = f"error: {str(e)}"
+    """Health check endpoint with component status (does not wait for initialization)"""
+    components = readiness.snapshot()
+
+    def component_status(name: str) -> str:
+        status = components.get(name)
+        if status is None:
+            return "not initialized"
+        if status["state"] == "ready":
+            return status["detail"] or "ready"
+        if status["state"] == "failed":
+            return status["detail"] or "failed"
+        return "initializing"
 
     return HealthResponse(
         status="healthy",
         version="2.0.0",
-        embeddings=embeddings_status,
-        locations=locations_status,
+        embeddings=component_status(ACTIVITY_MATCHER),
+        locations=component_status(LOCATION_MATCHER),
         timestamp=datetime.utcnow()
     )
 
 
+@app.get("/health/live")
+async def health_live():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive", "timestamp": datetime.utcnow().isoformat()}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness probe: 200 once every component is initialized, 503 otherwise"""
+    ready = readiness.all_ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "components": readiness.snapshot(),
+            "timestamp": datetime.utcnow().isoformat(),
+        },
+    )
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Service counters (cache hits, skipped LLM calls, LLM token usage...) and latency percentiles"""
+    return {
+        **metrics.snapshot(),
+        "caches": cache_stats(),
+        "llm_usage": usage_stats(),
+        "llm_hedging": hedge_stats(),
+        "load": load_monitor.stats(),
+        "count_cache": count_cache_stats(),
+    }
+
+
 @app.post("/extract", response_model=ExtractResponse)
 async def extract_endpoint(payload: ExtractRequest) -> ExtractResponse:
     """
@@ -159,7 +196,7 @@ async def extract_endpoint(payload: ExtractRequest) -> ExtractResponse:
     Single-shot extraction without conversation context.
     """
     try:
-        result = extract_criteria(payload.query)
+        result = await extract_criteria(payload.query)
     except OpenRouterExtractorError as exc:
         raise HTTPException(status_code=502, detail=str(exc)) from exc
     except Exception as exc:
@@ -177,32 +214,41 @@ async def extract_endpoint(payload: ExtractRequest) -> ExtractResponse:
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize matchers on startup"""
+    """Start matcher initialization in the background and serve immediately"""
     print("🚀 Starting Company Search API...")
 
-    # Initialize activity matcher (file-based embeddings)
-    print("📊 Initializing activity matcher...")
-    activity_matcher = await get_activity_matcher()
-    if activity_matcher._initialized:
-        print("✅ Activity matcher ready (file-based embeddings)")
-    else:
-        print("⚠️  Activity matcher not initialized - activity matching will be disabled")
+    # Shared OpenRouter connection pool (JSON and streaming calls) for the app lifespan
+    await open_llm_client()
+    # Same for the company count API
+    await open_company_api_client()
+
+    # Shared cache tier across replicas (CACHE_SHARED_URL), if configured
+    open_shared_cache()
+
+    # Cache contents from the previous run (values decoded on first access),
+    # then periodic snapshots
+    await start_cache_persistence()
+
+    # Activity embeddings (possibly regenerated) and location lists load in
+    # background tasks; endpoints that need them wait via services.readiness
+    print("📊 Initializing activity and location matchers in background...")
+    start_background_initialization()
 
-    # Initialize location matcher
-    print("📍 Initializing location matcher...")
-    location_matcher = get_location_matcher()
-    if location_matcher._initialized:
-        print("✅ Location matcher ready")
-    else:
-        print("⚠️  Location matcher not initialized - location matching will be disabled")
+    # Optional cache warm-up (CACHE_WARMUP_CORPUS), once the matchers are ready;
+    # it does not hold readiness back
+    start_background_warmup()
 
-    print("✅ API ready")
+    print("✅ API accepting requests (see /health/ready for component status)")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up on shutdown"""
     print("🛑 Shutting down Company Search API...")
+    await close_llm_client()
+    await close_company_api_client()
+    await stop_cache_persistence()
+    close_shared_cache()
     print("✅ Shutdown complete")
 
 
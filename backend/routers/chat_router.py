@@ -4,13 +4,19 @@ Stateless chat endpoint for the conversational agent.
 No database required - frontend manages conversation state.
 """
 
+import asyncio
 import json
 from typing import List, Dict, Any, Optional, AsyncGenerator
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from services.agent_service import AgentService, ActivityMatch
+from services.agent_service import ActivityMatch
+from services.chat_pipeline import CHAT_PIPELINE, start_chat, run_chat, skipped_stages
+from services.context_compactor import compact_history
+from services.load_monitor import load_monitor
+from services.pipeline import DeadlineExceeded
+from services.readiness import readiness, ComponentNotReadyError, ACTIVITY_MATCHER, LOCATION_MATCHER
 
 
 # ============================================================================
@@ -28,6 +34,9 @@ class ChatRequest(BaseModel):
     messages: List[ChatMessage] = Field(..., min_length=1, description="Conversation history")
     previous_extraction: Optional[Dict[str, Any]] = Field(None, description="Previous extraction for caching")
     previous_activity_matches: Optional[List["ActivityMatchResponse"]] = Field(None, description="Previous activity matches for caching")
+    previous_company_count: Optional[int] = Field(None, description="Previous count (NAF-based), reused if the criteria are unchanged")
+    previous_count_semantic: Optional[int] = Field(None, description="Previous count (semantic)")
+    template_response: bool = Field(False, description="Build the assistant message from templates (no response LLM call)")
 
 
 class ActivityMatchResponse(BaseModel):
@@ -47,6 +56,9 @@ class ChatResponse(BaseModel):
     naf_codes: Optional[List[str]] = Field(None, description="Matched NAF codes")
     api_result: Optional[Dict[str, Any]] = Field(None, description="Full API response data")
     activity_matches: Optional[List[ActivityMatchResponse]] = Field(None, description="Activity matches with scores")
+    extraction_source: Optional[str] = Field(None, description="Where the extraction came from: 'llm', 'cache', 'rules' or 'classifier'")
+    skipped_stages: Optional[List[str]] = Field(None, description="Pipeline stages reused from the previous turn")
+    stage_timings: Optional[Dict[str, int]] = Field(None, description="Milliseconds spent per pipeline stage")
 
 
 class UpdateSelectionRequest(BaseModel):
@@ -70,6 +82,36 @@ class UpdateSelectionResponse(BaseModel):
 router = APIRouter(prefix="/api/v1", tags=["chat"])
 
 
+async def _wait_for_matchers() -> None:
+    """Wait (bounded) for the matchers used by the chat pipeline, or answer 503."""
+    try:
+        await readiness.wait(LOCATION_MATCHER, ACTIVITY_MATCHER)
+    except ComponentNotReadyError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service initializing: {e.component} not ready, retry shortly",
+            headers={"Retry-After": "5"},
+        )
+
+
+async def _relay(coro, events: asyncio.Queue) -> AsyncGenerator[Any, None]:
+    """Run `coro`, yielding what it puts in `events` until it finishes (its errors are re-raised)."""
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            next_event = asyncio.ensure_future(events.get())
+            await asyncio.wait({next_event, task}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                break
+            yield next_event.result()
+        while not events.empty():
+            yield events.get_nowait()
+        task.result()
+    finally:
+        task.cancel()
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest) -> ChatResponse:
     """
@@ -83,8 +125,10 @@ async def chat(request: ChatRequest) -> ChatResponse:
     2. If extracted: query API for company count
     3. Return response with extraction and count
     """
+    await _wait_for_matchers()
+
     try:
-        # Convert to internal Message format for AgentService
+        # Convert to internal Message format for the pipeline
         messages = []
         for msg in request.messages:
             message = type('Message', (), {
@@ -113,32 +157,24 @@ async def chat(request: ChatRequest) -> ChatResponse:
                 for m in request.previous_activity_matches
             ]
 
-        # Process with agent (extraction + location matching)
-        agent_response = await AgentService.process_message(
+        # Extraction, activity matching, count and response (services.chat_pipeline)
+        run = start_chat(
             messages,
-            previous_extraction=request.previous_extraction
+            user_query=user_query,
+            previous_extraction=request.previous_extraction,
+            previous_activity_matches=previous_activity_matches_internal,
+            previous_company_count=request.previous_company_count,
+            previous_count_semantic=request.previous_count_semantic,
+            conversation_history=compact_history(request.messages, label="response").text,
+            template_response=request.template_response,
         )
+        with load_monitor.track_request():
+            agent_response = await run_chat(run)
 
-        # If extraction succeeded, query the API
         if agent_response.action == "extract" and agent_response.extraction_result:
-            # Format conversation history for response generation
-            conversation_history = "\n".join([
-                f"{'Utilisateur' if msg.role == 'user' else 'Agent'}: {msg.content}"
-                for msg in request.messages
-            ])
-
-            api_response = await AgentService.process_with_api(
-                extraction_result=agent_response.extraction_result,
-                user_query=user_query,
-                location_corrections=agent_response.location_corrections,
-                previous_extraction=request.previous_extraction,
-                previous_activity_matches=previous_activity_matches_internal,
-                conversation_history=conversation_history
-            )
-
             # Convert activity matches to response format
             activity_matches = None
-            if api_response.activity_matches:
+            if agent_response.activity_matches:
                 activity_matches = [
                     ActivityMatchResponse(
                         activity=m.activity,
@@ -146,17 +182,20 @@ async def chat(request: ChatRequest) -> ChatResponse:
                         score=m.score,
                         selected=m.selected
                     )
-                    for m in api_response.activity_matches
+                    for m in agent_response.activity_matches
                 ]
 
             return ChatResponse(
-                message=api_response.message,
-                extraction_result=api_response.extraction_result,
-                company_count=api_response.company_count,
-                count_semantic=api_response.count_semantic,
-                naf_codes=api_response.naf_codes,
-                api_result=api_response.api_result,
+                message=agent_response.message,
+                extraction_result=agent_response.extraction_result,
+                company_count=agent_response.company_count,
+                count_semantic=agent_response.count_semantic,
+                naf_codes=agent_response.naf_codes,
+                api_result=agent_response.api_result,
                 activity_matches=activity_matches,
+                extraction_source=agent_response.extraction_source,
+                skipped_stages=agent_response.skipped_stages,
+                stage_timings=agent_response.stage_timings,
             )
         else:
             # Query too vague - rejected
@@ -168,8 +207,13 @@ async def chat(request: ChatRequest) -> ChatResponse:
                 naf_codes=None,
                 api_result=None,
                 activity_matches=None,
+                extraction_source=agent_response.extraction_source,
+                stage_timings=run.timings_ms(),
             )
 
+    except DeadlineExceeded as e:
+        print(f"Deadline exceeded in chat endpoint: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
@@ -184,199 +228,114 @@ async def chat_stream(request: ChatRequest) -> StreamingResponse:
     First sends metadata (extraction, count, etc.), then streams the message.
 
     Event types:
+    - partial: JSON with the criteria sections extracted so far (while the extraction streams)
     - metadata: JSON with extraction_result, company_count, naf_codes, activity_matches
     - content: Text chunk of the assistant's message
     - done: Stream complete
     - error: Error occurred
     """
+    await _wait_for_matchers()
+
     async def generate_stream() -> AsyncGenerator[str, None]:
-        try:
-            # Convert to internal Message format for AgentService
-            messages = []
-            for msg in request.messages:
-                message = type('Message', (), {
-                    'role': type('Role', (), {'value': msg.role})(),
-                    'content': msg.content,
-                })()
-                messages.append(message)
-
-            # Get user query (last user message)
-            user_query = ""
-            for msg in reversed(request.messages):
-                if msg.role == "user":
-                    user_query = msg.content
-                    break
-
-            # Convert previous activity matches from request to internal format
-            previous_activity_matches_internal = None
-            if request.previous_activity_matches:
-                previous_activity_matches_internal = [
-                    ActivityMatch(
-                        activity=m.activity,
-                        naf_codes=m.naf_codes,
-                        score=m.score,
-                        selected=m.selected
-                    )
-                    for m in request.previous_activity_matches
+        with load_monitor.track_request():
+            try:
+                # Convert to internal Message format for the pipeline
+                messages = []
+                for msg in request.messages:
+                    message = type('Message', (), {
+                        'role': type('Role', (), {'value': msg.role})(),
+                        'content': msg.content,
+                    })()
+                    messages.append(message)
+
+                # Get user query (last user message)
+                user_query = ""
+                for msg in reversed(request.messages):
+                    if msg.role == "user":
+                        user_query = msg.content
+                        break
+
+                # Convert previous activity matches from request to internal format
+                previous_activity_matches_internal = None
+                if request.previous_activity_matches:
+                    previous_activity_matches_internal = [
+                        ActivityMatch(
+                            activity=m.activity,
+                            naf_codes=m.naf_codes,
+                            score=m.score,
+                            selected=m.selected
+                        )
+                        for m in request.previous_activity_matches
+                    ]
+
+                # Extraction, activity matching and count (services.chat_pipeline),
+                # relaying partial criteria while the extraction streams
+                events: asyncio.Queue = asyncio.Queue()
+                run = start_chat(
+                    messages,
+                    user_query=user_query,
+                    previous_extraction=request.previous_extraction,
+                    previous_activity_matches=previous_activity_matches_internal,
+                    previous_company_count=request.previous_company_count,
+                    previous_count_semantic=request.previous_count_semantic,
+                    conversation_history=compact_history(request.messages, label="response").text,
+                    on_partial=events.put_nowait,
+                    template_response=request.template_response,
+                )
+                async for partial in _relay(CHAT_PIPELINE.run(run, until=("count",)), events):
+                    partial = {"extraction_result": partial}
+                    yield f"event: partial\ndata: {json.dumps(partial, ensure_ascii=False)}\n\n"
+                agent_response = run["extraction"]
+
+                # If rejected (too vague), send rejection message and done
+                if run.halted:
+                    rejected = {"rejected": True, "extraction_source": agent_response.extraction_source}
+                    yield f"event: metadata\ndata: {json.dumps(rejected)}\n\n"
+                    yield f"event: content\ndata: {json.dumps(agent_response.message)}\n\n"
+                    yield "event: done\ndata: {}\n\n"
+                    return
+
+                search = run["count"]
+                failed = search.api_error is not None
+                skipped = skipped_stages(run)
+                print(f"[Stream] Stages skipped: {skipped or 'none'}")
+
+                # Convert activity matches to response format
+                activity_matches_response = [
+                    {
+                        "activity": m.activity,
+                        "naf_codes": m.naf_codes,
+                        "score": m.score,
+                        "selected": m.selected
+                    }
+                    for m in search.activity_matches
                 ]
 
-            # Process with agent (extraction + location matching)
-            agent_response = await AgentService.process_message(
-                messages,
-                previous_extraction=request.previous_extraction
-            )
-
-            # If rejected (too vague), send rejection message and done
-            if agent_response.action != "extract" or not agent_response.extraction_result:
-                yield f"event: metadata\ndata: {json.dumps({'rejected': True})}\n\n"
-                yield f"event: content\ndata: {json.dumps(agent_response.message)}\n\n"
-                yield "event: done\ndata: {}\n\n"
-                return
-
-            # Format conversation history for response generation
-            conversation_history = "\n".join([
-                f"{'Utilisateur' if msg.role == 'user' else 'Agent'}: {msg.content}"
-                for msg in request.messages
-            ])
-
-            # Import services for API processing
-            from services.activity_matcher import get_activity_matcher
-            from services.api_transformer import transform_extraction_to_api_request
-            from services.company_api_client import get_company_api_client, CompanyAPIError
-
-            extraction_result = agent_response.extraction_result
-            location_corrections = agent_response.location_corrections
-
-            naf_codes = []
-            company_count = 0
-            count_semantic = 0
-            original_activity_text = None
-            activity_matches = []
-
-            # Process activity matching (Step 1 & 2)
-            activite = extraction_result.get("activite", {})
-            activity_display = activite.get("activite_entreprise")
-            mots_cles = activite.get("mots_cles")
-
-            previous_mots_cles = None
-            if request.previous_extraction:
-                previous_activite = request.previous_extraction.get("activite", {})
-                previous_mots_cles = previous_activite.get("mots_cles")
-
-            activity_changed = mots_cles != previous_mots_cles
-
-            if mots_cles:
-                original_activity_text = activity_display or mots_cles
-                print(f"[Stream] Activity search: mots_cles='{mots_cles}', changed={activity_changed}")
-
-                if not activity_changed and previous_activity_matches_internal:
-                    print(f"[Stream] Using cached activity matches")
-                    activity_matches = previous_activity_matches_internal
-                    for match in activity_matches:
-                        if match.selected:
-                            for code in match.naf_codes:
-                                if code not in naf_codes:
-                                    naf_codes.append(code)
-                else:
-                    print(f"[Stream] Running activity matcher...")
-                    activity_matcher = await get_activity_matcher()
-                    matches = activity_matcher.find_similar_activities(mots_cles, top_k=5, threshold=0.3)
-                    print(f"[Stream] Found {len(matches)} activity matches")
-
-                    print(f"[Stream] Running NAF selection LLM...")
-                    selected_indices, explanation, no_good_match = AgentService._select_naf_codes(
-                        mots_cles, matches
-                    )
-                    print(f"[Stream] NAF selection complete: indices={selected_indices}")
-
-                    for i, (activity, score, codes) in enumerate(matches):
-                        is_selected = i in selected_indices and not no_good_match
-                        activity_matches.append(ActivityMatch(
-                            activity=activity,
-                            naf_codes=codes,
-                            score=score,
-                            selected=is_selected
-                        ))
-                        if is_selected:
-                            for code in codes:
-                                if code not in naf_codes:
-                                    naf_codes.append(code)
-
-            # Transform to API format and call external API
-            api_request = transform_extraction_to_api_request(
-                extraction_result,
-                naf_codes,
-                original_activity_text=original_activity_text
-            )
+                # Send metadata first
+                metadata = {
+                    "extraction_result": agent_response.extraction_result,
+                    "company_count": None if failed else search.company_count,
+                    "count_semantic": None if failed else search.count_semantic,
+                    "naf_codes": search.naf_codes if search.naf_codes else None,
+                    "activity_matches": activity_matches_response if activity_matches_response else None,
+                    "extraction_source": agent_response.extraction_source,
+                    "skipped_stages": skipped,
+                    "stage_timings": run.timings_ms(),
+                }
+                yield f"event: metadata\ndata: {json.dumps(metadata, ensure_ascii=False)}\n\n"
 
-            try:
-                api_client = get_company_api_client()
-                api_response = api_client.count_companies(api_request)
-                company_count = api_response.count
-                count_semantic = api_response.count_semantic
-            except CompanyAPIError as e:
-                print(f"[Stream] API error: {e}")
-                company_count = None
-                count_semantic = None
+                # Stream the response message
+                run.inputs["on_chunk"] = events.put_nowait
+                async for chunk in _relay(CHAT_PIPELINE.run(run), events):
+                    yield f"event: content\ndata: {json.dumps(chunk, ensure_ascii=False)}\n\n"
 
-            # Convert activity matches to response format
-            activity_matches_response = [
-                {
-                    "activity": m.activity,
-                    "naf_codes": m.naf_codes,
-                    "score": m.score,
-                    "selected": m.selected
-                }
-                for m in activity_matches
-            ]
+                yield "event: done\ndata: {}\n\n"
 
-            # Send metadata first
-            metadata = {
-                "extraction_result": extraction_result,
-                "company_count": company_count,
-                "count_semantic": count_semantic,
-                "naf_codes": naf_codes if naf_codes else None,
-                "activity_matches": activity_matches_response if activity_matches_response else None,
-            }
-            yield f"event: metadata\ndata: {json.dumps(metadata, ensure_ascii=False)}\n\n"
-
-            # Stream the response message
-            if user_query and activity_matches and company_count is not None:
-                try:
-                    async for chunk in AgentService._generate_contextual_response_stream(
-                        user_query=user_query,
-                        company_count=company_count,
-                        extraction_result=extraction_result,
-                        activity_matches=activity_matches,
-                        location_corrections=location_corrections,
-                        conversation_history=conversation_history
-                    ):
-                        yield f"event: content\ndata: {json.dumps(chunk, ensure_ascii=False)}\n\n"
-                except Exception as stream_error:
-                    print(f"[Stream] Error during streaming: {stream_error}")
-                    import traceback
-                    traceback.print_exc()
-                    yield f"event: content\ndata: {json.dumps(f'Erreur: {stream_error}', ensure_ascii=False)}\n\n"
-            else:
-                # Fallback message
-                print(f"[Stream] Using fallback message (user_query={bool(user_query)}, activity_matches={bool(activity_matches)}, count={company_count})")
-                if company_count is None:
-                    message = "Critères extraits, mais impossible de contacter la base de données."
-                elif company_count == 0:
-                    message = "Aucune entreprise ne correspond à ces critères."
-                elif company_count <= 500:
-                    message = f"J'ai trouvé {company_count} entreprises."
-                else:
-                    message = f"J'ai trouvé {company_count} entreprises. Affinez vos critères."
-                yield f"event: content\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
-
-            yield "event: done\ndata: {}\n\n"
-
-        except Exception as e:
-            print(f"Error in streaming chat: {e}")
-            import traceback
-            traceback.print_exc()
-            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+            except Exception as e:
+                print(f"Error in streaming chat: {e}")
+                import traceback
+                traceback.print_exc()
+                yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
 
     return StreamingResponse(
         generate_stream(),
@@ -421,7 +380,7 @@ async def update_selection(request: UpdateSelectionRequest) -> UpdateSelectionRe
 
         # Call external API
         api_client = get_company_api_client()
-        api_response = api_client.count_companies(api_request)
+        api_response = await api_client.count_companies_async(api_request)
 
         return UpdateSelectionResponse(
             company_count=api_response.count,
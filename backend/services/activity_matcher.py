@@ -4,26 +4,60 @@ Activity Matcher Service for semantic search of activities.
 Uses file-based embeddings with OpenAI API for similarity search.
 """
 
+import asyncio
 import json
 import os
 import pickle
 import unicodedata
 import requests
+from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict
+from typing import Any, List, Optional, Tuple, Dict
 import numpy as np
 
+from services.cache import TTLCache, TieredCache
+from services.pipeline import remaining_timeout
+from services.shared_cache import EMBEDDING_CODEC
+from services.singleflight import ThreadSingleFlight, request_key
+
 # ============================================================================
 # Configuration
 # ============================================================================
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+# Shortened output vectors (text-embedding-3-*), e.g. 256 or 512. Empty = model default.
+OPENAI_EMBEDDING_DIMENSIONS = int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS", "0") or 0) or None
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 ACTIVITIES_FILE = DATA_DIR / "libelle_activite.txt"
 NAF_MAPPING_FILE = DATA_DIR / "naf_mapping.json"
 EMBEDDINGS_FILE = DATA_DIR / "activites_embeddings_openai.pkl"
+EMBEDDINGS_MANIFEST_FILE = DATA_DIR / "activites_embeddings_openai.manifest.json"
+
+# Query embedding cache (identical mots_cles across users and replicas; float16
+# vectors in the shared tier)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "5000"))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+
+_query_embedding_cache = TieredCache(
+    "query_embedding", QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL,
+    version=OPENAI_EMBEDDING_MODEL, codec=EMBEDDING_CODEC,
+)
+
+# Activity search results (identical mots_cles skip the similarity scan)
+ACTIVITY_MATCH_CACHE_SIZE = int(os.getenv("ACTIVITY_MATCH_CACHE_SIZE", "5000"))
+ACTIVITY_MATCH_CACHE_TTL = int(os.getenv("ACTIVITY_MATCH_CACHE_TTL", "86400"))
+
+_activity_match_cache = TTLCache(
+    "activity_match", ACTIVITY_MATCH_CACHE_SIZE, ACTIVITY_MATCH_CACHE_TTL, version=OPENAI_EMBEDDING_MODEL
+)
+_embedding_flights = ThreadSingleFlight("embedding")
+
+# A failed initialization is retried in the background after this many
+# seconds, doubled after each failure up to the maximum
+ACTIVITY_MATCHER_RETRY_DELAY = float(os.getenv("ACTIVITY_MATCHER_RETRY_DELAY", "30"))
+ACTIVITY_MATCHER_RETRY_MAX_DELAY = float(os.getenv("ACTIVITY_MATCHER_RETRY_MAX_DELAY", "600"))
 
 
 # ============================================================================
@@ -44,12 +78,36 @@ def normalize_text(text: str) -> str:
 # OpenAI Embeddings API
 # ============================================================================
 
-def get_openai_embedding(text: str) -> Optional[List[float]]:
-    """Get embedding for a single text from OpenAI API."""
+def _embedding_request_body(texts: Any, dimensions: Optional[int]) -> Dict[str, Any]:
+    """Build the JSON body for the embeddings endpoint."""
+    body: Dict[str, Any] = {
+        "model": OPENAI_EMBEDDING_MODEL,
+        "input": texts,
+    }
+    if dimensions:
+        body["dimensions"] = dimensions
+    return body
+
+
+def get_openai_embedding(
+    text: str,
+    dimensions: Optional[int] = OPENAI_EMBEDDING_DIMENSIONS
+) -> Optional[List[float]]:
+    """
+    Get embedding for a single text from OpenAI API.
+
+    Concurrent identical requests (e.g. the streamed-extraction prefetch and
+    find_similar_activities, or many users with the same query) share one call.
+    """
     if not OPENAI_API_KEY:
         print("[ActivityMatcher] OPENAI_API_KEY not set")
         return None
 
+    key = request_key(OPENAI_EMBEDDING_MODEL, dimensions, text)
+    return _embedding_flights.do(key, lambda: _request_embedding(text, dimensions))
+
+
+def _request_embedding(text: str, dimensions: Optional[int]) -> Optional[List[float]]:
     try:
         response = requests.post(
             "https://api.openai.com/v1/embeddings",
@@ -57,11 +115,8 @@ def get_openai_embedding(text: str) -> Optional[List[float]]:
                 "Authorization": f"Bearer {OPENAI_API_KEY}",
                 "Content-Type": "application/json",
             },
-            json={
-                "model": OPENAI_EMBEDDING_MODEL,
-                "input": text,
-            },
-            timeout=30,
+            json=_embedding_request_body(text, dimensions),
+            timeout=remaining_timeout(30),
         )
         response.raise_for_status()
         data = response.json()
@@ -72,7 +127,10 @@ def get_openai_embedding(text: str) -> Optional[List[float]]:
         return None
 
 
-def get_openai_embeddings_batch(texts: List[str]) -> Optional[List[List[float]]]:
+def get_openai_embeddings_batch(
+    texts: List[str],
+    dimensions: Optional[int] = OPENAI_EMBEDDING_DIMENSIONS
+) -> Optional[List[List[float]]]:
     """Get embeddings for multiple texts from OpenAI API."""
     if not OPENAI_API_KEY:
         print("[ActivityMatcher] OPENAI_API_KEY not set")
@@ -85,10 +143,7 @@ def get_openai_embeddings_batch(texts: List[str]) -> Optional[List[List[float]]]
                 "Authorization": f"Bearer {OPENAI_API_KEY}",
                 "Content-Type": "application/json",
             },
-            json={
-                "model": OPENAI_EMBEDDING_MODEL,
-                "input": texts,
-            },
+            json=_embedding_request_body(texts, dimensions),
             timeout=120,
         )
         response.raise_for_status()
@@ -103,6 +158,87 @@ def get_openai_embeddings_batch(texts: List[str]) -> Optional[List[List[float]]]
         return None
 
 
+# ============================================================================
+# Embedding Index Storage
+# ============================================================================
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize vectors (rows for a matrix) so cosine similarity is a dot product."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def truncate_embeddings(embeddings: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Shorten embeddings to their first `dimensions` components and renormalize.
+
+    text-embedding-3 models are trained so that a truncated, renormalized vector
+    is equivalent to requesting `dimensions` from the API.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dimensions > embeddings.shape[-1]:
+        raise ValueError(
+            f"Cannot truncate {embeddings.shape[-1]}-dim embeddings to {dimensions} dims"
+        )
+    return normalize_embeddings(embeddings[..., :dimensions])
+
+
+def load_embeddings_cache(path: Path = EMBEDDINGS_FILE) -> Optional[Dict[str, Any]]:
+    """Load the raw embeddings cache (activities, embeddings, model, dimensions)."""
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"[ActivityMatcher] Failed to load cache: {e}")
+        return None
+
+
+def save_embeddings_cache(
+    activities: List[str],
+    embeddings: np.ndarray,
+    model: str = OPENAI_EMBEDDING_MODEL,
+    dimensions: Optional[int] = OPENAI_EMBEDDING_DIMENSIONS,
+    path: Path = EMBEDDINGS_FILE,
+    manifest_path: Path = EMBEDDINGS_MANIFEST_FILE,
+) -> bool:
+    """
+    Save embeddings and write a JSON manifest describing the index.
+
+    `dimensions` is the requested output size (None = model default); the
+    manifest also records the actual vector size.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump({
+                'activities': activities,
+                'embeddings': embeddings,
+                'model': model,
+                'dimensions': dimensions,
+            }, f)
+
+        manifest = {
+            "model": model,
+            "dimensions": dimensions,
+            "vector_size": int(embeddings.shape[1]) if embeddings.ndim == 2 else None,
+            "count": len(activities),
+            "dtype": str(embeddings.dtype),
+            "size_bytes": int(embeddings.nbytes),
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        manifest_path.write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+        print(f"[ActivityMatcher] Saved embeddings to cache ({manifest['vector_size']} dims)")
+        return True
+    except Exception as e:
+        print(f"[ActivityMatcher] Failed to save cache: {e}")
+        return False
+
+
 # ============================================================================
 # Activity Matcher
 # ============================================================================
@@ -114,7 +250,8 @@ class ActivityMatcher:
         self.activities: List[str] = []
         self.naf_mapping: Dict[str, List[str]] = {}
         self._naf_mapping_normalized: Dict[str, List[str]] = {}  # Normalized key lookup
-        self.embeddings: Optional[np.ndarray] = None
+        self.embeddings: Optional[np.ndarray] = None  # L2-normalized, one row per activity
+        self.dimensions: Optional[int] = OPENAI_EMBEDDING_DIMENSIONS  # None = model default
         self._initialized = False
 
     def _get_naf_codes(self, activity: str) -> List[str]:
@@ -126,8 +263,8 @@ class ActivityMatcher:
         normalized = normalize_text(activity)
         return self._naf_mapping_normalized.get(normalized, [])
 
-    def initialize(self) -> bool:
-        """Load activities, NAF mapping, and embeddings from files."""
+    def load_reference_data(self) -> bool:
+        """Load activities and NAF mapping from files."""
         # Load activities
         if not ACTIVITIES_FILE.exists():
             print(f"[ActivityMatcher] Activities file not found: {ACTIVITIES_FILE}")
@@ -152,61 +289,91 @@ class ActivityMatcher:
             except Exception as e:
                 print(f"[ActivityMatcher] Failed to load NAF mapping: {e}")
 
-        # Load or create embeddings
-        self.embeddings = self._load_or_create_embeddings()
+        return True
+
+    def initialize(self) -> bool:
+        """Load activities, NAF mapping, and embeddings from files (blocking)."""
+        if not self.load_reference_data():
+            return False
+
+        self.embeddings = self._load_cached_embeddings()
+        if self.embeddings is None:
+            self.embeddings = asyncio.run(self._build_embeddings())
         self._initialized = self.embeddings is not None
 
         return self._initialized
 
-    def _load_or_create_embeddings(self) -> Optional[np.ndarray]:
-        """Load embeddings from cache or generate via OpenAI API."""
-        # Try to load from cache
-        if EMBEDDINGS_FILE.exists():
-            try:
-                with open(EMBEDDINGS_FILE, 'rb') as f:
-                    data = pickle.load(f)
-                    if (data.get('activities') == self.activities and
-                        data.get('model') == OPENAI_EMBEDDING_MODEL):
-                        print(f"[ActivityMatcher] Loaded embeddings from cache")
-                        return data['embeddings']
-                    else:
-                        print("[ActivityMatcher] Cache outdated, regenerating...")
-            except Exception as e:
-                print(f"[ActivityMatcher] Failed to load cache: {e}")
+    async def initialize_async(self) -> bool:
+        """Same as initialize, but builds missing embeddings without blocking the event loop."""
+        if not self.load_reference_data():
+            return False
+
+        self.embeddings = self._load_cached_embeddings()
+        if self.embeddings is None:
+            self.embeddings = await self._build_embeddings()
+        self._initialized = self.embeddings is not None
+
+        return self._initialized
+
+    def _load_cached_embeddings(self) -> Optional[np.ndarray]:
+        """Load embeddings from cache if they match the current activities and model."""
+        data = load_embeddings_cache()
+        if data is None:
+            return None
+        embeddings = self._embeddings_from_cache(data)
+        if embeddings is None:
+            print("[ActivityMatcher] Cache outdated, regenerating...")
+        return embeddings
+
+    async def _build_embeddings(self) -> Optional[np.ndarray]:
+        """Generate embeddings via the OpenAI API (concurrent, resumable)."""
+        from services.embedding_builder import EmbeddingBuilder, EmbeddingBuildError
 
-        # Generate embeddings
         print(f"[ActivityMatcher] Generating embeddings for {len(self.activities)} activities...")
+        try:
+            return await EmbeddingBuilder(self.activities, dimensions=self.dimensions).build()
+        except EmbeddingBuildError as e:
+            print(f"[ActivityMatcher] Failed to generate embeddings: {e}")
+            return None
 
-        all_embeddings = []
-        batch_size = 100
+    def _embeddings_from_cache(self, data: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        Validate a cache payload against the current configuration.
 
-        for i in range(0, len(self.activities), batch_size):
-            batch = self.activities[i:i + batch_size]
-            print(f"[ActivityMatcher] Processing batch {i // batch_size + 1}...")
+        A cache with longer vectors from the same model is truncated and
+        renormalized in memory (run services.embedding_reindex to persist it).
+        """
+        if data.get('activities') != self.activities or data.get('model') != OPENAI_EMBEDDING_MODEL:
+            return None
 
-            embeddings = get_openai_embeddings_batch(batch)
-            if embeddings is None:
-                print("[ActivityMatcher] Failed to generate embeddings")
-                return None
+        embeddings = np.asarray(data['embeddings'], dtype=np.float32)
+        cached_dimensions = data.get('dimensions')
 
-            all_embeddings.extend(embeddings)
+        if cached_dimensions == self.dimensions:
+            print(f"[ActivityMatcher] Loaded embeddings from cache ({embeddings.shape[1]} dims)")
+            return normalize_embeddings(embeddings)
 
-        embeddings_array = np.array(all_embeddings, dtype=np.float32)
+        if self.dimensions and embeddings.shape[1] > self.dimensions:
+            print(f"[ActivityMatcher] Truncating cached embeddings {embeddings.shape[1]} -> {self.dimensions} dims")
+            return truncate_embeddings(embeddings, self.dimensions)
 
-        # Save to cache
-        try:
-            EMBEDDINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
-            with open(EMBEDDINGS_FILE, 'wb') as f:
-                pickle.dump({
-                    'activities': self.activities,
-                    'embeddings': embeddings_array,
-                    'model': OPENAI_EMBEDDING_MODEL,
-                }, f)
-            print(f"[ActivityMatcher] Saved embeddings to cache")
-        except Exception as e:
-            print(f"[ActivityMatcher] Failed to save cache: {e}")
-
-        return embeddings_array
+        return None
+
+    def _get_query_embedding(self, query: str) -> Optional[np.ndarray]:
+        """Embed a query (same output size as the index), with caching."""
+        cache_key = (OPENAI_EMBEDDING_MODEL, self.dimensions, " ".join(normalize_text(query).split()))
+
+        def embed() -> Optional[np.ndarray]:
+            query_embedding = get_openai_embedding(query, dimensions=self.dimensions)
+            return np.array(query_embedding, dtype=np.float32) if query_embedding else None
+
+        return _query_embedding_cache.get_or_compute_sync(cache_key, embed)
+
+    def prefetch_query_embedding(self, query: str) -> bool:
+        """Embed a query ahead of find_similar_activities (fills the query cache)."""
+        if self.embeddings is None:
+            return False
+        return self._get_query_embedding(query) is not None
 
     def find_similar_activities(
         self,
@@ -218,17 +385,21 @@ class ActivityMatcher:
         if self.embeddings is None:
             return []
 
-        # Get query embedding
-        query_embedding = get_openai_embedding(query)
-        if not query_embedding:
+        cache_key = (OPENAI_EMBEDDING_MODEL, self.dimensions, " ".join(normalize_text(query).split()), top_k, threshold)
+        cached = _activity_match_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        query_vec = self._get_query_embedding(query)
+        if query_vec is None:
             return []
 
-        query_vec = np.array(query_embedding, dtype=np.float32)
+        if query_vec.shape[0] != self.embeddings.shape[1]:
+            print(f"[ActivityMatcher] Query embedding has {query_vec.shape[0]} dims, index has {self.embeddings.shape[1]}")
+            return []
 
-        # Cosine similarity
-        query_norm = query_vec / np.linalg.norm(query_vec)
-        embeddings_norm = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
-        similarities = np.dot(embeddings_norm, query_norm)
+        # Cosine similarity (index rows are normalized at load time)
+        similarities = np.dot(self.embeddings, normalize_embeddings(query_vec))
 
         # Get top-k indices
         top_indices = np.argsort(similarities)[::-1][:top_k]
@@ -241,7 +412,8 @@ class ActivityMatcher:
                 naf_codes = self._get_naf_codes(activity)
                 results.append((activity, similarity, naf_codes))
 
-        return results
+        _activity_match_cache.set(cache_key, results)
+        return list(results)
 
     def get_naf_codes_for_query(
         self,
@@ -268,15 +440,67 @@ class ActivityMatcher:
 # ============================================================================
 
 _activity_matcher: Optional[ActivityMatcher] = None
+_activity_matcher_init: Optional["asyncio.Task[None]"] = None
+_activity_matcher_first_attempt: Optional["asyncio.Future[bool]"] = None
 
 
-async def get_activity_matcher() -> ActivityMatcher:
-    """Get or create the singleton ActivityMatcher instance."""
-    global _activity_matcher
+async def _initialize_with_retry(matcher: ActivityMatcher, first_attempt: "asyncio.Future[bool]") -> None:
+    """Initialize until it succeeds, with exponential backoff between attempts."""
+    delay = ACTIVITY_MATCHER_RETRY_DELAY
+    try:
+        while True:
+            try:
+                ok = await matcher.initialize_async()
+            except Exception as e:
+                print(f"[ActivityMatcher] Initialization failed: {e}")
+                ok = False
+            if not first_attempt.done():
+                first_attempt.set_result(ok)
+            if ok:
+                return
+            print(f"[ActivityMatcher] Not ready, retrying initialization in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, ACTIVITY_MATCHER_RETRY_MAX_DELAY)
+    finally:
+        if not first_attempt.done():
+            first_attempt.set_result(False)
+
+
+def start_activity_matcher_initialization() -> "asyncio.Future[bool]":
+    """
+    Start the background initialization of the singleton (once).
+
+    Returns the outcome of the first attempt. A failed initialization is
+    retried by the same task with backoff (an interrupted embedding build
+    resumes from its checkpoint): requests never start one themselves.
+    """
+    global _activity_matcher, _activity_matcher_init, _activity_matcher_first_attempt
 
     if _activity_matcher is None:
         _activity_matcher = ActivityMatcher()
-        _activity_matcher.initialize()
+
+    if _activity_matcher_init is None:
+        loop = asyncio.get_running_loop()
+        _activity_matcher_first_attempt = loop.create_future()
+        _activity_matcher_init = loop.create_task(
+            _initialize_with_retry(_activity_matcher, _activity_matcher_first_attempt),
+            name="activity-matcher-init",
+        )
+
+    return _activity_matcher_first_attempt
+
+
+async def get_activity_matcher() -> ActivityMatcher:
+    """
+    Get or create the singleton ActivityMatcher instance.
+
+    Only waits for the first initialization attempt. While a failed
+    initialization is retried in the background, the matcher is returned
+    at once, uninitialized: it finds no activities and callers degrade.
+    """
+    if _activity_matcher is None or not _activity_matcher._initialized:
+        # Shield so a cancelled caller does not abort the shared initialization
+        await asyncio.shield(start_activity_matcher_initialization())
 
     return _activity_matcher
 
@@ -297,8 +521,6 @@ def get_activity_matcher_sync() -> ActivityMatcher:
 # ============================================================================
 
 if __name__ == "__main__":
-    import asyncio
-
     async def test():
         print("Testing ActivityMatcher...")
 
@@ -8,11 +8,31 @@ Flow:
 4. If count <= 500: deliver results
 """
 
+import asyncio
+import copy
+import hashlib
 import json
 import os
-import requests
-from typing import List, Dict, Any, Optional, Protocol, AsyncGenerator
-from dataclasses import dataclass
+import time
+from typing import List, Dict, Any, Callable, Optional, Protocol, AsyncGenerator, Tuple, TYPE_CHECKING
+from dataclasses import dataclass, asdict, field, replace
+
+from services.cache import TieredCache
+from services.context_compactor import (
+    compact_criteria, compact_history, compact_json, count_user_turns, record_prompt_tokens
+)
+from services.extraction_schema import (
+    EMPTY_EXTRACTION, EXTRACTION_OUTPUT_MODE, PartialExtraction, expand_compact
+)
+from services.incremental import IncrementalPlan, get_field
+from services.incremental_json import IncrementalJSONParser
+from services.llm_client import get_llm_client
+from services.metrics import metrics
+from services.response_templates import build_template_response
+from services.singleflight import SingleFlight, request_key
+
+if TYPE_CHECKING:
+    from services.company_api_client import APIResponse
 
 
 class MessageLike(Protocol):
@@ -22,11 +42,33 @@ class MessageLike(Protocol):
     @property
     def content(self) -> str: ...
 
-# OpenRouter configuration
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+# OpenRouter configuration (HTTP client in services.llm_client)
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-2.5-flash-lite")
 
+# NAF selection cache (shared across conversations)
+NAF_SELECTION_CACHE_SIZE = int(os.getenv("NAF_SELECTION_CACHE_SIZE", "2000"))
+NAF_SELECTION_CACHE_TTL = int(os.getenv("NAF_SELECTION_CACHE_TTL", "86400"))
+
+# Extraction cache (identical conversations skip the extraction LLM call)
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "5000"))
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", "86400"))
+
+# Identical in-flight LLM calls and extractions are coalesced (services.singleflight)
+_llm_flights = SingleFlight("llm")
+_extraction_flights = SingleFlight("extraction")
+
+# Streaming extraction: location matching and the activity embedding start
+# as soon as their fields are complete, while the rest of the JSON streams
+EXTRACTION_STREAMING = os.getenv("EXTRACTION_STREAMING", "true").lower() == "true"
+
+# Speculative count: the company count starts with the top embedding matches'
+# NAF codes while the NAF selection runs, and is kept if the selection agrees
+SPECULATIVE_COUNT_ENABLED = os.getenv("SPECULATIVE_COUNT_ENABLED", "true").lower() == "true"
+# "top1" (codes of the best match) or "union" (codes of the SPECULATIVE_COUNT_TOP_K best)
+SPECULATIVE_COUNT_STRATEGY = os.getenv("SPECULATIVE_COUNT_STRATEGY", "top1").lower()
+SPECULATIVE_COUNT_TOP_K = int(os.getenv("SPECULATIVE_COUNT_TOP_K", "2"))
+
 
 @dataclass
 class ActivityMatch:
@@ -59,13 +101,68 @@ class AgentResponse:
     naf_codes: Optional[List[str]] = None  # Matched NAF codes from activity matcher
     activity_matches: Optional[List[ActivityMatch]] = None  # Activity matches with scores
     location_corrections: Optional[List[LocationCorrectionInfo]] = None  # Location corrections made
+    extraction_source: Optional[str] = None  # "llm", "cache", "rules" or "classifier" - where the extraction came from
+    skipped_stages: Optional[List[str]] = None  # Pipeline stages reused from the previous turn
+    stage_timings: Optional[Dict[str, int]] = None  # Milliseconds per pipeline stage
+
+
+@dataclass
+class EarlyLookups:
+    """Work started from a partially streamed extraction"""
+    location_input: Optional[Dict[str, Any]] = None  # localisation the early match ran on
+    location_task: Optional["asyncio.Task"] = None  # -> (extraction, corrections)
+    embedding_task: Optional["asyncio.Task"] = None
+
+
+@dataclass
+class SpeculativeCount:
+    """A company count started before the NAF selection finished"""
+    api_request: Dict[str, Any]
+    task: "asyncio.Task"  # -> APIResponse
+    started_at: float  # time.perf_counter()
+    selection_done_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def _on_done(self, task: "asyncio.Task") -> None:
+        self.finished_at = time.perf_counter()
+        # Errors of a discarded speculation are not reported
+        if not task.cancelled():
+            task.exception()
+
+
+@dataclass
+class SearchResult:
+    """Output of the activity matching, API request and count stages"""
+    activity_matches: List[ActivityMatch] = field(default_factory=list)
+    naf_codes: List[str] = field(default_factory=list)
+    original_activity_text: Optional[str] = None  # Activity text for the API semantic search
+    company_count: Optional[int] = None
+    count_semantic: Optional[int] = None
+    api_result: Optional[Dict[str, Any]] = None
+    api_error: Optional[Exception] = None  # CompanyAPIError if the count failed
+
+
+def _selected_naf_codes(activity_matches: List[ActivityMatch]) -> List[str]:
+    """NAF codes of the selected matches, in order, without duplicates."""
+    naf_codes: List[str] = []
+    for match in activity_matches:
+        if match.selected:
+            for code in match.naf_codes:
+                if code not in naf_codes:
+                    naf_codes.append(code)
+    return naf_codes
 
 
 # ============================================================================
 # Combined Agent Prompt - Decision + Extraction in ONE call
 # ============================================================================
 
-AGENT_SYSTEM_PROMPT = """Tu es un agent intelligent pour rechercher des entreprises françaises.
+# Bump when the extraction prompt or the post-processing of its output
+# (location matching, size transform) changes: cached extractions are keyed
+# on it. The prompt text is also fingerprinted as a safety net.
+AGENT_PROMPT_VERSION = "2"
+
+_AGENT_PROMPT_HEAD = """Tu es un agent intelligent pour rechercher des entreprises françaises.
 
 MISSION
 -------
@@ -85,7 +182,9 @@ REQUÊTES TROP VAGUES (à rejeter)
 - "je cherche une entreprise" (sans aucun critère)
 - Questions hors-sujet (météo, recettes, etc.)
 
-FORMAT DE SORTIE JSON
+"""
+
+_FULL_OUTPUT_FORMAT = """FORMAT DE SORTIE JSON
 ---------------------
 Si la requête contient AU MOINS UN critère exploitable :
 {
@@ -129,7 +228,29 @@ Si la requête est TROP VAGUE (aucun critère) :
   "message": "Réponse conversationnelle et naturelle au message de l'utilisateur, en le guidant vers une recherche"
 }
 
-RÈGLES D'EXTRACTION
+"""
+
+# EXTRACTION_OUTPUT_MODE=compact: short keys, present fields only (see services.extraction_schema)
+_COMPACT_OUTPUT_FORMAT = """FORMAT DE SORTIE JSON
+---------------------
+Réponds avec un objet JSON sur une seule ligne, en n'écrivant QUE les champs trouvés (jamais de null).
+
+Si la requête contient AU MOINS UN critère exploitable : {"a": "x", ...champs trouvés}
+Clés (nom complet entre parenthèses, les règles ci-dessous s'appliquent) :
+- Localisation : cp (code_postal), dep (departement), reg (region), com (commune)
+- Activité : act (activite_entreprise), kw (mots_cles)
+- Taille : eff (effectif_expression)
+- Financier (nombres) : ca (ca_plus_recent), rn (resultat_net_plus_recent), rent (rentabilite_plus_recente)
+- Juridique : forme (categorie_juridique), siege (siege_entreprise), cmin (date_creation_entreprise_min), cmax (date_creation_entreprise_max), cap (capital), etab (nombre_etablissements)
+
+Exemple : "PME de restauration en Bretagne" → {"a":"x","reg":"Bretagne","act":"Restauration","kw":"restauration restaurant","eff":"PME"}
+
+Si la requête est TROP VAGUE (aucun critère) :
+{"a": "r", "msg": "Réponse conversationnelle et naturelle au message de l'utilisateur, en le guidant vers une recherche"}
+
+"""
+
+_AGENT_PROMPT_RULES = """RÈGLES D'EXTRACTION
 -------------------
 - activite_entreprise : le nom du secteur d'activité correspondant le plus à la requête de l'utilisateur.
 - mots_cles : mots-clés optimisés pour la recherche sémantique dans une base de codes NAF.
@@ -168,18 +289,27 @@ Correspondances acronymes :
 Réponds UNIQUEMENT avec le JSON, sans texte autour.
 """
 
+AGENT_SYSTEM_PROMPT = _AGENT_PROMPT_HEAD + _FULL_OUTPUT_FORMAT + _AGENT_PROMPT_RULES
+AGENT_SYSTEM_PROMPT_COMPACT = _AGENT_PROMPT_HEAD + _COMPACT_OUTPUT_FORMAT + _AGENT_PROMPT_RULES
+
+AGENT_SYSTEM_PROMPTS = {"full": AGENT_SYSTEM_PROMPT, "compact": AGENT_SYSTEM_PROMPT_COMPACT}
+_AGENT_PROMPT_FINGERPRINTS = {
+    mode: hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    for mode, prompt in AGENT_SYSTEM_PROMPTS.items()
+}
+
 
 # ============================================================================
 # NAF Code Selection Prompt
 # ============================================================================
 
-NAF_SELECTION_PROMPT = """Tu es un assistant qui aide à sélectionner le code NAF le plus pertinent.
-
-L'utilisateur recherche des entreprises dans le secteur: "{activity_query}"
+# Static instructions only: per-request data goes in the trailing user message
+# (NAF_SELECTION_CONTEXT, RESPONSE_CONTEXT) so the system prompt stays a
+# byte-identical prefix that the provider can cache across requests.
 
-Voici les correspondances trouvées dans notre base de données (triées par similarité):
+NAF_SELECTION_PROMPT = """Tu es un assistant qui aide à sélectionner le code NAF le plus pertinent.
 
-{matches_text}
+Le message de l'utilisateur contient le secteur recherché et les correspondances trouvées dans notre base de données (triées par similarité).
 
 INSTRUCTIONS:
 1. Analyse la demande de l'utilisateur
@@ -187,34 +317,45 @@ INSTRUCTIONS:
 3. Si aucune option ne correspond bien, indique-le
 
 FORMAT DE RÉPONSE JSON:
-{{
+{
   "selected_indices": [0],  // Indices des activités sélectionnées (0, 1, 2...)
   "explanation": "Explication courte du choix",
   "no_good_match": false  // true si aucune option ne correspond vraiment
-}}
+}
 
 Réponds UNIQUEMENT avec le JSON.
 """
 
+NAF_SELECTION_CONTEXT = """L'utilisateur recherche des entreprises dans le secteur: "{activity_query}"
+
+Voici les correspondances trouvées dans notre base de données (triées par similarité):
+
+{matches_text}"""
+
 
 # ============================================================================
-# Response Generation Prompt
+# Caches
 # ============================================================================
 
-RESPONSE_GENERATION_PROMPT = """Tu es un assistant de recherche d'entreprises françaises. Génère une réponse utile et naturelle.
+# Versioned by model and prompt: snapshots taken with another version are
+# discarded on restore (services.cache_snapshot)
+_naf_selection_cache = TieredCache(
+    "naf_selection", NAF_SELECTION_CACHE_SIZE, NAF_SELECTION_CACHE_TTL,
+    version=f"{OPENROUTER_MODEL}:{hashlib.sha256(NAF_SELECTION_PROMPT.encode('utf-8')).hexdigest()[:12]}",
+)
+_extraction_cache = TieredCache(
+    "extraction", EXTRACTION_CACHE_SIZE, EXTRACTION_CACHE_TTL,
+    version=f"{OPENROUTER_MODEL}:{AGENT_PROMPT_VERSION}:{_AGENT_PROMPT_FINGERPRINTS[EXTRACTION_OUTPUT_MODE]}",
+)
 
-CONTEXTE DE LA RECHERCHE:
-- Requête utilisateur: "{user_query}"
-- Nombre d'entreprises trouvées: {company_count}
 
-CRITÈRES EXTRAITS:
-{extraction_summary}
+# ============================================================================
+# Response Generation Prompt
+# ============================================================================
 
-CORRESPONDANCES D'ACTIVITÉ:
-{activity_matches_summary}
+RESPONSE_GENERATION_PROMPT = """Tu es un assistant de recherche d'entreprises françaises. Génère une réponse utile et naturelle.
 
-CORRECTIONS DE LOCALISATION:
-{location_corrections}
+Le contexte de la recherche (requête, nombre d'entreprises trouvées, critères extraits, correspondances d'activité, corrections de localisation et historique) est fourni dans les messages de l'utilisateur.
 
 INSTRUCTIONS:
 1. Si count > 1000: Suggère des critères pour affiner (taille, CA, localisation plus précise...)
@@ -231,58 +372,46 @@ CRITÈRES DISPONIBLES POUR AFFINER:
 
 Réponds directement avec le message (pas de JSON), en français."""
 
+RESPONSE_CONTEXT = """CONTEXTE DE LA RECHERCHE:
+- Requête utilisateur: "{user_query}"
+- Nombre d'entreprises trouvées: {company_count}
+
+CRITÈRES EXTRAITS:
+{extraction_summary}
+
+CORRESPONDANCES D'ACTIVITÉ:
+{activity_matches_summary}
+
+CORRECTIONS DE LOCALISATION:
+{location_corrections}"""
+
 
 class AgentService:
     """Service for conversational AI agent logic - Simplified version"""
 
     @staticmethod
-    def _call_llm(messages: List[Dict[str, str]], temperature: float = 0.0) -> str:
+    async def _call_llm(
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        call_type: str = "other"
+    ) -> str:
         """
-        Call OpenRouter LLM.
+        Call OpenRouter LLM in JSON mode through the shared async client.
 
         Args:
             messages: List of message dicts with role and content
             temperature: Temperature for generation
+            call_type: Label for metrics ("extraction", "naf_selection"...)
 
         Returns:
             str: LLM response content
         """
-        if not OPENROUTER_API_KEY:
-            raise ValueError("OPENROUTER_API_KEY not set")
-
-        payload: Dict[str, Any] = {
-            "model": OPENROUTER_MODEL,
-            "messages": messages,
-            "temperature": temperature,
-            "response_format": {"type": "json_object"},
-        }
-
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-
-        response = requests.post(
-            url=OPENROUTER_API_URL,
-            headers=headers,
-            data=json.dumps(payload),
-            timeout=60,
-        )
-
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
-
-    @staticmethod
-    def _format_conversation(messages: List[MessageLike]) -> str:
-        """Format conversation history for context."""
-        lines = []
-        for msg in messages:
-            # Handle both enum (msg.role.value) and string (msg.role) formats
-            role_value = msg.role.value if hasattr(msg.role, 'value') else msg.role
-            role_label = "Utilisateur" if role_value == "user" else "Agent"
-            lines.append(f"{role_label}: {msg.content}")
-        return "\n".join(lines)
+        client = get_llm_client()
+        # Identical concurrent calls (same query from many users) share one request
+        key = request_key(call_type, client.model, temperature, messages)
+        return await _llm_flights.do(key, lambda: client.chat(
+            messages, temperature=temperature, json_mode=True, call_type=call_type
+        ))
 
     @staticmethod
     def _clean_json(content: str) -> str:
@@ -306,10 +435,71 @@ class AgentService:
 
         return cleaned
 
+    @staticmethod
+    def _extraction_cache_key(
+        messages: List[MessageLike],
+        previous_extraction: Optional[Dict[str, Any]]
+    ) -> str:
+        """
+        Canonical hash of (model, prompt version, normalized conversation, previous_extraction).
+
+        Messages are compared without case, accents, trailing punctuation and
+        extra whitespace, so near-identical queries share an entry.
+        """
+        from services.activity_matcher import normalize_text
+
+        conversation = []
+        for msg in messages:
+            role_value = msg.role.value if hasattr(msg.role, 'value') else msg.role
+            content = " ".join(normalize_text(msg.content).split()).rstrip(" .!?")
+            conversation.append([role_value, content])
+
+        canonical = json.dumps(
+            {
+                "model": OPENROUTER_MODEL,
+                "prompt_version": AGENT_PROMPT_VERSION,
+                "output_mode": EXTRACTION_OUTPUT_MODE,
+                "prompt": _AGENT_PROMPT_FINGERPRINTS[EXTRACTION_OUTPUT_MODE],
+                "conversation": conversation,
+                "previous_extraction": previous_extraction,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _to_cache_entry(response: AgentResponse) -> Dict[str, Any]:
+        """JSON-serializable form of an extraction response (shared tier compatible)."""
+        return {
+            "action": response.action,
+            "message": response.message,
+            "extraction_result": response.extraction_result,
+            "location_corrections": [asdict(c) for c in response.location_corrections]
+            if response.location_corrections else None,
+            "skipped_stages": response.skipped_stages,
+        }
+
+    @staticmethod
+    def _from_cache_entry(entry: Dict[str, Any]) -> AgentResponse:
+        """Rebuild a response from a cache entry (deep copy: callers may mutate it)."""
+        entry = copy.deepcopy(entry)
+        corrections = entry.get("location_corrections")
+        return AgentResponse(
+            action=entry["action"],
+            message=entry["message"],
+            extraction_result=entry.get("extraction_result"),
+            location_corrections=[LocationCorrectionInfo(**c) for c in corrections] if corrections else None,
+            extraction_source="cache",
+            skipped_stages=entry.get("skipped_stages"),
+        )
+
     @staticmethod
     async def process_message(
         messages: List[MessageLike],
-        previous_extraction: Optional[Dict[str, Any]] = None
+        previous_extraction: Optional[Dict[str, Any]] = None,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None
     ) -> AgentResponse:
         """
         Process user message(s) and extract search criteria.
@@ -318,25 +508,145 @@ class AgentService:
         1. Analyzes the conversation
         2. Extracts criteria OR rejects if too vague
 
+        Identical conversations (same previous extraction) are answered from
+        the extraction cache, simple first-turn queries by the rule-based
+        extractor and clearly vague ones by the vague classifier, without
+        calling the LLM.
+
         Args:
             messages: Conversation history
             previous_extraction: Previous extraction result for context
+            on_partial: Called with the criteria sections completed so far
+                while the extraction LLM output streams (LLM path only)
 
         Returns:
             AgentResponse: Action (extract/reject) with result or message
         """
+        start = time.perf_counter()
+        cache_key = None
+        if EXTRACTION_CACHE_ENABLED:
+            cache_key = AgentService._extraction_cache_key(messages, previous_extraction)
+            entry = await _extraction_cache.get(cache_key)
+            if entry is not None:
+                response = AgentService._from_cache_entry(entry)
+                metrics.increment("extraction.source.cache")
+                metrics.observe("extraction.cache.latency", time.perf_counter() - start)
+                return response
+
+        # Deterministic fast paths for first-turn queries (rules, then vague classifier)
+        if len(messages) == 1 and not previous_extraction:
+            response = AgentService._answer_first_turn(messages[0].content)
+            if response is not None:
+                metrics.increment(f"extraction.source.{response.extraction_source}")
+                metrics.observe(f"extraction.{response.extraction_source}.latency", time.perf_counter() - start)
+                return response
+
+        async def extract() -> Dict[str, Any]:
+            response = await AgentService._extract_with_llm(messages, previous_extraction, on_partial=on_partial)
+            return AgentService._to_cache_entry(response)
+
+        try:
+            # Identical conversations in flight share one extraction, across
+            # replicas through the shared tier (partial criteria are only
+            # reported to the caller that computes it)
+            if cache_key is not None:
+                entry = await _extraction_cache.get_or_compute(cache_key, extract)
+            else:
+                flight_key = AgentService._extraction_cache_key(messages, previous_extraction)
+                entry = await _extraction_flights.do(flight_key, extract)
+            # The caller owns the returned result, the cache keeps its own copy
+            response = replace(AgentService._from_cache_entry(entry), extraction_source="llm")
+        except Exception as e:
+            print(f"Agent processing failed: {e}")
+            metrics.increment("extraction.errors")
+            # Fallback: reject (not cached)
+            return AgentResponse(
+                action="reject",
+                message="Pouvez-vous préciser votre recherche ? (secteur d'activité, localisation, taille...)",
+                extraction_result=None,
+            )
+
+        metrics.increment("extraction.source.llm")
+        metrics.observe("extraction.llm.latency", time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def _answer_first_turn(query: str) -> Optional[AgentResponse]:
+        """
+        Answer a first message without the LLM when possible.
+
+        Simple queries are extracted by the rule-based extractor; clearly vague
+        ones (greetings, help, off-topic) are rejected with a template message.
+        Returns None when the LLM is needed.
+        """
+        from services.rule_extractor import (
+            RULE_EXTRACTOR_ENABLED, RULE_EXTRACTOR_MIN_CONFIDENCE, get_rule_extractor
+        )
+        from services.vague_classifier import VAGUE_CLASSIFIER_ENABLED, get_vague_classifier
+
+        rules = None
+        if RULE_EXTRACTOR_ENABLED or VAGUE_CLASSIFIER_ENABLED:
+            rules = get_rule_extractor().extract(query)
+
+        if RULE_EXTRACTOR_ENABLED:
+            if rules.extraction_result is not None and rules.confidence >= RULE_EXTRACTOR_MIN_CONFIDENCE:
+                return AgentResponse(
+                    action="extract",
+                    message="Recherche en cours...",
+                    extraction_result=rules.extraction_result,
+                    extraction_source="rules",
+                )
+            metrics.increment("extraction.rules.fallback")
+
+        if VAGUE_CLASSIFIER_ENABLED:
+            verdict = get_vague_classifier().classify(query, rules)
+            if verdict.is_vague:
+                return AgentResponse(
+                    action="reject",
+                    message=verdict.message,
+                    extraction_result=None,
+                    extraction_source="classifier",
+                )
+            metrics.increment("extraction.classifier.fallback")
+
+        return None
+
+    @staticmethod
+    async def _extract_with_llm(
+        messages: List[MessageLike],
+        previous_extraction: Optional[Dict[str, Any]],
+        output_mode: Optional[str] = None,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> AgentResponse:
+        """
+        Run the extraction LLM call and post-process its output.
+
+        Args:
+            messages: Conversation history
+            previous_extraction: Criteria of the previous turn
+            output_mode: "full" or "compact" (default EXTRACTION_OUTPUT_MODE)
+            on_partial: Partial criteria callback (streaming only)
+
+        Raises:
+            Exception: On LLM or JSON errors (process_message falls back to reject)
+        """
+        output_mode = output_mode or EXTRACTION_OUTPUT_MODE
+
         # Build conversation context
         if len(messages) == 1 and not previous_extraction:
             user_content = messages[0].content
         else:
-            # Multi-turn: include conversation history and previous extraction
-            conversation_text = AgentService._format_conversation(messages)
+            # Multi-turn: older turns are only dropped when the previous
+            # criteria carry what they established, else the full history is sent
+            history = compact_history(
+                messages, keep_turns=None if previous_extraction else 0, label="extraction"
+            )
 
             # Build context with previous extraction if available
-            context_parts = [f"CONVERSATION:\n{conversation_text}"]
+            context_parts = [f"CONVERSATION:\n{history.text}"]
 
             if previous_extraction:
-                context_parts.append(f"\nCRITÈRES ACTUELS (à conserver ou modifier selon le message):\n{json.dumps(previous_extraction, ensure_ascii=False, indent=2)}")
+                context_parts.append(f"\nCRITÈRES ACTUELS (à conserver ou modifier selon le message):\n{compact_json(compact_criteria(previous_extraction))}")
 
             context_parts.append("\nExtrais les critères de recherche. Si le dernier message ne contient pas de nouveaux critères, conserve les critères actuels.")
 
@@ -344,69 +654,194 @@ class AgentService:
 
         # Single LLM call
         llm_messages = [
-            {"role": "system", "content": AGENT_SYSTEM_PROMPT},
+            {"role": "system", "content": AGENT_SYSTEM_PROMPTS[output_mode]},
             {"role": "user", "content": user_content},
         ]
+        record_prompt_tokens("extraction", llm_messages, count_user_turns(messages))
 
-        try:
-            response = AgentService._call_llm(llm_messages)
-            data = json.loads(AgentService._clean_json(response))
+        early = None
+        if EXTRACTION_STREAMING:
+            response, early = await AgentService._stream_extraction(
+                llm_messages, output_mode, previous_extraction, on_partial
+            )
+        else:
+            response = await AgentService._call_llm(llm_messages, call_type="extraction")
+        data = json.loads(AgentService._clean_json(response))
+        if output_mode == "compact":
+            data = expand_compact(data)
 
-            action = data.get("action", "reject")
+        action = data.get("action", "reject")
 
-            if action == "extract":
-                # Build extraction result (remove "action" key)
-                extraction = {k: v for k, v in data.items() if k != "action"}
+        if action == "extract":
+            # Build extraction result (remove "action" key)
+            extraction = {k: v for k, v in data.items() if k != "action"}
 
-                # Apply fuzzy matching to location fields
-                from services.location_matcher import get_location_matcher
-                location_matcher = get_location_matcher()
-                extraction, loc_corrections = location_matcher.match_locations(extraction)
+            # Fields copied unchanged from the previous criteria are already post-processed
+            plan = IncrementalPlan(
+                previous_extraction, extraction, reusable=("location_match", "size_transform")
+            )
+
+            # Apply fuzzy matching to location fields
+            loc_corrections = []
+            if plan.should_run("location_match"):
+                early_match = await AgentService._early_location_match(early, extraction)
+                if early_match is not None:
+                    extraction["localisation"] = early_match[0]["localisation"]
+                    loc_corrections = early_match[1]
+                else:
+                    from services.location_matcher import get_location_matcher
+                    location_matcher = get_location_matcher()
+                    extraction, loc_corrections = location_matcher.match_locations(extraction)
 
-                # Transform size expressions to INSEE ranges
+            # Transform size expressions to INSEE ranges
+            if plan.should_run("size_transform"):
                 from services.size_matcher import transform_size_field
                 extraction, size_correction = transform_size_field(extraction)
 
-                # Convert location corrections to our format
-                location_corrections = [
-                    LocationCorrectionInfo(
-                        original=c.original_value,
-                        corrected=c.matched_value,
-                        field_changed=c.field_changed,
-                        original_field=c.original_field,
-                        corrected_field=c.matched_field
-                    )
-                    for c in loc_corrections if c.was_corrected
-                ]
-
-                return AgentResponse(
-                    action="extract",
-                    message="Recherche en cours...",
-                    extraction_result=extraction,
-                    location_corrections=location_corrections if location_corrections else None,
-                )
-            else:
-                # Query too vague - rejected
-                message = data.get("message", "Pouvez-vous préciser votre recherche ? (secteur d'activité, localisation, taille...)")
-                return AgentResponse(
-                    action="reject",
-                    message=message,
-                    extraction_result=None,
+            # Convert location corrections to our format
+            location_corrections = [
+                LocationCorrectionInfo(
+                    original=c.original_value,
+                    corrected=c.matched_value,
+                    field_changed=c.field_changed,
+                    original_field=c.original_field,
+                    corrected_field=c.matched_field
                 )
+                for c in loc_corrections if c.was_corrected
+            ]
 
-        except Exception as e:
-            print(f"Agent processing failed: {e}")
-            # Fallback: reject
+            # The activity matcher reads the embedding from the query cache
+            if early is not None and early.embedding_task is not None:
+                await early.embedding_task
+
+            return AgentResponse(
+                action="extract",
+                message="Recherche en cours...",
+                extraction_result=extraction,
+                location_corrections=location_corrections if location_corrections else None,
+                extraction_source="llm",
+                skipped_stages=plan.skipped or None,
+            )
+        else:
+            # Query too vague - rejected
+            message = data.get("message", "Pouvez-vous préciser votre recherche ? (secteur d'activité, localisation, taille...)")
             return AgentResponse(
                 action="reject",
-                message="Pouvez-vous préciser votre recherche ? (secteur d'activité, localisation, taille...)",
+                message=message,
                 extraction_result=None,
+                extraction_source="llm",
             )
 
     @staticmethod
-    def _select_naf_codes(activity_query: str, matches: List[tuple]) -> tuple:
+    async def _stream_extraction(
+        llm_messages: List[Dict[str, str]],
+        output_mode: str,
+        previous_extraction: Optional[Dict[str, Any]],
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[str, EarlyLookups]:
+        """
+        Stream the extraction LLM output and start lookups as fields complete.
+
+        Location matching (worker thread) starts when localisation is
+        complete and the activity embedding when mots_cles is, unless they
+        are unchanged from the previous turn (the incremental plan would skip
+        them). The full text is returned for regular decoding.
+        """
+        parser: Optional[IncrementalJSONParser] = IncrementalJSONParser()
+        partial = PartialExtraction(output_mode)
+        early = EarlyLookups()
+        chunks = []
+        start = time.perf_counter()
+
+        async for chunk in get_llm_client().stream_chat(
+            llm_messages, temperature=0.0, call_type="extraction", json_mode=True
+        ):
+            chunks.append(chunk)
+            if parser is None:
+                continue
+            try:
+                events = parser.feed(chunk)
+            except ValueError as e:
+                print(f"[Agent] Streamed extraction is not valid JSON ({e}), waiting for the full output")
+                parser = None
+                continue
+
+            for path, value in events:
+                for name in partial.add(path, value):
+                    if partial.action == "reject":
+                        continue
+                    if name == "localisation":
+                        localisation = partial.sections[name]
+                        if localisation.get("present") and localisation != get_field(previous_extraction, "localisation"):
+                            early.location_input = copy.deepcopy(localisation)
+                            early.location_task = asyncio.create_task(
+                                AgentService._match_locations_async(copy.deepcopy(localisation))
+                            )
+                            metrics.observe("extraction.stream.localisation_at", time.perf_counter() - start)
+                    elif name == "mots_cles":
+                        mots_cles = partial.mots_cles
+                        if mots_cles and mots_cles != get_field(previous_extraction, "activite.mots_cles"):
+                            early.embedding_task = asyncio.create_task(
+                                AgentService._prefetch_activity_embedding(mots_cles)
+                            )
+                            metrics.observe("extraction.stream.mots_cles_at", time.perf_counter() - start)
+                    if name in EMPTY_EXTRACTION and partial.sections[name].get("present") and on_partial is not None:
+                        on_partial(copy.deepcopy(partial.criteria))
+
+        return "".join(chunks), early
+
+    @staticmethod
+    async def _match_locations_async(localisation: Dict[str, Any]) -> tuple:
+        from services.location_matcher import get_location_matcher
+        location_matcher = get_location_matcher()
+        return await asyncio.to_thread(location_matcher.match_locations, {"localisation": localisation})
+
+    @staticmethod
+    async def _prefetch_activity_embedding(mots_cles: str) -> None:
+        """Embed mots_cles while the extraction streams (errors only logged)."""
+        from services.activity_matcher import get_activity_matcher
+        try:
+            activity_matcher = await get_activity_matcher()
+            await asyncio.to_thread(activity_matcher.prefetch_query_embedding, mots_cles)
+        except Exception as e:
+            print(f"[Agent] Activity embedding prefetch failed: {e}")
+
+    @staticmethod
+    async def _early_location_match(
+        early: Optional[EarlyLookups],
+        extraction: Dict[str, Any]
+    ) -> Optional[tuple]:
+        """Result of the early location match if it ran on the final localisation."""
+        if early is None or early.location_task is None:
+            return None
+        final = {**EMPTY_EXTRACTION["localisation"], **(extraction.get("localisation") or {})}
+        if final != early.location_input:
+            metrics.increment("extraction.stream.early_location.discarded")
+            return None
+        try:
+            result = await early.location_task
+        except Exception as e:
+            print(f"[Agent] Early location matching failed: {e}")
+            return None
+        metrics.increment("extraction.stream.early_location.used")
+        return result
+
+    @staticmethod
+    def _naf_selection_cache_key(activity_query: str, matches: List[tuple]) -> tuple:
+        """Cache key: (normalized mots_cles, ordered candidate activities, model)."""
+        from services.activity_matcher import normalize_text
+
+        normalized_query = " ".join(normalize_text(activity_query).split())
+        candidates = tuple(activity for activity, _, _ in matches)
+        return normalized_query, candidates, OPENROUTER_MODEL
+
+    @staticmethod
+    async def _select_naf_codes(activity_query: str, matches: List[tuple]) -> tuple:
         """
-        Use LLM to select the best NAF codes from activity matches.
+        Select the best NAF codes from activity matches.
+
+        Confident cases (high top score, clear gap, lexical overlap) pick the
+        top match without an LLM call; ambiguous ones ask the LLM.
 
         Args:
             activity_query: User's activity search term
@@ -415,9 +850,27 @@ class AgentService:
         Returns:
             Tuple of (selected_indices, explanation, no_good_match)
         """
+        from services.naf_selector import assess_confidence, record_decision, should_audit
+
         if not matches:
             return [], "Aucune correspondance trouvée", True
 
+        cache_key = AgentService._naf_selection_cache_key(activity_query, matches)
+        cached = await _naf_selection_cache.get(cache_key)
+        if cached is not None:
+            selected_indices, explanation, no_good_match = cached
+            return list(selected_indices), explanation, no_good_match
+
+        confidence = assess_confidence(activity_query, matches)
+        audit = confidence.confident and should_audit()
+        if confidence.confident and not audit:
+            record_decision(activity_query, matches, confidence, "auto", [0])
+            explanation = (
+                f"Sélection automatique (score {confidence.top_score:.2f}, "
+                f"écart {confidence.gap:.2f})"
+            )
+            return [0], explanation, False
+
         # Format matches for LLM
         matches_lines = []
         for i, (activity, score, naf_codes) in enumerate(matches):
@@ -426,64 +879,56 @@ class AgentService:
 
         matches_text = "\n".join(matches_lines)
 
-        prompt = NAF_SELECTION_PROMPT.format(
+        context = NAF_SELECTION_CONTEXT.format(
             activity_query=activity_query,
             matches_text=matches_text
         )
 
-        try:
+        async def ask_llm() -> list:
             llm_messages = [
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": NAF_SELECTION_PROMPT},
+                {"role": "user", "content": context},
             ]
-            response = AgentService._call_llm(llm_messages)
+            response = await AgentService._call_llm(llm_messages, call_type="naf_selection")
             data = json.loads(AgentService._clean_json(response))
 
             selected_indices = data.get("selected_indices", [0])
-            explanation = data.get("explanation", "")
             no_good_match = data.get("no_good_match", False)
+            record_decision(
+                activity_query, matches, confidence, "audit" if audit else "llm",
+                selected_indices, no_good_match
+            )
+            return [selected_indices, data.get("explanation", ""), no_good_match]
 
-            return selected_indices, explanation, no_good_match
+        try:
+            # Other replicas asking for the same selection wait for this one
+            selected_indices, explanation, no_good_match = await _naf_selection_cache.get_or_compute(
+                cache_key, ask_llm
+            )
+            return list(selected_indices), explanation, no_good_match
 
         except Exception as e:
             print(f"[Agent] NAF selection LLM failed: {e}, defaulting to first match")
             return [0], "Sélection par défaut", False
 
     @staticmethod
-    def _call_llm_text(messages: List[Dict[str, str]], temperature: float = 0.7) -> str:
+    async def _call_llm_text(
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        call_type: str = "response"
+    ) -> str:
         """
         Call OpenRouter LLM for free-text response (not JSON).
 
         Args:
             messages: List of message dicts with role and content
             temperature: Temperature for generation
+            call_type: Label for metrics
 
         Returns:
             str: LLM response content
         """
-        if not OPENROUTER_API_KEY:
-            raise ValueError("OPENROUTER_API_KEY not set")
-
-        payload: Dict[str, Any] = {
-            "model": OPENROUTER_MODEL,
-            "messages": messages,
-            "temperature": temperature,
-        }
-
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-
-        response = requests.post(
-            url=OPENROUTER_API_URL,
-            headers=headers,
-            data=json.dumps(payload),
-            timeout=60,
-        )
-
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+        return await get_llm_client().chat(messages, temperature=temperature, call_type=call_type)
 
     @staticmethod
     async def _call_llm_text_stream(
@@ -493,6 +938,8 @@ class AgentService:
         """
         Call OpenRouter LLM for free-text response with streaming.
 
+        Uses the shared, app-lifespan connection pool.
+
         Args:
             messages: List of message dicts with role and content
             temperature: Temperature for generation
@@ -500,86 +947,23 @@ class AgentService:
         Yields:
             str: Chunks of LLM response content
         """
-        import httpx
-
-        if not OPENROUTER_API_KEY:
-            raise ValueError("OPENROUTER_API_KEY not set")
-
-        payload: Dict[str, Any] = {
-            "model": OPENROUTER_MODEL,
-            "messages": messages,
-            "temperature": temperature,
-            "stream": True,
-        }
-
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            async with client.stream(
-                "POST",
-                OPENROUTER_API_URL,
-                headers=headers,
-                json=payload,
-            ) as response:
-                response.raise_for_status()
-
-                buffer = ""
-                async for chunk in response.aiter_text():
-                    if chunk:
-                        buffer += chunk
-                        while True:
-                            line_end = buffer.find('\n')
-                            if line_end == -1:
-                                break
-
-                            line = buffer[:line_end].strip()
-                            buffer = buffer[line_end + 1:]
-
-                            # Skip empty lines and comments (OpenRouter sends these)
-                            if not line or line.startswith(':'):
-                                continue
-
-                            if line.startswith('data: '):
-                                data = line[6:]
-                                if data == '[DONE]':
-                                    return
-
-                                try:
-                                    data_obj = json.loads(data)
-                                    # Check for errors
-                                    if 'error' in data_obj:
-                                        raise Exception(f"Stream error: {data_obj['error'].get('message', 'Unknown error')}")
-                                    content = data_obj.get("choices", [{}])[0].get("delta", {}).get("content")
-                                    if content:
-                                        yield content
-                                except json.JSONDecodeError:
-                                    pass  # Skip malformed lines
+        async for content in get_llm_client().stream_chat(messages, temperature=temperature):
+            yield content
 
     @staticmethod
-    def _generate_contextual_response(
+    def _build_response_messages(
         user_query: str,
         company_count: int,
         extraction_result: Dict[str, Any],
         activity_matches: List[ActivityMatch],
         location_corrections: Optional[List[LocationCorrectionInfo]] = None,
         conversation_history: Optional[str] = None
-    ) -> str:
+    ) -> List[Dict[str, str]]:
         """
-        Generate a contextual response message using LLM.
-
-        Args:
-            user_query: The user's original query
-            company_count: Number of companies found
-            extraction_result: Extracted criteria
-            activity_matches: Activity matches with scores
-            location_corrections: Location corrections made (if any)
-            conversation_history: Full conversation history for context
+        Messages for response generation.
 
-        Returns:
-            str: Contextual response message
+        The static RESPONSE_GENERATION_PROMPT comes first (cacheable prefix),
+        followed by the search context and then the user's query.
         """
         # Build extraction summary
         extraction_lines = []
@@ -657,7 +1041,7 @@ class AgentService:
         if not fin.get("present"):
             missing_fields.append("critères financiers (CA minimum, résultat net)")
 
-        prompt = RESPONSE_GENERATION_PROMPT.format(
+        context = RESPONSE_CONTEXT.format(
             user_query=user_query,
             company_count=company_count,
             extraction_summary=extraction_summary,
@@ -667,31 +1051,57 @@ class AgentService:
 
         # Add missing fields hint
         if missing_fields and company_count > 500:
-            prompt += f"\n\nCRITÈRES NON RENSEIGNÉS (pour affiner):\n- " + "\n- ".join(missing_fields)
+            context += f"\n\nCRITÈRES NON RENSEIGNÉS (pour affiner):\n- " + "\n- ".join(missing_fields)
 
         # Add conversation history if available
         if conversation_history:
-            prompt += f"\n\nHISTORIQUE DE LA CONVERSATION:\n{conversation_history}"
+            context += f"\n\nHISTORIQUE DE LA CONVERSATION:\n{conversation_history}"
+
+        # Send user query as a separate user message for better context
+        return [
+            {"role": "system", "content": RESPONSE_GENERATION_PROMPT},
+            {"role": "user", "content": context},
+            {"role": "user", "content": user_query},
+        ]
+
+    @staticmethod
+    async def _generate_contextual_response(
+        user_query: str,
+        company_count: int,
+        extraction_result: Dict[str, Any],
+        activity_matches: List[ActivityMatch],
+        location_corrections: Optional[List[LocationCorrectionInfo]] = None,
+        conversation_history: Optional[str] = None
+    ) -> str:
+        """
+        Generate a contextual response message using LLM.
+
+        Args:
+            user_query: The user's original query
+            company_count: Number of companies found
+            extraction_result: Extracted criteria
+            activity_matches: Activity matches with scores
+            location_corrections: Location corrections made (if any)
+            conversation_history: Full conversation history for context
+
+        Returns:
+            str: Contextual response message
+        """
+        llm_messages = AgentService._build_response_messages(
+            user_query, company_count, extraction_result, activity_matches,
+            location_corrections, conversation_history
+        )
 
         try:
-            # Send user query as a separate user message for better context
-            llm_messages = [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": user_query},
-            ]
-            response = AgentService._call_llm_text(llm_messages)
+            record_prompt_tokens("response", llm_messages)
+            response = await AgentService._call_llm_text(llm_messages)
             return response.strip()
         except Exception as e:
             print(f"[Agent] Response generation LLM failed: {e}")
-            # Fallback to simple message
-            if company_count == 0:
-                return "Aucune entreprise ne correspond à ces critères. Essayez d'élargir votre recherche."
-            elif company_count <= 100:
-                return f"J'ai trouvé {company_count} entreprises correspondant à vos critères."
-            elif company_count <= 500:
-                return f"J'ai trouvé {company_count} entreprises. Vous pouvez affiner si besoin."
-            else:
-                return f"J'ai trouvé {company_count} entreprises. Affinez vos critères pour réduire ce nombre."
+            # Fallback to the template response
+            return build_template_response(
+                company_count, extraction_result, activity_matches, location_corrections
+            )
 
     @staticmethod
     async def _generate_contextual_response_stream(
@@ -707,116 +1117,122 @@ class AgentService:
 
         Same as _generate_contextual_response but yields chunks for streaming.
         """
-        # Build extraction summary
-        extraction_lines = []
-        loc = extraction_result.get("localisation", {})
-        if loc.get("present"):
-            parts = []
-            if loc.get("region"):
-                parts.append(f"Région: {loc['region']}")
-            if loc.get("departement"):
-                parts.append(f"Département: {loc['departement']}")
-            if loc.get("commune"):
-                parts.append(f"Commune: {loc['commune']}")
-            if loc.get("code_postal"):
-                parts.append(f"Code postal: {loc['code_postal']}")
-            if parts:
-                extraction_lines.append(f"- Localisation: {', '.join(parts)}")
-
-        act = extraction_result.get("activite", {})
-        if act.get("present") and act.get("activite_entreprise"):
-            extraction_lines.append(f"- Activité: {act['activite_entreprise']}")
-
-        taille = extraction_result.get("taille_entreprise", {})
-        if taille.get("present"):
-            if taille.get("acronyme"):
-                extraction_lines.append(f"- Taille: {taille['acronyme']}")
-
-        fin = extraction_result.get("criteres_financiers", {})
-        if fin.get("present"):
-            parts = []
-            if fin.get("ca_plus_recent"):
-                parts.append(f"CA > {fin['ca_plus_recent']}€")
-            if fin.get("resultat_net_plus_recent"):
-                parts.append(f"Résultat net > {fin['resultat_net_plus_recent']}€")
-            if parts:
-                extraction_lines.append(f"- Financier: {', '.join(parts)}")
-
-        jur = extraction_result.get("criteres_juridiques", {})
-        if jur.get("present"):
-            parts = []
-            if jur.get("categorie_juridique"):
-                parts.append(f"Forme: {jur['categorie_juridique']}")
-            if jur.get("date_creation_entreprise_min"):
-                parts.append(f"Créées après: {jur['date_creation_entreprise_min']}")
-            if jur.get("date_creation_entreprise_max"):
-                parts.append(f"Créées avant: {jur['date_creation_entreprise_max']}")
-            if parts:
-                extraction_lines.append(f"- Juridique: {', '.join(parts)}")
-
-        extraction_summary = "\n".join(extraction_lines) if extraction_lines else "Aucun critère spécifique"
+        llm_messages = AgentService._build_response_messages(
+            user_query, company_count, extraction_result, activity_matches,
+            location_corrections, conversation_history
+        )
 
-        # Build activity matches summary
-        activity_lines = []
-        for match in activity_matches:
-            status = "✓" if match.selected else "○"
-            naf_str = ", ".join(match.naf_codes) if match.naf_codes else "pas de NAF"
-            activity_lines.append(f"  {status} {match.activity} ({match.score*100:.0f}%) - {naf_str}")
-        activity_matches_summary = "\n".join(activity_lines) if activity_lines else "Aucune correspondance d'activité"
+        try:
+            record_prompt_tokens("response", llm_messages)
+            async for chunk in AgentService._call_llm_text_stream(llm_messages):
+                yield chunk
+        except Exception as e:
+            print(f"[Agent] Streaming response generation LLM failed: {e}")
+            # Fallback to the template response
+            yield build_template_response(
+                company_count, extraction_result, activity_matches, location_corrections
+            )
 
-        # Build location corrections summary
-        location_lines = []
-        if location_corrections:
-            for c in location_corrections:
-                if c.field_changed:
-                    location_lines.append(f"  - '{c.original}' ({c.original_field}) → '{c.corrected}' ({c.corrected_field})")
-                elif c.original != c.corrected:
-                    location_lines.append(f"  - '{c.original}' → '{c.corrected}'")
-        location_corrections_text = "\n".join(location_lines) if location_lines else "Aucune correction"
+    @staticmethod
+    def reusable_stages(
+        previous_activity_matches: Optional[List[ActivityMatch]] = None,
+        previous_company_count: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Stages whose previous output the frontend sent back.
 
-        # Identify missing fields that could help narrow results
-        missing_fields = []
-        if not loc.get("present") or not any([loc.get("region"), loc.get("departement"), loc.get("commune")]):
-            missing_fields.append("localisation (région, département, ou commune)")
-        if not taille.get("present"):
-            missing_fields.append("taille d'entreprise (TPE, PME, ETI, GE)")
-        if not fin.get("present"):
-            missing_fields.append("critères financiers (CA minimum, résultat net)")
+        The response is never reused: the new message may ask something else
+        about the same criteria (explanation, thanks...) and needs an answer.
+        """
+        reusable = []
+        if previous_activity_matches:
+            reusable.append("activity_match")
+        if previous_company_count is not None:
+            reusable += ["api_request", "count"]
+        return reusable
 
-        prompt = RESPONSE_GENERATION_PROMPT.format(
-            user_query=user_query,
-            company_count=company_count,
-            extraction_summary=extraction_summary,
-            activity_matches_summary=activity_matches_summary,
-            location_corrections=location_corrections_text
+    @staticmethod
+    def _start_speculative_count(
+        extraction_result: Dict[str, Any],
+        matches: List[tuple],
+        original_activity_text: Optional[str]
+    ) -> Optional[SpeculativeCount]:
+        """Start counting with the NAF codes the selection will most likely pick."""
+        if not SPECULATIVE_COUNT_ENABLED or not matches:
+            return None
+        from services.api_transformer import transform_extraction_to_api_request
+        from services.company_api_client import get_company_api_client
+
+        top = matches[:SPECULATIVE_COUNT_TOP_K] if SPECULATIVE_COUNT_STRATEGY == "union" else matches[:1]
+        naf_codes: List[str] = []
+        for _, _, codes in top:
+            for code in codes:
+                if code not in naf_codes:
+                    naf_codes.append(code)
+        if not naf_codes:
+            return None
+
+        api_request = transform_extraction_to_api_request(
+            extraction_result, naf_codes, original_activity_text=original_activity_text
         )
+        task = asyncio.create_task(get_company_api_client().count_companies_async(api_request))
+        speculative = SpeculativeCount(api_request=api_request, task=task, started_at=time.perf_counter())
+        task.add_done_callback(speculative._on_done)
+        metrics.increment("count.speculative.started")
+        return speculative
 
-        # Add missing fields hint
-        if missing_fields and company_count > 500:
-            prompt += f"\n\nCRITÈRES NON RENSEIGNÉS (pour affiner):\n- " + "\n- ".join(missing_fields)
+    @staticmethod
+    async def _resolve_count(
+        api_request: Dict[str, Any],
+        speculative: Optional[SpeculativeCount] = None
+    ) -> "APIResponse":
+        """
+        Count companies, reusing the speculative count if it asks the same
+        question (same canonical request).
 
-        # Add conversation history if available
-        if conversation_history:
-            prompt += f"\n\nHISTORIQUE DE LA CONVERSATION:\n{conversation_history}"
+        A mismatched speculation is cancelled (its HTTP request is aborted
+        unless an identical count shares it) and the count is reissued.
 
-        try:
-            llm_messages = [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": user_query},
-            ]
-            async for chunk in AgentService._call_llm_text_stream(llm_messages):
-                yield chunk
-        except Exception as e:
-            print(f"[Agent] Streaming response generation LLM failed: {e}")
-            # Fallback to simple message
-            if company_count == 0:
-                yield "Aucune entreprise ne correspond à ces critères. Essayez d'élargir votre recherche."
-            elif company_count <= 100:
-                yield f"J'ai trouvé {company_count} entreprises correspondant à vos critères."
-            elif company_count <= 500:
-                yield f"J'ai trouvé {company_count} entreprises. Vous pouvez affiner si besoin."
+        Raises:
+            CompanyAPIError: If the API call fails
+        """
+        from services.api_transformer import canonical_api_request
+        from services.company_api_client import get_company_api_client
+
+        if speculative is not None:
+            if canonical_api_request(speculative.api_request) == canonical_api_request(api_request):
+                try:
+                    response = await speculative.task
+                except Exception as e:
+                    print(f"[Agent] Speculative count failed ({e}), reissuing")
+                    metrics.increment("count.speculative.errors")
+                else:
+                    # Without speculation the count would only have started after the selection
+                    finished_at = speculative.finished_at or time.perf_counter()
+                    selection_done_at = speculative.selection_done_at or speculative.started_at
+                    saved = max(0.0, min(finished_at, selection_done_at) - speculative.started_at)
+                    metrics.increment("count.speculative.hits")
+                    metrics.observe("count.speculative.saved", saved)
+                    print(f"[Agent] Speculative count confirmed (saved ~{saved * 1000:.0f} ms)")
+                    return response
             else:
-                yield f"J'ai trouvé {company_count} entreprises. Affinez vos critères pour réduire ce nombre."
+                speculative.task.cancel()
+                metrics.increment("count.speculative.misses")
+                print("[Agent] Speculative count discarded, selection differs")
+
+        return await get_company_api_client().count_companies_async(api_request)
+
+    @staticmethod
+    def _fallback_message(company_count: int) -> str:
+        """Simple count-based message when no LLM response is generated."""
+        if company_count == 0:
+            return "Aucune entreprise ne correspond à ces critères. Essayez d'élargir votre recherche."
+        elif company_count <= 100:
+            return f"J'ai trouvé {company_count} entreprises correspondant à vos critères."
+        elif company_count <= 500:
+            return f"J'ai trouvé {company_count} entreprises. Vous pouvez affiner si besoin."
+        else:
+            return f"J'ai trouvé {company_count} entreprises. Affinez vos critères pour réduire ce nombre."
 
     @staticmethod
     async def process_with_api(
@@ -826,17 +1242,22 @@ class AgentService:
         location_corrections: Optional[List[LocationCorrectionInfo]] = None,
         previous_extraction: Optional[Dict[str, Any]] = None,
         previous_activity_matches: Optional[List[ActivityMatch]] = None,
-        conversation_history: Optional[str] = None
+        conversation_history: Optional[str] = None,
+        previous_company_count: Optional[int] = None,
+        previous_count_semantic: Optional[int] = None
     ) -> AgentResponse:
         """
         Process extraction result through external company API.
 
-        1. Check if activity field changed (for caching)
-        2. Match activities to NAF codes using embeddings (if changed)
-        3. LLM selects best NAF codes from matches
-        4. Transform to API format
-        5. Call external API for company count
-        6. Generate contextual response message
+        1. Match activities to NAF codes using embeddings (if mots_cles changed)
+        2. LLM selects best NAF codes from matches
+        3. Transform to API format
+        4. Call external API for company count (if the criteria changed)
+        5. Generate contextual response message
+
+        Runs the chat pipeline (services.chat_pipeline) after its extraction
+        stage. Stages whose inputs did not change since the previous turn are
+        skipped (see services.incremental) and reported in skipped_stages.
 
         Args:
             extraction_result: Extraction result from process_message
@@ -846,153 +1267,28 @@ class AgentService:
             previous_extraction: Previous extraction for caching unchanged fields
             previous_activity_matches: Previous activity matches for caching
             conversation_history: Full conversation history for response generation
+            previous_company_count: Previous count_legal, reused if the criteria are unchanged
+            previous_count_semantic: Previous count_semantic
 
         Returns:
             AgentResponse with extraction, company_count, and activity_matches
         """
-        # Import services here to avoid circular imports
-        from services.activity_matcher import get_activity_matcher
-        from services.api_transformer import transform_extraction_to_api_request
-        from services.company_api_client import get_company_api_client, CompanyAPIError
-
-        naf_codes = []
-        api_result = None
-        company_count = 0
-        count_semantic = 0
-        original_activity_text = None
-        activity_matches: List[ActivityMatch] = []
-
-        try:
-            # Check if activity changed (for caching)
-            activite = extraction_result.get("activite", {})
-            activity_display = activite.get("activite_entreprise")  # For display
-            mots_cles = activite.get("mots_cles")  # For embedding search
-
-            previous_mots_cles = None
-            if previous_extraction:
-                previous_activite = previous_extraction.get("activite", {})
-                previous_mots_cles = previous_activite.get("mots_cles")
-
-            activity_changed = mots_cles != previous_mots_cles
-
-            # Step 1: Match activities to NAF codes using embeddings (or use cache)
-            if mots_cles:
-                # Save original activity text for API semantic search
-                original_activity_text = activity_display or mots_cles
-
-                if not activity_changed and previous_activity_matches:
-                    # Activity unchanged - reuse previous matches
-                    print(f"[Agent] Query terms unchanged ('{mots_cles}'), reusing cached matches")
-                    activity_matches = previous_activity_matches
-                    # Collect NAF codes from selected matches
-                    for match in activity_matches:
-                        if match.selected:
-                            for code in match.naf_codes:
-                                if code not in naf_codes:
-                                    naf_codes.append(code)
-                else:
-                    # Activity changed - run embedding search using mots_cles
-                    activity_matcher = await get_activity_matcher()
-                    matches = activity_matcher.find_similar_activities(mots_cles, top_k=5, threshold=0.3)
-                    print(f"[Agent] Query terms '{mots_cles}' matches:")
-                    for activity, score, codes in matches:
-                        print(f"  - {activity} (score={score:.2f}) NAF: {codes}")
-
-                    # Step 2: LLM selects best matches
-                    selected_indices, explanation, no_good_match = AgentService._select_naf_codes(
-                        mots_cles, matches
-                    )
-                    print(f"[Agent] LLM selected indices: {selected_indices}, explanation: {explanation}")
-
-                    # Build activity matches list and collect NAF codes
-                    for i, (activity, score, codes) in enumerate(matches):
-                        is_selected = i in selected_indices and not no_good_match
-                        activity_matches.append(ActivityMatch(
-                            activity=activity,
-                            naf_codes=codes,
-                            score=score,
-                            selected=is_selected
-                        ))
-                        if is_selected:
-                            for code in codes:
-                                if code not in naf_codes:
-                                    naf_codes.append(code)
-
-                print(f"[Agent] Final NAF codes: {naf_codes}")
-
-            # Step 2: Transform to API format (pass original activity text for semantic search)
-            api_request = transform_extraction_to_api_request(
-                extraction_result,
-                naf_codes,
-                original_activity_text=original_activity_text
-            )
-            print(f"[Agent] API request: {json.dumps(api_request, ensure_ascii=False)}")
-
-            # Step 3: Call external API
-            api_client = get_company_api_client()
-            api_response = api_client.count_companies(api_request)
-
-            company_count = api_response.count  # count_legal
-            count_semantic = api_response.count_semantic  # count_semantic
-            api_result = api_response.data
-            print(f"[Agent] API returned count_legal={company_count}, count_semantic={count_semantic}")
-
-        except CompanyAPIError as e:
-            print(f"[Agent] API error: {e}")
-            # Return extraction result with error message
-            return AgentResponse(
-                action="extract",
-                message=f"Critères extraits, mais impossible de contacter la base de données: {e}",
-                extraction_result=extraction_result,
-                company_count=None,
-                count_semantic=None,
-                api_result=None,
-                naf_codes=naf_codes if naf_codes else None,
-                activity_matches=activity_matches if activity_matches else None,
-            )
-
-        except Exception as e:
-            print(f"[Agent] Unexpected error in process_with_api: {e}")
-            return AgentResponse(
-                action="extract",
-                message="Critères extraits. Une erreur est survenue lors de la recherche.",
-                extraction_result=extraction_result,
-                company_count=None,
-                count_semantic=None,
-                api_result=None,
-                naf_codes=naf_codes if naf_codes else None,
-                activity_matches=activity_matches if activity_matches else None,
-            )
-
-        # Step 4: Generate contextual response message
-        if user_query and activity_matches:
-            message = AgentService._generate_contextual_response(
-                user_query=user_query,
-                company_count=company_count,
-                extraction_result=extraction_result,
-                activity_matches=activity_matches,
-                location_corrections=location_corrections,
-                conversation_history=conversation_history
-            )
-        else:
-            # Fallback to simple message if no context available
-            if company_count == 0:
-                message = "Aucune entreprise ne correspond à ces critères. Essayez d'élargir votre recherche."
-            elif company_count <= 100:
-                message = f"J'ai trouvé {company_count} entreprises correspondant à vos critères."
-            elif company_count <= 500:
-                message = f"J'ai trouvé {company_count} entreprises. Vous pouvez affiner si besoin."
-            else:
-                message = f"J'ai trouvé {company_count} entreprises. Affinez vos critères pour réduire ce nombre."
+        from services.chat_pipeline import start_chat, run_chat
 
-        return AgentResponse(
+        run = start_chat(
+            [],
+            user_query=user_query,
+            previous_extraction=previous_extraction,
+            previous_activity_matches=previous_activity_matches,
+            previous_company_count=previous_company_count,
+            previous_count_semantic=previous_count_semantic,
+            conversation_history=conversation_history,
+        )
+        # The extraction is done: start the graph after it
+        run.outputs["extraction"] = AgentResponse(
             action="extract",
-            message=message,
+            message="",
             extraction_result=extraction_result,
-            company_count=company_count,
-            count_semantic=count_semantic,
-            api_result=api_result,
-            naf_codes=naf_codes if naf_codes else None,
-            activity_matches=activity_matches if activity_matches else None,
             location_corrections=location_corrections,
         )
+        return await run_chat(run)
@@ -4,6 +4,7 @@ API Transformer Service.
 Transforms internal extraction format to external company API format.
 """
 
+import json
 from typing import Dict, Any, List, Optional
 
 
@@ -336,3 +337,45 @@ def get_criteria_summary(api_request: Dict[str, Any]) -> str:
             parts.append(f"Juridique: {', '.join(legal_parts)}")
 
     return " | ".join(parts) if parts else "Aucun critere specifie"
+
+
+def _canonical_value(value: Any) -> Any:
+    """Lists sorted and deduplicated, dicts without empty values."""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            item = _canonical_value(item)
+            if item is None or item == "" or item == [] or item == {}:
+                continue
+            result[key] = item
+        return result
+    if isinstance(value, (list, tuple)):
+        items = {json.dumps(_canonical_value(item), sort_keys=True, ensure_ascii=False): _canonical_value(item)
+                 for item in value}
+        return [items[k] for k in sorted(items)]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def canonical_api_request(api_request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Canonical form of an API request, for caching counts.
+
+    Requests that ask the API the same question get the same form: lists are
+    sorted and deduplicated, empty values dropped, and sections that are not
+    present (or empty) removed. Booleans are kept (headquarters=False is a
+    criterion).
+    """
+    canonical = {}
+    for section, criteria in api_request.items():
+        if isinstance(criteria, dict):
+            if not criteria.get("present"):
+                continue
+            criteria = _canonical_value(criteria)
+            if set(criteria) <= {"present"}:
+                continue
+        else:
+            criteria = _canonical_value(criteria)
+        canonical[section] = criteria
+    return canonical
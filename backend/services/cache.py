@@ -0,0 +1,463 @@
+"""
+In-process caches.
+
+Thread-safe LRU cache with per-entry TTL. Every cache registers itself so
+GET /metrics can report sizes and hit rates.
+
+TieredCache adds an optional shared tier (Redis protocol, see
+services.shared_cache) behind the in-process LRU, configured by
+CACHE_SHARED_URL or plugged in with set_shared_backend().
+
+Cache contents survive restarts through services.cache_snapshot; `version`
+identifies what the entries depend on (model, prompt version...) so a
+snapshot taken with another version is discarded.
+"""
+
+import asyncio
+import os
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Protocol, Tuple
+from urllib.parse import urlparse
+
+from services.metrics import metrics
+from services.shared_cache import CACHE_SHARED_URL, VALUE_CODEC, create_shared_backend, shared_ttl
+from services.singleflight import SingleFlight, ThreadSingleFlight, request_key
+
+# All caches created in the process, by name
+_registry: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """
+    LRU cache bounded in size, with entries expiring after `ttl` seconds.
+
+    Values are returned as stored: callers that mutate them must copy.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, version: str = ""):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # Restored from a snapshot, decoded on first access: key -> (expires_at, stored value)
+        self._restored: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _load_restored(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        """Move a restored entry into the cache (lock held)."""
+        expires_at, stored = self._restored.pop(key)
+        entry = (expires_at, stored.load())
+        self._data[key] = entry
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        metrics.increment(f"cache.{self.name}.restored")
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or `default` on miss or expiry."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None and key in self._restored:
+                entry = self._load_restored(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    hit = True
+                else:
+                    del self._data[key]
+                    metrics.increment(f"cache.{self.name}.expired")
+                    hit = False
+            else:
+                hit = False
+
+        metrics.increment(f"cache.{self.name}.{'hit' if hit else 'miss'}")
+        return value if hit else default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entries beyond maxsize."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        evicted = 0
+        with self._lock:
+            self._restored.pop(key, None)
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted:
+            metrics.increment(f"cache.{self.name}.eviction", evicted)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._restored.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._restored.clear()
+
+    def restore(self, entries: Dict[Hashable, Tuple[float, Any]]) -> int:
+        """
+        Add snapshot entries, decoded on first access.
+
+        Args:
+            entries: key -> (expires_at in time.monotonic() terms, stored value
+                with a load() method)
+
+        Returns:
+            Number of entries added (keys already cached keep their value)
+        """
+        with self._lock:
+            room = max(0, self.maxsize - len(self._data))
+            added = 0
+            for key, entry in entries.items():
+                if added >= room:
+                    break
+                if key not in self._data:
+                    self._restored[key] = entry
+                    added += 1
+        return added
+
+    def export(self) -> List[Tuple[Hashable, float, Any]]:
+        """(key, expires_at, value) of the live entries, restored ones still undecoded."""
+        now = time.monotonic()
+        with self._lock:
+            entries = [(k, exp, v) for k, (exp, v) in self._data.items() if exp > now]
+            entries.extend((k, exp, stored) for k, (exp, stored) in self._restored.items() if exp > now)
+        return entries
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit rate since startup."""
+        hits = metrics.counter(f"cache.{self.name}.hit")
+        misses = metrics.counter(f"cache.{self.name}.miss")
+        return {
+            "size": len(self._data),
+            "restored_pending": len(self._restored),
+            "maxsize": self.maxsize,
+            "ttl_s": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+
+
+# ============================================================================
+# Shared tier
+# ============================================================================
+
+# Stampede protection: the replica computing a missing value holds a lock in
+# the shared tier, the others wait up to CACHE_STAMPEDE_WAIT seconds for it
+CACHE_STAMPEDE_LOCK_TTL = float(os.getenv("CACHE_STAMPEDE_LOCK_TTL", "30"))
+CACHE_STAMPEDE_WAIT = float(os.getenv("CACHE_STAMPEDE_WAIT", "5"))
+_STAMPEDE_POLL_INTERVAL = 0.05
+
+# Shared-tier values start with their expiry (wall clock, seconds since the
+# epoch) so a replica reading one keeps it locally no longer than it lives
+# there. Part of the shared keys: changing the layout orphans old entries
+_SHARED_EXPIRY = struct.Struct("!d")
+_SHARED_FORMAT = "expiry1"
+
+
+class SharedCacheBackend(Protocol):
+    """
+    Cross-process cache tier (see services.shared_cache). Keys are
+    namespaced strings, values bytes. Thread-safe and blocking: only called
+    from worker threads (TieredCache's async API) or off the event loop
+    (its *_sync API, which enforces it).
+    """
+
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    def set_if_absent(self, key: str, value: bytes, ttl: float) -> bool: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def close(self) -> None: ...
+
+
+_shared_backend: Optional[SharedCacheBackend] = None
+
+
+def set_shared_backend(backend: Optional[SharedCacheBackend]) -> None:
+    """Plug in (or remove with None) the shared tier used by every TieredCache."""
+    global _shared_backend
+    _shared_backend = backend
+
+
+def get_shared_backend() -> Optional[SharedCacheBackend]:
+    return _shared_backend
+
+
+def open_shared_cache(url: str = CACHE_SHARED_URL) -> None:
+    """Plug in the backend configured by CACHE_SHARED_URL (startup event)."""
+    backend = create_shared_backend(url)
+    if backend is not None:
+        set_shared_backend(backend)
+        print(f"[Cache] Shared tier: {urlparse(url).scheme}://{urlparse(url).hostname or ''}")
+
+
+def close_shared_cache() -> None:
+    """Close the shared tier's connections (shutdown event)."""
+    backend = _shared_backend
+    set_shared_backend(None)
+    if backend is not None:
+        backend.close()
+
+
+class TieredCache:
+    """
+    In-process LRU in front of the optional shared tier.
+
+    Values go through `codec` in the shared tier (services.shared_cache:
+    VALUE_CODEC by default, EMBEDDING_CODEC for vectors). Shared keys include
+    the cache version and codec, so replicas running another model or prompt
+    never read each other's entries. Shared-tier errors are counted and
+    treated as misses: the shared tier is an optimization, never a dependency.
+    A shared hit is kept locally for the entry's remaining shared TTL, capped
+    at the cache TTL, so a short ttl_for() TTL is honoured by every replica.
+
+    get_or_compute() adds stampede protection: concurrent misses on a key
+    compute it once per process (singleflight) and, through a lock in the
+    shared tier, once across replicas.
+
+    The async API (get, set, get_or_compute) never blocks the event loop.
+    The *_sync API makes blocking socket round trips and, while another
+    replica computes a value, sleeps up to CACHE_STAMPEDE_WAIT seconds: it is
+    for worker threads and scripts only, and raises RuntimeError when called
+    from a running event loop.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, version: str = "", codec: Any = None):
+        self.name = name
+        self.ttl = ttl
+        self.version = version
+        self.codec = codec or VALUE_CODEC
+        self.shared_ttl = shared_ttl(name, ttl)
+        self.local = TTLCache(name, maxsize, ttl, version=version)
+        self._prefix = f"{name}:{request_key(version, self.codec.name, _SHARED_FORMAT)[:12]}"
+        self._flights = SingleFlight(f"cache.{name}")
+        self._thread_flights = ThreadSingleFlight(f"cache.{name}")
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"{self._prefix}:{key if isinstance(key, str) else request_key(key)}"
+
+    def _shared_error(self, operation: str, e: Exception) -> None:
+        metrics.increment(f"cache.{self.name}.shared_error")
+        print(f"[Cache] {self.name}: shared tier {operation} failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Blocking access to the shared tier
+    # ------------------------------------------------------------------
+
+    def _shared_get(self, key: Hashable) -> Any:
+        backend = _shared_backend
+        if backend is None:
+            return None
+        value, remaining = None, 0.0
+        try:
+            raw = backend.get(self._shared_key(key))
+            if raw is not None:
+                (expires_at,) = _SHARED_EXPIRY.unpack_from(raw)
+                remaining = expires_at - time.time()
+                if remaining > 0:
+                    value = self.codec.loads(raw[_SHARED_EXPIRY.size:])
+        except Exception as e:
+            self._shared_error("get", e)
+            return None
+        if value is None:
+            metrics.increment(f"cache.{self.name}.shared_miss")
+            return None
+
+        metrics.increment(f"cache.{self.name}.shared_hit")
+        self.local.set(key, value, ttl=min(self.ttl, remaining))
+        return value
+
+    def _shared_set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        backend = _shared_backend
+        if backend is None:
+            return
+        try:
+            shared_ttl = self.shared_ttl if ttl is None else min(ttl, self.shared_ttl)
+            payload = _SHARED_EXPIRY.pack(time.time() + shared_ttl) + self.codec.dumps(value)
+            backend.set(self._shared_key(key), payload, shared_ttl)
+        except Exception as e:
+            self._shared_error("set", e)
+
+    def _lock(self, key: Hashable) -> Optional[str]:
+        """Take the compute lock of a key: its token, "" if held elsewhere, None without a usable tier."""
+        backend = _shared_backend
+        if backend is None:
+            return None
+        token = uuid.uuid4().hex
+        try:
+            acquired = backend.set_if_absent(f"lock:{self._shared_key(key)}", token.encode(), CACHE_STAMPEDE_LOCK_TTL)
+        except Exception as e:
+            self._shared_error("lock", e)
+            return None
+        return token if acquired else ""
+
+    def _unlock(self, key: Hashable, token: str) -> None:
+        backend = _shared_backend
+        if backend is None:
+            return
+        lock_key = f"lock:{self._shared_key(key)}"
+        try:
+            # Only release our own lock (it may have expired and been retaken)
+            if backend.get(lock_key) == token.encode():
+                backend.delete(lock_key)
+        except Exception as e:
+            self._shared_error("unlock", e)
+
+    # ------------------------------------------------------------------
+    # Async API
+    # ------------------------------------------------------------------
+
+    async def get(self, key: Hashable) -> Any:
+        """Return the cached value (local tier first), or None."""
+        value = self.local.get(key)
+        if value is not None or _shared_backend is None:
+            return value
+        return await asyncio.to_thread(self._shared_get, key)
+
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store in the local tier and, if configured, the shared tier (`ttl` overrides the cache TTL)."""
+        self.local.set(key, value, ttl=ttl)
+        if _shared_backend is not None:
+            await asyncio.to_thread(self._shared_set, key, value, ttl)
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        ttl_for: Optional[Callable[[Any], float]] = None,
+    ) -> Any:
+        """
+        Return the cached value or compute, store and return it.
+
+        None results are returned but not cached; compute() errors propagate.
+        ttl_for(value), if given, sets the TTL of each computed value.
+        """
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        return await self._flights.do(self._shared_key(key), lambda: self._fill(key, compute, ttl_for))
+
+    async def _fill(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        ttl_for: Optional[Callable[[Any], float]],
+    ) -> Any:
+        if _shared_backend is not None:
+            value = await asyncio.to_thread(self._shared_get, key)
+            if value is not None:
+                return value
+            token = await asyncio.to_thread(self._lock, key)
+            if token == "":
+                value = await self._wait_for_value(key)
+                if value is not None:
+                    return value
+        else:
+            token = None
+
+        try:
+            value = await compute()
+            if value is not None:
+                await self.set(key, value, ttl=ttl_for(value) if ttl_for else None)
+            return value
+        finally:
+            if token:
+                await asyncio.to_thread(self._unlock, key, token)
+
+    async def _wait_for_value(self, key: Hashable) -> Any:
+        """Wait for the replica holding the lock to store the value."""
+        metrics.increment(f"cache.{self.name}.stampede_wait")
+        deadline = time.monotonic() + CACHE_STAMPEDE_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_STAMPEDE_POLL_INTERVAL)
+            value = await asyncio.to_thread(self._shared_get, key)
+            if value is not None:
+                return value
+        metrics.increment(f"cache.{self.name}.stampede_timeout")
+        return None
+
+    # ------------------------------------------------------------------
+    # Blocking API (worker threads, scripts)
+    # ------------------------------------------------------------------
+
+    def _ensure_off_loop(self, operation: str) -> None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        raise RuntimeError(
+            f"{self.name}: {operation}() blocks, call it through asyncio.to_thread() "
+            "or use the async API"
+        )
+
+    def get_sync(self, key: Hashable) -> Any:
+        self._ensure_off_loop("get_sync")
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        return self._shared_get(key)
+
+    def set_sync(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._ensure_off_loop("set_sync")
+        self.local.set(key, value, ttl=ttl)
+        self._shared_set(key, value, ttl)
+
+    def get_or_compute_sync(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Blocking get_or_compute() (same stampede protection)."""
+        self._ensure_off_loop("get_or_compute_sync")
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        return self._thread_flights.do(self._shared_key(key), lambda: self._fill_sync(key, compute))
+
+    def _fill_sync(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = self._shared_get(key)
+        if value is not None:
+            return value
+        token = self._lock(key)
+        if token == "":
+            metrics.increment(f"cache.{self.name}.stampede_wait")
+            deadline = time.monotonic() + CACHE_STAMPEDE_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(_STAMPEDE_POLL_INTERVAL)
+                value = self._shared_get(key)
+                if value is not None:
+                    return value
+            metrics.increment(f"cache.{self.name}.stampede_timeout")
+
+        try:
+            value = compute()
+            if value is not None:
+                self.set_sync(key, value)
+            return value
+        finally:
+            if token:
+                self._unlock(key, token)
+
+
+def registered_caches() -> Dict[str, TTLCache]:
+    """Every cache created in the process, by name."""
+    return dict(_registry)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every registered cache."""
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -0,0 +1,389 @@
+"""
+Snapshot and restore of the in-process caches across restarts.
+
+The registered caches (services.cache) are written to one binary file at
+shutdown and every CACHE_SNAPSHOT_INTERVAL seconds. At startup the file is
+memory-mapped and only the keys are read: values are decoded on first
+access, so a large snapshot does not slow the start down.
+
+File layout (integers little-endian):
+
+    b"CSNP" | u16 format version | u32 header length | header (JSON)
+    per cache, its section: records of
+        f64 expiry (epoch seconds) | u32 key length | key | u32 value length | value
+
+The header lists, per cache, its version and the offset/length of its
+section. A cache whose version changed since the snapshot (other model,
+prompt version...) is skipped, as is the whole file if the format version
+differs. Keys and values use a small tagged binary encoding (None, bool,
+int, float, str, bytes, list, tuple, dict, numpy arrays); entries holding
+anything else are left out of the snapshot.
+"""
+
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from services.cache import registered_caches
+from services.metrics import metrics
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+CACHE_SNAPSHOT_ENABLED = os.getenv("CACHE_SNAPSHOT_ENABLED", "true").lower() == "true"
+CACHE_SNAPSHOT_PATH = os.getenv(
+    "CACHE_SNAPSHOT_PATH", str(Path(__file__).parent.parent / "data" / "cache_snapshot.bin")
+)
+# Seconds between periodic snapshots (0: only at shutdown)
+CACHE_SNAPSHOT_INTERVAL = float(os.getenv("CACHE_SNAPSHOT_INTERVAL", "600"))
+
+MAGIC = b"CSNP"
+# Bump when the file layout or the value encoding changes
+FORMAT_VERSION = 1
+
+# Modules owning the caches: imported before restoring so the caches exist
+CACHE_MODULES = (
+    "services.activity_matcher",
+    "services.agent_service",
+    "services.company_api_client",
+    "services.location_matcher",
+)
+
+
+# ============================================================================
+# Value encoding
+# ============================================================================
+
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+
+def _encode(value: Any, out: bytearray) -> None:
+    """Append the tagged encoding of value (TypeError if unsupported)."""
+    if value is None:
+        out += b"N"
+    elif value is True or value is False or isinstance(value, np.bool_):
+        out += b"T" if value else b"F"
+    elif isinstance(value, (int, np.integer)):
+        out += b"i" + _I64.pack(int(value))
+    elif isinstance(value, (float, np.floating)):
+        out += b"d" + _F64.pack(float(value))
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        out += b"s" + _U32.pack(len(data)) + data
+    elif isinstance(value, bytes):
+        out += b"b" + _U32.pack(len(value)) + value
+    elif isinstance(value, (list, tuple)):
+        out += (b"l" if isinstance(value, list) else b"t") + _U32.pack(len(value))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out += b"m" + _U32.pack(len(value))
+        for k, v in value.items():
+            _encode(k, out)
+            _encode(v, out)
+    elif isinstance(value, np.ndarray):
+        dtype = value.dtype.str.encode("ascii")
+        data = np.ascontiguousarray(value).tobytes()
+        out += b"a" + bytes([len(dtype)]) + dtype + bytes([value.ndim])
+        out += b"".join(_U32.pack(dim) for dim in value.shape)
+        out += _U32.pack(len(data)) + data
+    else:
+        raise TypeError(f"unsupported type {type(value).__name__}")
+
+
+def encode(value: Any) -> bytes:
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def _decode(buf, pos: int) -> Tuple[Any, int]:
+    """Decode the value at pos, return (value, position after it)."""
+    tag = buf[pos:pos + 1]
+    pos += 1
+    if tag == b"N":
+        return None, pos
+    if tag == b"T":
+        return True, pos
+    if tag == b"F":
+        return False, pos
+    if tag == b"i":
+        return _I64.unpack_from(buf, pos)[0], pos + 8
+    if tag == b"d":
+        return _F64.unpack_from(buf, pos)[0], pos + 8
+    if tag in (b"s", b"b"):
+        (length,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        data = bytes(buf[pos:pos + length])
+        return (data.decode("utf-8") if tag == b"s" else data), pos + length
+    if tag in (b"l", b"t"):
+        (count,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        items = []
+        for _ in range(count):
+            item, pos = _decode(buf, pos)
+            items.append(item)
+        return (items if tag == b"l" else tuple(items)), pos
+    if tag == b"m":
+        (count,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        result = {}
+        for _ in range(count):
+            k, pos = _decode(buf, pos)
+            result[k], pos = _decode(buf, pos)
+        return result, pos
+    if tag == b"a":
+        dtype_len = buf[pos]
+        dtype = np.dtype(bytes(buf[pos + 1:pos + 1 + dtype_len]).decode("ascii"))
+        pos += 1 + dtype_len
+        ndim = buf[pos]
+        pos += 1
+        shape = tuple(_U32.unpack_from(buf, pos + 4 * i)[0] for i in range(ndim))
+        pos += 4 * ndim
+        (length,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        array = np.frombuffer(buf, dtype=dtype, count=length // dtype.itemsize, offset=pos)
+        return array.reshape(shape).copy(), pos + length
+    raise ValueError(f"corrupt snapshot: unknown tag {tag!r}")
+
+
+def decode(buf, pos: int = 0) -> Any:
+    return _decode(buf, pos)[0]
+
+
+class StoredValue:
+    """A value still encoded in the mapped snapshot, decoded by load()."""
+    __slots__ = ("buf", "offset", "length")
+
+    def __init__(self, buf, offset: int, length: int):
+        self.buf = buf
+        self.offset = offset
+        self.length = length
+
+    def load(self) -> Any:
+        return decode(self.buf, self.offset)
+
+    def raw(self) -> bytes:
+        return bytes(self.buf[self.offset:self.offset + self.length])
+
+
+# ============================================================================
+# Snapshot
+# ============================================================================
+
+def save_snapshot(path: str = CACHE_SNAPSHOT_PATH) -> Dict[str, int]:
+    """
+    Write every registered cache to `path` (atomically, via a temp file).
+
+    Returns:
+        Entries written per cache
+    """
+    start = time.perf_counter()
+    # Entry expiries are monotonic, the file stores epoch seconds
+    offset = time.time() - time.monotonic()
+    sections: List[bytes] = []
+    caches: Dict[str, Dict[str, Any]] = {}
+    written: Dict[str, int] = {}
+    position = 0
+
+    for name, cache in registered_caches().items():
+        body = bytearray()
+        count = skipped = 0
+        for key, expires_at, value in cache.export():
+            try:
+                key_data = encode(key)
+                value_data = value.raw() if isinstance(value, StoredValue) else encode(value)
+            except (TypeError, struct.error):
+                skipped += 1
+                continue
+            body += _F64.pack(expires_at + offset)
+            body += _U32.pack(len(key_data)) + key_data
+            body += _U32.pack(len(value_data)) + value_data
+            count += 1
+        if skipped:
+            metrics.increment(f"cache_snapshot.{name}.skipped", skipped)
+        if not count:
+            continue
+        caches[name] = {"version": cache.version, "offset": position, "length": len(body), "entries": count}
+        sections.append(bytes(body))
+        position += len(body)
+        written[name] = count
+
+    header = json.dumps({"created_at": time.time(), "caches": caches}).encode("utf-8")
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<H", FORMAT_VERSION) + _U32.pack(len(header)) + header)
+        for body in sections:
+            f.write(body)
+    os.replace(tmp, target)
+
+    metrics.observe("cache_snapshot.save.latency", time.perf_counter() - start)
+    print(f"[CacheSnapshot] Saved {sum(written.values())} entries to {target} "
+          f"in {time.perf_counter() - start:.2f}s: {written}")
+    return written
+
+
+def restore_snapshot(path: str = CACHE_SNAPSHOT_PATH) -> Dict[str, int]:
+    """
+    Map `path` and hand its unexpired entries to the matching caches.
+
+    Only keys are decoded here; values stay in the mapping until first
+    access. Missing or invalid files restore nothing; entries whose key does
+    not decode to a hashable value are skipped, and a file that turns out
+    corrupt midway keeps the caches restored before the damage.
+
+    Returns:
+        Entries restored per cache
+    """
+    import importlib
+
+    for module in CACHE_MODULES:
+        importlib.import_module(module)
+
+    target = Path(path)
+    if not target.exists() or target.stat().st_size == 0:
+        return {}
+
+    start = time.perf_counter()
+    with open(target, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    restored: Dict[str, int] = {}
+    try:
+        if buf[:4] != MAGIC or struct.unpack_from("<H", buf, 4)[0] != FORMAT_VERSION:
+            print(f"[CacheSnapshot] {target}: other format version, ignored")
+            metrics.increment("cache_snapshot.discarded")
+            return {}
+        (header_len,) = _U32.unpack_from(buf, 6)
+        header = json.loads(bytes(buf[10:10 + header_len]))
+        base = 10 + header_len
+
+        # Snapshot expiries are epoch seconds, the caches use monotonic time
+        offset = time.monotonic() - time.time()
+        now = time.time()
+        caches = registered_caches()
+        for name, section in header["caches"].items():
+            cache = caches.get(name)
+            if cache is None:
+                continue
+            if section["version"] != cache.version:
+                print(f"[CacheSnapshot] {name}: version changed "
+                      f"({section['version']!r} -> {cache.version!r}), entries discarded")
+                metrics.increment(f"cache_snapshot.{name}.discarded", section["entries"])
+                continue
+
+            entries: Dict[Hashable, Tuple[float, StoredValue]] = {}
+            skipped = 0
+            pos = base + section["offset"]
+            end = pos + section["length"]
+            while pos < end:
+                (expires_at,) = _F64.unpack_from(buf, pos)
+                (key_len,) = _U32.unpack_from(buf, pos + 8)
+                key_pos = pos + 12
+                pos += 12 + key_len
+                (value_len,) = _U32.unpack_from(buf, pos)
+                if expires_at > now:
+                    try:
+                        key = decode(buf, key_pos)
+                        hash(key)
+                    except TypeError:
+                        # Decodes to a list/dict (or contains one): not a cache key
+                        skipped += 1
+                    else:
+                        entries[key] = (expires_at + offset, StoredValue(buf, pos + 4, value_len))
+                pos += 4 + value_len
+            if skipped:
+                metrics.increment(f"cache_snapshot.{name}.skipped", skipped)
+            restored[name] = cache.restore(entries)
+            metrics.increment(f"cache_snapshot.{name}.restored", restored[name])
+    except (ValueError, KeyError, TypeError, struct.error, json.JSONDecodeError) as e:
+        print(f"[CacheSnapshot] {target}: unreadable snapshot ({e}), rest of the file ignored")
+        metrics.increment("cache_snapshot.errors")
+
+    metrics.observe("cache_snapshot.restore.latency", time.perf_counter() - start)
+    print(f"[CacheSnapshot] Restored {sum(restored.values())} entries from {target} "
+          f"in {time.perf_counter() - start:.2f}s: {restored}")
+    return restored
+
+
+# ============================================================================
+# Lifecycle
+# ============================================================================
+
+_snapshot_task: Optional[asyncio.Task] = None
+
+
+async def save_snapshot_async() -> None:
+    """save_snapshot off the event loop; errors are logged, never raised."""
+    if not CACHE_SNAPSHOT_ENABLED:
+        return
+    try:
+        await asyncio.to_thread(save_snapshot)
+    except Exception as e:
+        metrics.increment("cache_snapshot.errors")
+        print(f"[CacheSnapshot] Save failed: {e}")
+
+
+async def start_cache_persistence() -> None:
+    """Restore the last snapshot and start periodic snapshots (startup event)."""
+    global _snapshot_task
+    if not CACHE_SNAPSHOT_ENABLED:
+        return
+    try:
+        await asyncio.to_thread(restore_snapshot)
+    except Exception as e:
+        metrics.increment("cache_snapshot.errors")
+        print(f"[CacheSnapshot] Restore failed: {e}")
+
+    if CACHE_SNAPSHOT_INTERVAL > 0:
+        async def periodic() -> None:
+            while True:
+                await asyncio.sleep(CACHE_SNAPSHOT_INTERVAL)
+                await save_snapshot_async()
+
+        _snapshot_task = asyncio.get_running_loop().create_task(periodic(), name="cache-snapshot")
+
+
+async def stop_cache_persistence() -> None:
+    """Stop periodic snapshots and write a final one (shutdown event)."""
+    global _snapshot_task
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        _snapshot_task = None
+    await save_snapshot_async()
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect a cache snapshot")
+    parser.add_argument("path", nargs="?", default=CACHE_SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise SystemExit(f"{args.path}: not a cache snapshot")
+    (header_len,) = _U32.unpack_from(data, 6)
+    header = json.loads(data[10:10 + header_len])
+    print(f"Format v{struct.unpack_from('<H', data, 4)[0]}, "
+          f"created {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['created_at']))}")
+    for name, section in header["caches"].items():
+        print(f"{name:<16} {section['entries']:>7} entries {section['length'] / 1024:>9.1f} KB  "
+              f"version {section['version']!r}")
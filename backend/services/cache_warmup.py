@@ -0,0 +1,259 @@
+"""
+Cache warm-up: replays a corpus of frequent queries offline.
+
+In-process caches start empty after each deploy, so the first requests pay
+for every LLM and embedding call. Replaying the most frequent queries fills
+the caches the chat pipeline reads:
+- extraction (and the location matches made while extracting)
+- query embedding and activity matches (embedding stage)
+- NAF selection
+
+Queries are replayed with bounded concurrency and a start rate so the
+warm-up does not compete with real traffic for the LLM provider.
+
+Corpus formats: a JSON list of strings or of objects with an "input",
+"query", "content" or "message" field (e.g. synthetic_dataset.json), JSON
+lines with the same objects, or plain text with one query per line. Repeated
+queries are replayed once, the most frequent first.
+
+Usage (from backend/):
+    python -m services.cache_warmup ../synthetic_dataset.json --limit 100 --concurrency 4 --rate 2
+
+The CLI fills the caches of its own process: it only benefits the API
+through the shared cache tier (services.cache), and otherwise serves to
+measure the warm-up (duration, errors, resulting cache sizes).
+
+At startup, set CACHE_WARMUP_CORPUS: the warm-up then runs in a background
+task once the matchers are ready, without delaying readiness.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services.cache import cache_stats
+from services.load_monitor import load_monitor
+from services.metrics import metrics
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+# Corpus replayed at startup (empty: no warm-up)
+CACHE_WARMUP_CORPUS = os.getenv("CACHE_WARMUP_CORPUS", "")
+# Most frequent queries replayed
+CACHE_WARMUP_LIMIT = int(os.getenv("CACHE_WARMUP_LIMIT", "500"))
+# Queries replayed at the same time
+CACHE_WARMUP_CONCURRENCY = int(os.getenv("CACHE_WARMUP_CONCURRENCY", "4"))
+# Queries started per second (0: no limit)
+CACHE_WARMUP_RATE = float(os.getenv("CACHE_WARMUP_RATE", "2"))
+# How long the startup warm-up waits for the matchers
+CACHE_WARMUP_READY_TIMEOUT = float(os.getenv("CACHE_WARMUP_READY_TIMEOUT", "600"))
+
+QUERY_FIELDS = ("input", "query", "content", "message")
+
+# Caches filled by the warm-up, reported before/after
+WARMED_CACHES = ("extraction", "query_embedding", "activity_match", "location_match", "naf_selection")
+
+
+@dataclass(frozen=True)
+class WarmupMessage:
+    """A first-turn user message (MessageLike)"""
+    content: str
+    role: str = "user"
+
+
+# ============================================================================
+# Corpus
+# ============================================================================
+
+def _query_of(item: Any) -> Optional[str]:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        for field in QUERY_FIELDS:
+            if isinstance(item.get(field), str):
+                return item[field]
+    return None
+
+
+def load_corpus(path: str, limit: Optional[int] = None) -> List[str]:
+    """
+    Distinct queries of a corpus file, most frequent first.
+
+    Args:
+        path: JSON list, JSON lines or plain text file
+        limit: Keep only the `limit` most frequent queries
+    """
+    text = Path(path).read_text(encoding="utf-8")
+    try:
+        data = json.loads(text)
+        items = data if isinstance(data, list) else [data]
+    except json.JSONDecodeError:
+        items = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(line)
+
+    counts: Counter = Counter()
+    for item in items:
+        query = _query_of(item)
+        if query and query.strip():
+            counts[" ".join(query.split())] += 1
+    return [query for query, _ in counts.most_common(limit)]
+
+
+# ============================================================================
+# Replay
+# ============================================================================
+
+async def _warm_query(query: str) -> None:
+    """Run the cacheable stages of the chat pipeline for one first-turn query."""
+    from services.activity_matcher import get_activity_matcher
+    from services.agent_service import AgentService
+    from services.chat_pipeline import ACTIVITY_THRESHOLD, ACTIVITY_TOP_K
+
+    # Warm-up LLM calls must not count towards the load-shedding latency
+    with load_monitor.exclude_latency():
+        response = await AgentService.process_message([WarmupMessage(query)])
+        if response.action != "extract" or not response.extraction_result:
+            return
+
+        mots_cles = response.extraction_result.get("activite", {}).get("mots_cles")
+        if not mots_cles:
+            return
+        activity_matcher = await get_activity_matcher()
+        matches = await asyncio.to_thread(
+            activity_matcher.find_similar_activities, mots_cles, ACTIVITY_TOP_K, ACTIVITY_THRESHOLD
+        )
+        if matches:
+            await AgentService._select_naf_codes(mots_cles, matches)
+
+
+def _cache_sizes() -> Dict[str, int]:
+    stats = cache_stats()
+    return {name: stats[name]["size"] for name in WARMED_CACHES if name in stats}
+
+
+async def warm_up(
+    queries: List[str],
+    concurrency: int = CACHE_WARMUP_CONCURRENCY,
+    rate: float = CACHE_WARMUP_RATE,
+) -> Dict[str, Any]:
+    """
+    Replay queries through the cached stages.
+
+    Args:
+        queries: Queries to replay, in order
+        concurrency: Queries in progress at the same time
+        rate: Queries started per second (0: no limit)
+
+    Returns:
+        Report: queries, errors, duration and cache sizes before/after
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    interval = 1.0 / rate if rate > 0 else 0.0
+    start = time.monotonic()
+    sizes_before = _cache_sizes()
+    errors = 0
+
+    async def replay(index: int, query: str) -> None:
+        nonlocal errors
+        # Start pacing: query i starts no earlier than start + i * interval
+        delay = start + index * interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            try:
+                await _warm_query(query)
+                metrics.increment("cache_warmup.queries")
+            except Exception as e:
+                errors += 1
+                metrics.increment("cache_warmup.errors")
+                print(f"[CacheWarmup] '{query[:60]}' failed: {e}")
+
+    await asyncio.gather(*(replay(i, q) for i, q in enumerate(queries)))
+
+    duration = time.monotonic() - start
+    metrics.observe("cache_warmup.duration", duration)
+    return {
+        "queries": len(queries),
+        "errors": errors,
+        "duration_s": round(duration, 1),
+        "cache_sizes_before": sizes_before,
+        "cache_sizes_after": _cache_sizes(),
+    }
+
+
+# ============================================================================
+# Startup
+# ============================================================================
+
+_warmup_task: Optional[asyncio.Task] = None
+
+
+def start_background_warmup(corpus: str = CACHE_WARMUP_CORPUS) -> Optional[asyncio.Task]:
+    """
+    Warm the caches in a background task (called from the startup event).
+
+    The task waits for the matchers, then replays the corpus. Readiness does
+    not depend on it: requests are served meanwhile. No-op without a corpus.
+    """
+    global _warmup_task
+    if not corpus:
+        return None
+
+    from services.readiness import ACTIVITY_MATCHER, LOCATION_MATCHER, readiness
+
+    async def run() -> None:
+        try:
+            queries = load_corpus(corpus, CACHE_WARMUP_LIMIT)
+            await readiness.wait(ACTIVITY_MATCHER, LOCATION_MATCHER, timeout=CACHE_WARMUP_READY_TIMEOUT)
+            print(f"[CacheWarmup] Replaying {len(queries)} queries from {corpus}...")
+            report = await warm_up(queries)
+            print(f"[CacheWarmup] Done in {report['duration_s']}s "
+                  f"({report['errors']} errors), cache sizes: {report['cache_sizes_after']}")
+        except Exception as e:
+            print(f"[CacheWarmup] Skipped: {e}")
+
+    _warmup_task = asyncio.get_running_loop().create_task(run(), name="cache-warmup")
+    return _warmup_task
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Warm the caches by replaying frequent queries")
+    parser.add_argument("corpus", help="JSON list, JSON lines or text file of queries")
+    parser.add_argument("--limit", type=int, default=CACHE_WARMUP_LIMIT)
+    parser.add_argument("--concurrency", type=int, default=CACHE_WARMUP_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=CACHE_WARMUP_RATE, help="Queries per second (0: no limit)")
+    args = parser.parse_args()
+
+    async def main() -> Dict[str, Any]:
+        from services.llm_client import close_llm_client, open_llm_client
+
+        await open_llm_client()
+        try:
+            return await warm_up(load_corpus(args.corpus, args.limit), args.concurrency, args.rate)
+        finally:
+            await close_llm_client()
+
+    report = asyncio.run(main())
+    print(f"Queries:  {report['queries']} ({report['errors']} errors) in {report['duration_s']}s")
+    for name, size in report["cache_sizes_after"].items():
+        print(f"{name:<16} {report['cache_sizes_before'].get(name, 0):>6} -> {size}")
@@ -0,0 +1,389 @@
+"""
+The chat request pipeline, shared by the JSON and SSE chat endpoints.
+
+    extraction -> embedding -> naf_selection -> api_request -> count -> response
+                           \\-> speculative_count --------------^
+
+- extraction: AgentService.process_message (LLM, cache, rules or classifier;
+  includes the location match and size transform)
+- embedding: activity search on the extracted mots_cles
+- speculative_count: starts counting with the likely NAF codes, alongside
+  the NAF selection
+- naf_selection: the LLM picks the relevant matches
+- api_request / count: transform the criteria and count the companies
+- response: the message shown to the user (streamed through on_chunk if given);
+  built from templates instead of the LLM under load or on request
+
+Stages whose inputs did not change since the previous turn reuse the
+previous output (see services.incremental). The SSE endpoint runs the graph
+up to "count", sends the metadata, then runs "response"; the JSON endpoint
+runs it whole.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from services.agent_service import (
+    AgentResponse,
+    AgentService,
+    ActivityMatch,
+    SearchResult,
+    SpeculativeCount,
+    _selected_naf_codes,
+)
+from services.incremental import IncrementalPlan
+from services.load_monitor import load_monitor
+from services.metrics import metrics
+from services.pipeline import DeadlineExceeded, Pipeline, PipelineRun, PipelineStage
+from services.response_templates import build_template_response
+
+# Activity search parameters of the embedding stage (also used by the cache
+# warm-up, which must produce the same cache keys)
+ACTIVITY_TOP_K = 5
+ACTIVITY_THRESHOLD = 0.3
+
+
+def start_chat(
+    messages: List[Any],
+    user_query: str = "",
+    previous_extraction: Optional[Dict[str, Any]] = None,
+    previous_activity_matches: Optional[List[ActivityMatch]] = None,
+    previous_company_count: Optional[int] = None,
+    previous_count_semantic: Optional[int] = None,
+    conversation_history: Optional[str] = None,
+    on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+    on_chunk: Optional[Callable[[str], None]] = None,
+    template_response: bool = False,
+) -> PipelineRun:
+    """
+    New run of the chat pipeline (its deadline starts now).
+
+    Args:
+        messages: Conversation history
+        user_query: Last user message
+        previous_extraction: Extraction of the previous turn
+        previous_activity_matches: Activity matches of the previous turn
+        previous_company_count: count_legal of the previous turn
+        previous_count_semantic: count_semantic of the previous turn
+        conversation_history: Formatted history for response generation
+        on_partial: Called with partial criteria while the extraction streams
+        on_chunk: Called with each chunk of the response message
+        template_response: Build the response from templates, without the LLM
+    """
+    return CHAT_PIPELINE.start({
+        "messages": messages,
+        "user_query": user_query,
+        "previous_extraction": previous_extraction,
+        "previous_activity_matches": previous_activity_matches,
+        "previous_company_count": previous_company_count,
+        "previous_count_semantic": previous_count_semantic,
+        "conversation_history": conversation_history,
+        "on_partial": on_partial,
+        "on_chunk": on_chunk,
+        "template_response": template_response,
+    })
+
+
+def _plan(run: PipelineRun) -> IncrementalPlan:
+    """Incremental plan of the run, created once the extraction is known."""
+    if "plan" not in run.state:
+        extraction = run["extraction"]
+        run.state["plan"] = IncrementalPlan(
+            run.inputs["previous_extraction"],
+            extraction.extraction_result,
+            reusable=AgentService.reusable_stages(
+                run.inputs["previous_activity_matches"],
+                run.inputs["previous_company_count"],
+            ),
+        )
+    return run.state["plan"]
+
+
+def _criteria(run: PipelineRun) -> Dict[str, Any]:
+    return run["extraction"].extraction_result
+
+
+# ============================================================================
+# Stages
+# ============================================================================
+
+async def _extraction(run: PipelineRun) -> AgentResponse:
+    response = await AgentService.process_message(
+        run.inputs["messages"],
+        previous_extraction=run.inputs["previous_extraction"],
+        on_partial=run.inputs["on_partial"],
+    )
+    if response.action != "extract" or not response.extraction_result:
+        # Too vague: nothing to search
+        run.halt()
+    return response
+
+
+async def _embedding(run: PipelineRun) -> Optional[List[tuple]]:
+    """Activity matches for the mots_cles, None if absent or reused."""
+    from services.activity_matcher import get_activity_matcher
+
+    mots_cles = _criteria(run).get("activite", {}).get("mots_cles")
+    if not mots_cles or not _plan(run).should_run("activity_match"):
+        return None
+
+    activity_matcher = await get_activity_matcher()
+    # Blocking: embeddings API call and shared cache tier
+    matches = await asyncio.to_thread(
+        activity_matcher.find_similar_activities, mots_cles, ACTIVITY_TOP_K, ACTIVITY_THRESHOLD
+    )
+    print(f"[Agent] Query terms '{mots_cles}' matches:")
+    for activity, score, codes in matches:
+        print(f"  - {activity} (score={score:.2f}) NAF: {codes}")
+    return matches
+
+
+def _original_activity_text(run: PipelineRun) -> Optional[str]:
+    """Activity text for the API semantic search."""
+    activite = _criteria(run).get("activite", {})
+    return activite.get("activite_entreprise") or activite.get("mots_cles")
+
+
+async def _speculative_count(run: PipelineRun) -> Optional[SpeculativeCount]:
+    """Count with the selection the LLM will most likely make."""
+    matches = run["embedding"]
+    if not matches:
+        return None
+    return AgentService._start_speculative_count(_criteria(run), matches, _original_activity_text(run))
+
+
+async def _naf_selection(run: PipelineRun) -> SearchResult:
+    result = SearchResult()
+    activite = _criteria(run).get("activite", {})
+    mots_cles = activite.get("mots_cles")
+    if not mots_cles:
+        return result
+
+    result.original_activity_text = _original_activity_text(run)
+    matches = run["embedding"]
+    previous_activity_matches = run.inputs["previous_activity_matches"]
+    if matches is not None:
+        selected_indices, explanation, no_good_match = await AgentService._select_naf_codes(
+            mots_cles, matches
+        )
+        print(f"[Agent] LLM selected indices: {selected_indices}, explanation: {explanation}")
+        run.state["selection_done_at"] = time.perf_counter()
+
+        for i, (activity, score, codes) in enumerate(matches):
+            result.activity_matches.append(ActivityMatch(
+                activity=activity,
+                naf_codes=codes,
+                score=score,
+                selected=i in selected_indices and not no_good_match
+            ))
+
+        if previous_activity_matches and (
+            _selected_naf_codes(result.activity_matches) == _selected_naf_codes(previous_activity_matches)
+        ):
+            _plan(run).output_unchanged("activity_match")
+    else:
+        print(f"[Agent] Query terms unchanged ('{mots_cles}'), reusing cached matches")
+        result.activity_matches = previous_activity_matches
+
+    result.naf_codes = _selected_naf_codes(result.activity_matches)
+    print(f"[Agent] Final NAF codes: {result.naf_codes}")
+    return result
+
+
+def _build_api_request(run: PipelineRun) -> Dict[str, Any]:
+    from services.api_transformer import transform_extraction_to_api_request
+
+    search = run["naf_selection"]
+    return transform_extraction_to_api_request(
+        _criteria(run),
+        search.naf_codes,
+        original_activity_text=search.original_activity_text
+    )
+
+
+async def _api_request(run: PipelineRun) -> Optional[Dict[str, Any]]:
+    """The API request, None if the criteria are unchanged."""
+    if not _plan(run).should_run("api_request"):
+        return None
+    api_request = _build_api_request(run)
+    print(f"[Agent] API request: {json.dumps(api_request, ensure_ascii=False)}")
+    return api_request
+
+
+async def _count(run: PipelineRun) -> SearchResult:
+    """
+    Count (or reuse the previous count) into the naf_selection result.
+
+    API errors are kept in SearchResult.api_error so the activity matches
+    are still returned.
+    """
+    from services.company_api_client import CompanyAPIError
+
+    result = run["naf_selection"]
+    speculative: Optional[SpeculativeCount] = run["speculative_count"]
+    if not _plan(run).should_run("count"):
+        result.company_count = run.inputs["previous_company_count"]
+        result.count_semantic = run.inputs["previous_count_semantic"]
+        print(f"[Agent] Criteria unchanged, reusing count {result.company_count}")
+        if speculative is not None:
+            speculative.task.cancel()
+            metrics.increment("count.speculative.unused")
+        return result
+
+    api_request = run["api_request"] or _build_api_request(run)
+    if speculative is not None:
+        speculative.selection_done_at = run.state.get("selection_done_at")
+    try:
+        api_response = await AgentService._resolve_count(api_request, speculative)
+        result.company_count = api_response.count  # count_legal
+        result.count_semantic = api_response.count_semantic  # count_semantic
+        result.api_result = api_response.data
+        print(f"[Agent] API returned count_legal={result.company_count}, count_semantic={result.count_semantic}")
+    except CompanyAPIError as e:
+        print(f"[Agent] API error: {e}")
+        result.api_error = e
+    return result
+
+
+def response_mode(run: PipelineRun) -> str:
+    """
+    How the response is produced: "error", "generate",
+    "template" (generate without the LLM: requested, or shedding load) or
+    "fallback".
+    """
+    if "response_mode" not in run.state:
+        search = run["count"]
+        if search.api_error is not None:
+            mode = "error"
+        elif run.inputs["user_query"] and search.activity_matches:
+            mode = "generate"
+            reason = "requested" if run.inputs["template_response"] else load_monitor.overload_reason()
+            if reason:
+                mode = "template"
+                metrics.increment(f"response.template.{reason}")
+                print(f"[Agent] Template response ({reason})")
+        else:
+            mode = "fallback"
+        run.state["response_mode"] = mode
+    return run.state["response_mode"]
+
+
+async def _response(run: PipelineRun) -> str:
+    search = run["count"]
+    extraction = run["extraction"]
+    on_chunk = run.inputs["on_chunk"]
+    mode = response_mode(run)
+
+    if mode == "generate":
+        metrics.increment("response.source.llm")
+        kwargs = dict(
+            user_query=run.inputs["user_query"],
+            company_count=search.company_count,
+            extraction_result=extraction.extraction_result,
+            activity_matches=search.activity_matches,
+            location_corrections=extraction.location_corrections,
+            conversation_history=run.inputs["conversation_history"],
+        )
+        if on_chunk is None:
+            return await AgentService._generate_contextual_response(**kwargs)
+        chunks = []
+        async for chunk in AgentService._generate_contextual_response_stream(**kwargs):
+            chunks.append(chunk)
+            on_chunk(chunk)
+        return "".join(chunks)
+
+    if mode == "template":
+        metrics.increment("response.source.template")
+        message = build_template_response(
+            search.company_count,
+            extraction.extraction_result,
+            search.activity_matches,
+            extraction.location_corrections,
+        )
+    elif mode == "error":
+        message = f"Critères extraits, mais impossible de contacter la base de données: {search.api_error}"
+    else:
+        print(f"[Agent] Using fallback message (user_query={bool(run.inputs['user_query'])}, "
+              f"activity_matches={bool(search.activity_matches)}, count={search.company_count})")
+        message = AgentService._fallback_message(search.company_count)
+    if on_chunk is not None:
+        on_chunk(message)
+    return message
+
+
+CHAT_PIPELINE = Pipeline("chat", [
+    PipelineStage("extraction", _extraction),
+    PipelineStage("embedding", _embedding, depends_on=("extraction",)),
+    PipelineStage("speculative_count", _speculative_count, depends_on=("embedding",)),
+    PipelineStage("naf_selection", _naf_selection, depends_on=("embedding",)),
+    PipelineStage("api_request", _api_request, depends_on=("naf_selection",)),
+    PipelineStage("count", _count, depends_on=("api_request", "speculative_count")),
+    PipelineStage("response", _response, depends_on=("count",)),
+])
+
+
+# ============================================================================
+# Results
+# ============================================================================
+
+def skipped_stages(run: PipelineRun) -> Optional[List[str]]:
+    """Stages reused from the previous turn (extraction and search)."""
+    skipped = list(run["extraction"].skipped_stages or [])
+    if "plan" in run.state:
+        skipped += run.state["plan"].skipped
+    return skipped or None
+
+
+def to_agent_response(run: PipelineRun) -> AgentResponse:
+    """AgentResponse of a run (the extraction response if it was rejected)."""
+    extraction = run["extraction"]
+    if run.halted:
+        return extraction
+
+    search = run["count"]
+    failed = search.api_error is not None
+    return AgentResponse(
+        action="extract",
+        message=run.outputs.get("response", ""),
+        extraction_result=extraction.extraction_result,
+        company_count=None if failed else search.company_count,
+        count_semantic=None if failed else search.count_semantic,
+        api_result=None if failed else search.api_result,
+        naf_codes=search.naf_codes or None,
+        activity_matches=search.activity_matches or None,
+        location_corrections=extraction.location_corrections,
+        extraction_source=extraction.extraction_source,
+        skipped_stages=skipped_stages(run),
+        stage_timings=run.timings_ms(),
+    )
+
+
+async def run_chat(run: PipelineRun) -> AgentResponse:
+    """
+    Run the whole pipeline and return the JSON endpoint's response.
+
+    Unexpected errors after a successful extraction still return the
+    criteria, with an error message.
+
+    Raises:
+        DeadlineExceeded: If the run's deadline passes
+    """
+    try:
+        await CHAT_PIPELINE.run(run)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        extraction = run.outputs.get("extraction")
+        if extraction is None or run.halted:
+            raise
+        print(f"[Agent] Unexpected error in the chat pipeline: {e}")
+        return AgentResponse(
+            action="extract",
+            message="Critères extraits. Une erreur est survenue lors de la recherche.",
+            extraction_result=extraction.extraction_result,
+            extraction_source=extraction.extraction_source,
+            stage_timings=run.timings_ms(),
+        )
+    return to_agent_response(run)
@@ -2,19 +2,84 @@
 Company Database API Client.
 
 HTTP client for querying the external company database API.
+
+The API endpoints await count_companies_async(), which goes through one
+shared `httpx.AsyncClient` (keep-alive pool, bounded connections, separate
+connect/read timeouts): no event-loop blocking and no handshake per count,
+and cancelling the awaiting task (e.g. a discarded speculative count)
+aborts the HTTP request. count_companies() is the blocking facade for
+scripts.
+
+Counts are cached by the canonical form of the request (see
+api_transformer.canonical_api_request), so toggling activity matches back
+and forth or rephrasing a query into the same criteria does not call the
+API again. Entries older than COUNT_CACHE_TTL are still served for
+COUNT_CACHE_STALE_TTL more seconds while a background call refreshes them;
+456 "criteria mismatch" answers are cached for COUNT_CACHE_NEGATIVE_TTL.
 """
 
+import asyncio
+import contextvars
+import copy
 import os
 import json
+import time
+import httpx
 import requests
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
 
+from services.api_transformer import canonical_api_request
+from services.cache import TieredCache
+from services.metrics import metrics
+from services.pipeline import DeadlineExceeded, remaining_timeout
+from services.singleflight import SingleFlight, ThreadSingleFlight, request_key
+
 
 # Configuration from environment
 COMPANY_API_URL = os.getenv("COMPANY_API_URL", "http://185.246.84.224:5001")
 COMPANY_API_KEY = os.getenv("COMPANY_API_KEY", "")
-API_TIMEOUT = int(os.getenv("COMPANY_API_TIMEOUT", "60"))
+API_TIMEOUT = int(os.getenv("COMPANY_API_TIMEOUT", "60"))  # Read timeout
+COMPANY_API_CONNECT_TIMEOUT = float(os.getenv("COMPANY_API_CONNECT_TIMEOUT", "5"))
+COMPANY_API_MAX_CONNECTIONS = int(os.getenv("COMPANY_API_MAX_CONNECTIONS", "20"))
+COMPANY_API_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("COMPANY_API_MAX_KEEPALIVE_CONNECTIONS", "10"))
+COMPANY_API_KEEPALIVE_EXPIRY = float(os.getenv("COMPANY_API_KEEPALIVE_EXPIRY", "60"))
+
+# Count cache (seconds): fresh for COUNT_CACHE_TTL, then served stale while
+# revalidating for COUNT_CACHE_STALE_TTL; 456 answers for COUNT_CACHE_NEGATIVE_TTL
+COUNT_CACHE_ENABLED = os.getenv("COUNT_CACHE_ENABLED", "true").lower() == "true"
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "5000"))
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "3600"))
+COUNT_CACHE_STALE_TTL = float(os.getenv("COUNT_CACHE_STALE_TTL", "82800"))
+COUNT_CACHE_NEGATIVE_TTL = float(os.getenv("COUNT_CACHE_NEGATIVE_TTL", "600"))
+
+_count_cache = TieredCache("company_count", COUNT_CACHE_SIZE, COUNT_CACHE_TTL + COUNT_CACHE_STALE_TTL)
+_revalidations: Dict[str, "asyncio.Task"] = {}
+
+# Identical counts in flight (same criteria from several users, or the
+# speculative count and the confirmed one) share one API call
+_count_flights = SingleFlight("count")
+_sync_count_flights = ThreadSingleFlight("count_sync")
+
+
+def _entry_ttl(entry: Dict[str, Any]) -> float:
+    if entry.get("error_status"):
+        return COUNT_CACHE_NEGATIVE_TTL
+    return COUNT_CACHE_TTL + COUNT_CACHE_STALE_TTL
+
+
+def count_cache_stats() -> Dict[str, Any]:
+    """Count cache effectiveness since startup (GET /metrics)."""
+    requests_ = metrics.counter("count_cache.requests")
+    misses = metrics.counter("count_cache.miss")
+    return {
+        "requests": requests_,
+        "misses": misses,
+        "stale": metrics.counter("count_cache.stale"),
+        "negative_hits": metrics.counter("count_cache.negative_hit"),
+        "revalidated": metrics.counter("count_cache.revalidated"),
+        "hit_rate": (requests_ - misses) / requests_ if requests_ else None,
+    }
 
 
 @dataclass
@@ -59,10 +124,30 @@ class CompanyAPIClient:
         self.base_url = (base_url or COMPANY_API_URL).rstrip('/')
         self.api_key = api_key or COMPANY_API_KEY
         self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
 
         if not self.api_key:
             print("[CompanyAPIClient] WARNING: No API key configured. Set COMPANY_API_KEY environment variable.")
 
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared connection pool (created lazily)."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=COMPANY_API_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=COMPANY_API_MAX_CONNECTIONS,
+                    max_keepalive_connections=COMPANY_API_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=COMPANY_API_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     def _get_headers(self) -> Dict[str, str]:
         """Get request headers with authentication."""
         headers = {
@@ -73,7 +158,62 @@ class CompanyAPIClient:
             headers["X-API-Key"] = self.api_key
         return headers
 
-    def count_companies(self, criteria: Dict[str, Any]) -> APIResponse:
+    def _timeout(self) -> float:
+        """Read timeout, capped by the chat request deadline when called from the pipeline."""
+        try:
+            return remaining_timeout(self.timeout)
+        except DeadlineExceeded as e:
+            raise CompanyAPIError(str(e), status_code=None)
+
+    @staticmethod
+    def _parse_response(status_code: int, text: str) -> APIResponse:
+        """
+        APIResponse from the HTTP status and body.
+
+        Raises:
+            CompanyAPIError: For any status other than 200
+        """
+        if status_code == 200:
+            try:
+                data = json.loads(text)
+            except ValueError:
+                raise CompanyAPIError(f"Invalid JSON response: {text[:200]}", status_code=200)
+            # API returns count_legal as the main count
+            count = data.get("count_legal", data.get("count", 0))
+            count_semantic = data.get("count_semantic", data.get("count_semantic", 0))
+            return APIResponse(
+                success=True,
+                count=count,
+                count_semantic=count_semantic,
+                data=data,
+            )
+
+        elif status_code == 401:
+            raise CompanyAPIError(
+                "Unauthorized: Invalid or missing API key",
+                status_code=401
+            )
+
+        elif status_code == 400:
+            error_data = json.loads(text) if text else {}
+            raise CompanyAPIError(
+                f"Bad request: {error_data.get('error', 'Invalid JSON')}",
+                status_code=400
+            )
+
+        elif status_code == 456:
+            raise CompanyAPIError(
+                "Criteria mismatch: The provided criteria are incompatible",
+                status_code=456
+            )
+
+        else:
+            raise CompanyAPIError(
+                f"API error: {status_code} - {text[:200]}",
+                status_code=status_code
+            )
+
+    async def count_companies_async(self, criteria: Dict[str, Any]) -> APIResponse:
         """
         Query the API for company count matching criteria.
 
@@ -90,60 +230,130 @@ class CompanyAPIClient:
         Returns:
             APIResponse with count and data
 
+        Raises:
+            CompanyAPIError: If the API call fails (also from a cached 456)
+        """
+        key = request_key(self.base_url, canonical_api_request(criteria))
+        if not COUNT_CACHE_ENABLED:
+            return await _count_flights.do(key, lambda: self._count_companies_async(criteria))
+
+        async def fetch() -> Dict[str, Any]:
+            metrics.increment("count_cache.miss")
+            return await self._fetch_entry(criteria)
+
+        metrics.increment("count_cache.requests")
+        entry = await _count_cache.get_or_compute(key, fetch, ttl_for=_entry_ttl)
+        negative = bool(entry.get("error_status"))
+        # A negative entry copied from the shared tier may outlive its own TTL locally
+        if time.time() - entry["fetched_at"] >= (COUNT_CACHE_NEGATIVE_TTL if negative else COUNT_CACHE_TTL):
+            metrics.increment("count_cache.stale")
+            self._revalidate(key, criteria)
+        if negative:
+            metrics.increment("count_cache.negative_hit")
+            raise CompanyAPIError(entry["error"], status_code=entry["error_status"])
+        return APIResponse(
+            success=True,
+            count=entry["count"],
+            count_semantic=entry["count_semantic"],
+            data=copy.deepcopy(entry["data"]),
+        )
+
+    async def _fetch_entry(self, criteria: Dict[str, Any]) -> Dict[str, Any]:
+        """Count cache entry for criteria; 456 answers become negative entries."""
+        try:
+            response = await self._count_companies_async(criteria)
+        except CompanyAPIError as e:
+            if e.status_code != 456:
+                raise
+            return {"error_status": 456, "error": str(e), "fetched_at": time.time()}
+        return {
+            "count": response.count,
+            "count_semantic": response.count_semantic,
+            "data": response.data,
+            "fetched_at": time.time(),
+        }
+
+    def _revalidate(self, key: str, criteria: Dict[str, Any]) -> None:
+        """Refresh a stale count in the background (once per key at a time)."""
+        if key in _revalidations:
+            return
+
+        async def refresh() -> None:
+            try:
+                entry = await self._fetch_entry(criteria)
+                await _count_cache.set(key, entry, ttl=_entry_ttl(entry))
+                metrics.increment("count_cache.revalidated")
+            except Exception as e:
+                metrics.increment("count_cache.revalidate_errors")
+                print(f"[CompanyAPIClient] Count revalidation failed: {e}")
+            finally:
+                _revalidations.pop(key, None)
+
+        # Fresh context: the refresh is not bound by the request's deadline
+        _revalidations[key] = asyncio.get_running_loop().create_task(
+            refresh(), context=contextvars.Context()
+        )
+
+    async def _count_companies_async(self, criteria: Dict[str, Any]) -> APIResponse:
+        endpoint = f"{self.base_url}/count_bot_v1"
+        timeout = self._timeout()
+
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(
+                endpoint,
+                headers=self._get_headers(),
+                json=criteria,
+                timeout=httpx.Timeout(timeout, connect=min(COMPANY_API_CONNECT_TIMEOUT, timeout)),
+            )
+        except httpx.TimeoutException as e:
+            metrics.increment("company_api.count.errors")
+            raise CompanyAPIError(
+                f"Request timeout after {timeout:.0f} seconds ({type(e).__name__})",
+                status_code=None
+            )
+        except httpx.TransportError as e:
+            metrics.increment("company_api.count.errors")
+            raise CompanyAPIError(
+                f"Connection error: Unable to reach API at {self.base_url}",
+                status_code=None
+            )
+        finally:
+            metrics.observe("company_api.count.latency", time.perf_counter() - start)
+
+        try:
+            return self._parse_response(response.status_code, response.text)
+        except CompanyAPIError:
+            metrics.increment("company_api.count.errors")
+            raise
+
+    def count_companies(self, criteria: Dict[str, Any]) -> APIResponse:
+        """
+        Blocking count_companies_async() for scripts (one connection per
+        call, not cached).
+
         Raises:
             CompanyAPIError: If the API call fails
         """
+        key = request_key(self.base_url, criteria)
+        return _sync_count_flights.do(key, lambda: self._count_companies(criteria))
+
+    def _count_companies(self, criteria: Dict[str, Any]) -> APIResponse:
         endpoint = f"{self.base_url}/count_bot_v1"
+        timeout = self._timeout()
 
         try:
             response = requests.post(
                 endpoint,
                 headers=self._get_headers(),
                 json=criteria,
-                timeout=self.timeout,
+                timeout=(min(COMPANY_API_CONNECT_TIMEOUT, timeout), timeout),
             )
-
-            # Handle response codes
-            if response.status_code == 200:
-                data = response.json()
-                # API returns count_legal as the main count
-                count = data.get("count_legal", data.get("count", 0))
-                count_semantic = data.get("count_semantic", data.get("count_semantic", 0))
-                return APIResponse(
-                    success=True,
-                    count=count,
-                    count_semantic=count_semantic,
-                    data=data,
-                )
-            
-            elif response.status_code == 401:
-                raise CompanyAPIError(
-                    "Unauthorized: Invalid or missing API key",
-                    status_code=401
-                )
-
-            elif response.status_code == 400:
-                error_data = response.json() if response.text else {}
-                raise CompanyAPIError(
-                    f"Bad request: {error_data.get('error', 'Invalid JSON')}",
-                    status_code=400
-                )
-
-            elif response.status_code == 456:
-                raise CompanyAPIError(
-                    "Criteria mismatch: The provided criteria are incompatible",
-                    status_code=456
-                )
-
-            else:
-                raise CompanyAPIError(
-                    f"API error: {response.status_code} - {response.text[:200]}",
-                    status_code=response.status_code
-                )
+            return self._parse_response(response.status_code, response.text)
 
         except requests.exceptions.Timeout:
             raise CompanyAPIError(
-                f"Request timeout after {self.timeout} seconds",
+                f"Request timeout after {timeout:.0f} seconds",
                 status_code=None
             )
 
@@ -189,10 +399,23 @@ def get_company_api_client() -> CompanyAPIClient:
     return _client
 
 
+async def open_company_api_client() -> CompanyAPIClient:
+    """Create the shared client at startup so the pool lives for the app lifespan."""
+    client = get_company_api_client()
+    client.client  # Instantiate the pool now rather than on the first request
+    return client
+
+
+async def close_company_api_client() -> None:
+    """Close the shared connection pool (called from the shutdown event)."""
+    if _client is not None:
+        await _client.aclose()
+
+
 # Convenience function
 def count_companies(criteria: Dict[str, Any]) -> APIResponse:
     """
-    Convenience function to count companies matching criteria.
+    Convenience function to count companies matching criteria (blocking).
 
     Args:
         criteria: Search criteria in API format
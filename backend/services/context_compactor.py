@@ -0,0 +1,159 @@
+"""
+Conversation context compaction.
+
+The API is stateless: every turn resends the whole conversation, so without
+compaction the extraction and response prompts grow with each turn. Only the
+last CONTEXT_KEEP_TURNS user turns (and the agent replies between them) are
+kept verbatim; older turns are dropped because the current criteria, sent as
+compact JSON next to the history, already carry what they established.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from services.metrics import metrics
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+CONTEXT_COMPACTION_ENABLED = os.getenv("CONTEXT_COMPACTION_ENABLED", "true").lower() == "true"
+# User turns kept verbatim (with the agent replies that follow them)
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "3"))
+
+# Rough token estimate for French text with the Gemini/GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+OLDER_TURNS_NOTE = "[{count} message(s) précédent(s) résumé(s) par les critères actuels]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count (no tokenizer dependency)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _role(msg: Any) -> str:
+    """Role of a message object or dict (enum or string)."""
+    role = msg.get("role") if isinstance(msg, dict) else msg.role
+    return role.value if hasattr(role, "value") else role
+
+
+def _content(msg: Any) -> str:
+    return msg.get("content", "") if isinstance(msg, dict) else msg.content
+
+
+def format_messages(messages: List[Any]) -> str:
+    """One "Utilisateur: ..." / "Agent: ..." line per message."""
+    return "\n".join(
+        f"{'Utilisateur' if _role(msg) == 'user' else 'Agent'}: {_content(msg)}"
+        for msg in messages
+    )
+
+
+def compact_criteria(criteria: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Drop absent sections and null fields from extracted criteria.
+
+    Sections with present=false carry no information, and null fields are
+    the schema default, so the LLM reads the same criteria in far fewer tokens.
+    """
+    compacted = {}
+    for key, value in criteria.items():
+        if isinstance(value, dict):
+            if value.get("present") is False:
+                continue
+            value = {k: v for k, v in value.items() if v is not None}
+        elif value is None:
+            continue
+        compacted[key] = value
+    return compacted
+
+
+def compact_json(data: Any) -> str:
+    """JSON without indentation or spaces after separators."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+# ============================================================================
+# Compaction
+# ============================================================================
+
+@dataclass
+class CompactedHistory:
+    """A formatted conversation, possibly truncated to its recent turns"""
+    text: str
+    kept_messages: int
+    dropped_messages: int
+    tokens: int  # Estimated tokens of `text`
+    full_tokens: int  # Estimated tokens of the uncompacted history
+
+
+def compact_history(
+    messages: List[Any],
+    keep_turns: Optional[int] = None,
+    label: str = "history"
+) -> CompactedHistory:
+    """
+    Format the conversation keeping only the last `keep_turns` user turns.
+
+    Args:
+        messages: Message objects (role/content attributes) or dicts
+        keep_turns: User turns to keep verbatim (default CONTEXT_KEEP_TURNS)
+        label: Metrics label ("extraction", "response"...)
+    """
+    if keep_turns is None:
+        keep_turns = CONTEXT_KEEP_TURNS
+
+    start = 0
+    if CONTEXT_COMPACTION_ENABLED and keep_turns > 0:
+        user_turns = 0
+        for i in range(len(messages) - 1, -1, -1):
+            if _role(messages[i]) == "user":
+                user_turns += 1
+                if user_turns == keep_turns:
+                    start = i
+                    break
+
+    kept = messages[start:]
+    text = format_messages(kept)
+    if start:
+        text = OLDER_TURNS_NOTE.format(count=start) + "\n" + text
+
+    tokens = estimate_tokens(text)
+    full_tokens = estimate_tokens(format_messages(messages)) if start else tokens
+    metrics.increment(f"context.{label}.dropped_messages", start)
+    metrics.increment(f"context.{label}.tokens_saved", full_tokens - tokens)
+    return CompactedHistory(
+        text=text,
+        kept_messages=len(kept),
+        dropped_messages=start,
+        tokens=tokens,
+        full_tokens=full_tokens,
+    )
+
+
+def count_user_turns(messages: List[Any]) -> int:
+    """Turn number of a conversation (its user messages)."""
+    return sum(1 for msg in messages if _role(msg) == "user")
+
+
+def record_prompt_tokens(
+    label: str,
+    llm_messages: List[Dict[str, str]],
+    turn: Optional[int] = None
+) -> int:
+    """
+    Estimate and report the prompt size of an LLM call.
+
+    Observed per call type as context.{label}.prompt_tokens and, when the turn
+    number is known, as context.{label}.turn_{turn}.prompt_tokens (capped at
+    10) so growth across a session stays visible on /metrics.
+    """
+    tokens = sum(estimate_tokens(m.get("content", "")) for m in llm_messages)
+    metrics.observe(f"context.{label}.prompt_tokens", tokens)
+    if turn is not None:
+        metrics.observe(f"context.{label}.turn_{min(turn, 10)}.prompt_tokens", tokens)
+    print(f"[Context] {label} prompt: ~{tokens} tokens" + (f" (turn {turn})" if turn is not None else ""))
+    return tokens
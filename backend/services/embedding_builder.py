@@ -0,0 +1,320 @@
+"""
+Embedding Builder for the activity index.
+
+Generates activity embeddings with several concurrent batches, a shared
+request-rate limit and retries that honour `Retry-After`. Completed batches
+are checkpointed to disk so an interrupted build resumes where it left off.
+
+Usage (from backend/):
+    python -m services.embedding_builder
+    python -m services.embedding_builder --concurrency 8 --rpm 1000 --dimensions 512
+"""
+
+import asyncio
+import hashlib
+import os
+import pickle
+import random
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from services.activity_matcher import (
+    DATA_DIR,
+    OPENAI_API_KEY,
+    OPENAI_EMBEDDING_DIMENSIONS,
+    OPENAI_EMBEDDING_MODEL,
+    _embedding_request_body,
+    normalize_embeddings,
+    save_embeddings_cache,
+)
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+OPENAI_EMBEDDINGS_URL = "https://api.openai.com/v1/embeddings"
+EMBEDDING_BUILD_BATCH_SIZE = int(os.getenv("EMBEDDING_BUILD_BATCH_SIZE", "100"))
+EMBEDDING_BUILD_CONCURRENCY = int(os.getenv("EMBEDDING_BUILD_CONCURRENCY", "4"))
+EMBEDDING_BUILD_RPM = int(os.getenv("EMBEDDING_BUILD_RPM", "300"))  # Requests per minute
+EMBEDDING_BUILD_MAX_RETRIES = int(os.getenv("EMBEDDING_BUILD_MAX_RETRIES", "6"))
+CHECKPOINT_FILE = DATA_DIR / "activites_embeddings_openai.partial.pkl"
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class EmbeddingBuildError(Exception):
+    """Raised when the embedding build cannot complete."""
+
+
+# ============================================================================
+# Rate Limiting
+# ============================================================================
+
+class RateLimiter:
+    """
+    Spaces requests evenly to stay under a requests-per-minute budget.
+
+    A `Retry-After` from the server pauses every worker, not just the one
+    that received it.
+    """
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait for the next request slot."""
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Block all new requests for `seconds`."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Read the server-requested delay (retry-after-ms, Retry-After seconds or HTTP date)."""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# ============================================================================
+# Embedding Builder
+# ============================================================================
+
+class EmbeddingBuilder:
+    """Builds the activity embedding matrix with concurrency, rate limiting and checkpoints."""
+
+    def __init__(
+        self,
+        activities: List[str],
+        dimensions: Optional[int] = OPENAI_EMBEDDING_DIMENSIONS,
+        batch_size: int = EMBEDDING_BUILD_BATCH_SIZE,
+        concurrency: int = EMBEDDING_BUILD_CONCURRENCY,
+        requests_per_minute: int = EMBEDDING_BUILD_RPM,
+        max_retries: int = EMBEDDING_BUILD_MAX_RETRIES,
+        checkpoint_path: Path = CHECKPOINT_FILE,
+    ):
+        self.activities = activities
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.checkpoint_path = checkpoint_path
+
+        self.total_batches = (len(activities) + batch_size - 1) // batch_size
+        self._completed: Dict[int, np.ndarray] = {}
+        self._checkpoint_lock = asyncio.Lock()
+
+    @property
+    def progress(self) -> float:
+        """Fraction of batches completed (0-1)."""
+        if not self.total_batches:
+            return 1.0
+        return len(self._completed) / self.total_batches
+
+    def _fingerprint(self) -> str:
+        """Identify the build inputs so a checkpoint is only reused for the same build."""
+        digest = hashlib.sha256()
+        for part in (OPENAI_EMBEDDING_MODEL, str(self.dimensions), str(self.batch_size), *self.activities):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _load_checkpoint(self) -> None:
+        """Restore completed batches from a previous interrupted build."""
+        if not self.checkpoint_path.exists():
+            return
+        try:
+            with open(self.checkpoint_path, "rb") as f:
+                data = pickle.load(f)
+            if data.get("fingerprint") != self._fingerprint():
+                print("[EmbeddingBuilder] Checkpoint is for a different build, ignoring")
+                return
+            self._completed = dict(data.get("batches", {}))
+            print(f"[EmbeddingBuilder] Resuming: {len(self._completed)}/{self.total_batches} batches done")
+        except Exception as e:
+            print(f"[EmbeddingBuilder] Failed to load checkpoint: {e}")
+
+    async def _save_checkpoint(self) -> None:
+        """Atomically write completed batches to disk."""
+        async with self._checkpoint_lock:
+            snapshot = {"fingerprint": self._fingerprint(), "batches": dict(self._completed)}
+            tmp_path = self.checkpoint_path.with_suffix(".tmp")
+            try:
+                self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(snapshot, f)
+                os.replace(tmp_path, self.checkpoint_path)
+            except Exception as e:
+                print(f"[EmbeddingBuilder] Failed to save checkpoint: {e}")
+
+    async def _embed_batch(
+        self,
+        client: httpx.AsyncClient,
+        limiter: RateLimiter,
+        batch_index: int
+    ) -> np.ndarray:
+        """Embed one batch, retrying transient failures."""
+        start = batch_index * self.batch_size
+        texts = self.activities[start:start + self.batch_size]
+
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            delay: Optional[float] = None
+            try:
+                response = await client.post(
+                    OPENAI_EMBEDDINGS_URL,
+                    json=_embedding_request_body(texts, self.dimensions),
+                )
+                if response.status_code == 200:
+                    data = response.json()["data"]
+                    vectors = [item["embedding"] for item in sorted(data, key=lambda x: x["index"])]
+                    return np.array(vectors, dtype=np.float32)
+
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise EmbeddingBuildError(
+                        f"Batch {batch_index}: HTTP {response.status_code} - {response.text[:200]}"
+                    )
+
+                delay = parse_retry_after(response.headers)
+                if response.status_code == 429 and delay is not None:
+                    limiter.pause(delay)
+                error = f"HTTP {response.status_code}"
+
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt == self.max_retries:
+                raise EmbeddingBuildError(f"Batch {batch_index}: giving up after {attempt + 1} attempts ({error})")
+
+            if delay is None:
+                delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+            print(f"[EmbeddingBuilder] Batch {batch_index} failed ({error}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        raise EmbeddingBuildError(f"Batch {batch_index}: no attempt made")
+
+    async def build(self) -> np.ndarray:
+        """
+        Build, save and return the normalized embedding matrix.
+
+        Raises:
+            EmbeddingBuildError: If the API key is missing or a batch keeps failing
+        """
+        if not OPENAI_API_KEY:
+            raise EmbeddingBuildError("OPENAI_API_KEY not set")
+
+        self._load_checkpoint()
+        pending = [i for i in range(self.total_batches) if i not in self._completed]
+        print(f"[EmbeddingBuilder] {len(pending)} batches to embed "
+              f"(concurrency={self.concurrency}, rpm={self.requests_per_minute})")
+
+        limiter = RateLimiter(self.requests_per_minute)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+            timeout=httpx.Timeout(120.0, connect=10.0),
+            limits=httpx.Limits(max_connections=self.concurrency),
+        ) as client:
+
+            async def run(batch_index: int) -> None:
+                async with semaphore:
+                    self._completed[batch_index] = await self._embed_batch(client, limiter, batch_index)
+                await self._save_checkpoint()
+                print(f"[EmbeddingBuilder] Batch {batch_index + 1}/{self.total_batches} done "
+                      f"({self.progress:.0%})")
+
+            tasks = [asyncio.create_task(run(i)) for i in pending]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+        embeddings = normalize_embeddings(
+            np.concatenate([self._completed[i] for i in range(self.total_batches)])
+        )
+        if save_embeddings_cache(self.activities, embeddings, dimensions=self.dimensions):
+            self.checkpoint_path.unlink(missing_ok=True)
+        return embeddings
+
+
+# ============================================================================
+# Background Task
+# ============================================================================
+
+def start_background_build(activities: List[str], **kwargs) -> "asyncio.Task[np.ndarray]":
+    """Run an EmbeddingBuilder as a background task on the running event loop."""
+    builder = EmbeddingBuilder(activities, **kwargs)
+    return asyncio.get_running_loop().create_task(builder.build(), name="embedding-build")
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    from services.activity_matcher import ActivityMatcher
+
+    parser = argparse.ArgumentParser(description="Build the activity embeddings cache")
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_BUILD_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=EMBEDDING_BUILD_RPM, help="Max requests per minute")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BUILD_BATCH_SIZE)
+    parser.add_argument("--dimensions", type=int, default=OPENAI_EMBEDDING_DIMENSIONS)
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    matcher = ActivityMatcher()
+    if not matcher.load_reference_data():
+        raise SystemExit(1)
+
+    if args.restart:
+        CHECKPOINT_FILE.unlink(missing_ok=True)
+
+    builder = EmbeddingBuilder(
+        matcher.activities,
+        dimensions=args.dimensions,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+    )
+    try:
+        result = asyncio.run(builder.build())
+        print(f"[EmbeddingBuilder] Done: {result.shape[0]} x {result.shape[1]}")
+    except EmbeddingBuildError as e:
+        print(f"[EmbeddingBuilder] Build failed: {e} (progress is checkpointed, rerun to resume)")
+        raise SystemExit(1)
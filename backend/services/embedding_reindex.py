@@ -0,0 +1,196 @@
+"""
+Embedding re-indexing tool for the activity matcher.
+
+Migrates the stored activity embeddings to a different output size, either by
+truncating and renormalizing the existing vectors (no API calls) or by
+re-embedding every label with the `dimensions` parameter. Also compares the
+top-k recall of reduced indexes against the full index on a query corpus.
+
+Usage (from backend/):
+    python -m services.embedding_reindex migrate --dimensions 512
+    python -m services.embedding_reindex migrate --dimensions 256 --reembed
+    python -m services.embedding_reindex compare --dataset ../synthetic_dataset.json --dimensions 256 512 1024
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services.activity_matcher import (
+    OPENAI_EMBEDDING_MODEL,
+    get_openai_embeddings_batch,
+    load_embeddings_cache,
+    normalize_embeddings,
+    save_embeddings_cache,
+    truncate_embeddings,
+)
+
+BATCH_SIZE = 100
+DEFAULT_DATASET = Path(__file__).parent.parent.parent / "synthetic_dataset.json"
+
+
+# ============================================================================
+# Migration
+# ============================================================================
+
+def _embed_all(texts: List[str], dimensions: Optional[int]) -> Optional[np.ndarray]:
+    """Embed texts in batches with the given output size."""
+    vectors: List[List[float]] = []
+    for i in range(0, len(texts), BATCH_SIZE):
+        batch = get_openai_embeddings_batch(texts[i:i + BATCH_SIZE], dimensions=dimensions)
+        if batch is None:
+            return None
+        vectors.extend(batch)
+    return normalize_embeddings(np.array(vectors, dtype=np.float32))
+
+
+def migrate(dimensions: int, reembed: bool = False) -> bool:
+    """
+    Rewrite the embeddings cache at `dimensions`.
+
+    Args:
+        dimensions: Target vector size
+        reembed: Re-embed every activity via the API instead of truncating
+
+    Returns:
+        True if the cache was rewritten
+    """
+    data = load_embeddings_cache()
+    if data is None:
+        print("[EmbeddingReindex] No embeddings cache found")
+        return False
+
+    activities = data["activities"]
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    print(f"[EmbeddingReindex] Current index: {len(activities)} x {embeddings.shape[1]} ({data.get('model')})")
+
+    if reembed:
+        print(f"[EmbeddingReindex] Re-embedding {len(activities)} activities at {dimensions} dims...")
+        new_embeddings = _embed_all(activities, dimensions)
+        if new_embeddings is None:
+            print("[EmbeddingReindex] Re-embedding failed")
+            return False
+        model = OPENAI_EMBEDDING_MODEL
+    else:
+        if data.get("model") != OPENAI_EMBEDDING_MODEL:
+            print(f"[EmbeddingReindex] Cache model '{data.get('model')}' differs from '{OPENAI_EMBEDDING_MODEL}', use --reembed")
+            return False
+        try:
+            new_embeddings = truncate_embeddings(embeddings, dimensions)
+        except ValueError as e:
+            print(f"[EmbeddingReindex] {e}, use --reembed")
+            return False
+        model = data["model"]
+
+    return save_embeddings_cache(activities, new_embeddings, model=model, dimensions=dimensions)
+
+
+# ============================================================================
+# Recall comparison
+# ============================================================================
+
+def _load_queries(dataset_path: Path) -> List[str]:
+    """Extract activity queries from a synthetic dataset (one per sample)."""
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        samples = json.load(f)
+
+    queries = []
+    for sample in samples:
+        activite = sample.get("expected_output", {}).get("activite", {})
+        if not activite.get("present"):
+            continue
+        query = activite.get("libelle_secteur") or activite.get("activite_entreprise") or sample.get("input")
+        if query and query not in queries:
+            queries.append(query)
+    return queries
+
+
+def _top_k(index: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best matches for each query row."""
+    similarities = queries @ index.T
+    return np.argsort(-similarities, axis=1)[:, :k]
+
+
+def compare_recall(
+    dataset_path: Path,
+    dimensions_list: List[int],
+    top_k: int = 5
+) -> List[Dict[str, Any]]:
+    """
+    Compare reduced indexes against the full-size index.
+
+    Queries are embedded once at full size; reduced query vectors and indexes
+    are obtained by truncation. Recall@k is the overlap between the reduced
+    top-k and the full top-k.
+    """
+    data = load_embeddings_cache()
+    if data is None:
+        raise RuntimeError("No embeddings cache found")
+
+    full_index = normalize_embeddings(data["embeddings"])
+    full_size = full_index.shape[1]
+
+    queries = _load_queries(dataset_path)
+    print(f"[EmbeddingReindex] {len(queries)} queries from {dataset_path}")
+    query_vectors = _embed_all(queries, data.get("dimensions"))
+    if query_vectors is None:
+        raise RuntimeError("Failed to embed queries")
+
+    reference = _top_k(full_index, query_vectors, top_k)
+
+    rows = []
+    for dimensions in sorted(set(dimensions_list + [full_size])):
+        if dimensions > full_size:
+            continue
+        index = truncate_embeddings(full_index, dimensions)
+        vectors = truncate_embeddings(query_vectors, dimensions)
+
+        start = time.perf_counter()
+        results = _top_k(index, vectors, top_k)
+        elapsed = time.perf_counter() - start
+
+        overlaps = [len(set(r) & set(ref)) / top_k for r, ref in zip(results, reference)]
+        top1 = [r[0] == ref[0] for r, ref in zip(results, reference)]
+        rows.append({
+            "dimensions": dimensions,
+            f"recall@{top_k}": float(np.mean(overlaps)),
+            "top1_agreement": float(np.mean(top1)),
+            "index_bytes": int(index.nbytes),
+            "search_ms_per_query": elapsed * 1000 / max(len(queries), 1),
+        })
+    return rows
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-index activity embeddings")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Rewrite the cache at a new size")
+    migrate_parser.add_argument("--dimensions", type=int, required=True)
+    migrate_parser.add_argument("--reembed", action="store_true", help="Re-embed instead of truncating")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare recall of reduced indexes")
+    compare_parser.add_argument("--dataset", type=Path, default=DEFAULT_DATASET)
+    compare_parser.add_argument("--dimensions", type=int, nargs="+", default=[256, 512, 1024])
+    compare_parser.add_argument("--top-k", type=int, default=5)
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        ok = migrate(args.dimensions, reembed=args.reembed)
+        raise SystemExit(0 if ok else 1)
+
+    rows = compare_recall(args.dataset, args.dimensions, top_k=args.top_k)
+    recall_key = f"recall@{args.top_k}"
+    print(f"\n{'dims':>6} {recall_key:>10} {'top1':>7} {'index KB':>10} {'ms/query':>10}")
+    for row in rows:
+        print(f"{row['dimensions']:>6} {row[recall_key]:>10.3f} {row['top1_agreement']:>7.3f} "
+              f"{row['index_bytes'] / 1024:>10.0f} {row['search_ms_per_query']:>10.4f}")
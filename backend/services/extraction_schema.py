@@ -0,0 +1,361 @@
+"""
+Compact extraction output schema.
+
+In the full output mode the extraction LLM writes every section and every
+field, mostly nulls and "present": false. In compact mode it writes a flat
+object with short keys for the fields it found only:
+
+    {"a": "x", "reg": "Bretagne", "act": "Restauration", "kw": "restauration restaurant", "eff": "PME"}
+    {"a": "r", "msg": "Bonjour ! Quel type d'entreprise recherchez-vous ?"}
+
+expand_compact() rebuilds the full structure the rest of the pipeline
+expects, so output tokens (and generation latency) scale with the number of
+criteria instead of the size of the schema.
+
+Usage:
+    python -m services.extraction_schema estimate --dataset ../synthetic_dataset.json
+    python -m services.extraction_schema benchmark --dataset ../synthetic_dataset.json --limit 50
+"""
+
+import copy
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+# "full" (every field) or "compact" (short keys, present fields only)
+EXTRACTION_OUTPUT_MODE = os.getenv("EXTRACTION_OUTPUT_MODE", "full").lower()
+OUTPUT_MODES = ("full", "compact")
+
+if EXTRACTION_OUTPUT_MODE not in OUTPUT_MODES:
+    print(f"[ExtractionSchema] Unknown EXTRACTION_OUTPUT_MODE '{EXTRACTION_OUTPUT_MODE}', using 'full'")
+    EXTRACTION_OUTPUT_MODE = "full"
+
+# Full output of the extraction LLM (before location/size post-processing)
+EMPTY_EXTRACTION: Dict[str, Dict[str, Any]] = {
+    "localisation": {
+        "present": False,
+        "code_postal": None,
+        "departement": None,
+        "region": None,
+        "commune": None,
+    },
+    "activite": {
+        "present": False,
+        "activite_entreprise": None,
+        "mots_cles": None,
+    },
+    "taille_entreprise": {
+        "present": False,
+        "effectif_expression": None,
+    },
+    "criteres_financiers": {
+        "present": False,
+        "ca_plus_recent": None,
+        "resultat_net_plus_recent": None,
+        "rentabilite_plus_recente": None,
+    },
+    "criteres_juridiques": {
+        "present": False,
+        "categorie_juridique": None,
+        "siege_entreprise": None,
+        "date_creation_entreprise_min": None,
+        "date_creation_entreprise_max": None,
+        "capital": None,
+        "nombre_etablissements": None,
+    },
+}
+
+# Short key -> (section, field)
+SHORT_KEYS: Dict[str, Tuple[str, str]] = {
+    "cp": ("localisation", "code_postal"),
+    "dep": ("localisation", "departement"),
+    "reg": ("localisation", "region"),
+    "com": ("localisation", "commune"),
+    "act": ("activite", "activite_entreprise"),
+    "kw": ("activite", "mots_cles"),
+    "eff": ("taille_entreprise", "effectif_expression"),
+    "ca": ("criteres_financiers", "ca_plus_recent"),
+    "rn": ("criteres_financiers", "resultat_net_plus_recent"),
+    "rent": ("criteres_financiers", "rentabilite_plus_recente"),
+    "forme": ("criteres_juridiques", "categorie_juridique"),
+    "siege": ("criteres_juridiques", "siege_entreprise"),
+    "cmin": ("criteres_juridiques", "date_creation_entreprise_min"),
+    "cmax": ("criteres_juridiques", "date_creation_entreprise_max"),
+    "cap": ("criteres_juridiques", "capital"),
+    "etab": ("criteres_juridiques", "nombre_etablissements"),
+}
+
+_LONG_KEYS = {field: short for short, (_, field) in SHORT_KEYS.items()}
+
+COMPACT_ACTIONS = {"x": "extract", "r": "reject"}
+
+
+# ============================================================================
+# Conversion
+# ============================================================================
+
+def expand_compact(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rebuild the full LLM output (with "action") from a compact one.
+
+    Sections are present when at least one of their fields is set. Output
+    already in the full format (the model may ignore the instructions) is
+    returned unchanged; unknown short keys are ignored.
+    """
+    if "action" in data:
+        return data
+
+    action = COMPACT_ACTIONS.get(data.get("a"), "reject")
+    if action == "reject":
+        return {"action": "reject", "message": data.get("msg") or ""}
+
+    full: Dict[str, Any] = {"action": "extract", **copy.deepcopy(EMPTY_EXTRACTION)}
+    for key, value in data.items():
+        if key == "a" or value is None or key not in SHORT_KEYS:
+            continue
+        section, field = SHORT_KEYS[key]
+        full[section][field] = value
+        full[section]["present"] = True
+    return full
+
+
+def to_compact(full: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact form of a full LLM output (inverse of expand_compact)."""
+    if full.get("action") == "reject":
+        return {"a": "r", "msg": full.get("message")}
+    compact: Dict[str, Any] = {"a": "x"}
+    for section, fields in EMPTY_EXTRACTION.items():
+        values = full.get(section) or {}
+        if not values.get("present"):
+            continue
+        for field in fields:
+            if field != "present" and values.get(field) is not None:
+                compact[_LONG_KEYS[field]] = values[field]
+    return compact
+
+
+# ============================================================================
+# Streaming
+# ============================================================================
+
+class PartialExtraction:
+    """
+    Criteria sections completed so far in a streamed extraction.
+
+    Fed with the (path, value) events of services.incremental_json. In full
+    mode a section is complete when its object closes; in compact mode when
+    the model moves on to a key of another section (keys are written in
+    schema order) or the object ends.
+    """
+
+    def __init__(self, output_mode: str = EXTRACTION_OUTPUT_MODE):
+        self.output_mode = output_mode
+        self.action: Optional[str] = None
+        self.mots_cles: Optional[str] = None
+        self.sections: Dict[str, Dict[str, Any]] = {}  # Completed sections (full form)
+        self._open: Dict[str, Dict[str, Any]] = {}  # Compact mode: sections being written
+
+    def add(self, path: Tuple, value: Any) -> List[str]:
+        """
+        Record a completed value.
+
+        Returns:
+            Names of what just completed: sections ("localisation"...),
+            "mots_cles" and/or "action"
+        """
+        if self.output_mode == "compact":
+            return self._add_compact(path, value)
+
+        if path == ("action",):
+            self.action = value
+            return ["action"]
+        if path == ("activite", "mots_cles"):
+            self.mots_cles = value
+            return ["mots_cles"]
+        if len(path) == 1 and path[0] in EMPTY_EXTRACTION and isinstance(value, dict):
+            section = {**EMPTY_EXTRACTION[path[0]], **value}
+            self.sections[path[0]] = section
+            return [path[0]]
+        return []
+
+    def _add_compact(self, path: Tuple, value: Any) -> List[str]:
+        if path == ():
+            return self._close_sections()
+        if len(path) != 1:
+            return []
+        key = path[0]
+        if key == "a":
+            self.action = COMPACT_ACTIONS.get(value, "reject")
+            return ["action"]
+        if key not in SHORT_KEYS or value is None:
+            return []
+
+        section, field = SHORT_KEYS[key]
+        completed = self._close_sections(keep=section)
+        values = self._open.setdefault(section, {**EMPTY_EXTRACTION[section], "present": True})
+        values[field] = value
+        if key == "kw":
+            self.mots_cles = value
+            completed.append("mots_cles")
+        return completed
+
+    def _close_sections(self, keep: Optional[str] = None) -> List[str]:
+        closed = [name for name in self._open if name != keep]
+        for name in closed:
+            self.sections[name] = self._open.pop(name)
+        return closed
+
+    @property
+    def criteria(self) -> Dict[str, Dict[str, Any]]:
+        """Completed sections that are present."""
+        return {name: values for name, values in self.sections.items() if values.get("present")}
+
+
+# ============================================================================
+# Measurement
+# ============================================================================
+
+def _full_from_expected(expected: Dict[str, Any]) -> Dict[str, Any]:
+    """Full LLM output matching a synthetic_dataset.json expected_output."""
+    full: Dict[str, Any] = {"action": "extract", **copy.deepcopy(EMPTY_EXTRACTION)}
+    loc = expected.get("localisation", {})
+    act = expected.get("activite", {})
+    size = expected.get("taille_entreprise", {})
+    fin = expected.get("criteres_financiers", {})
+    jur = expected.get("criteres_juridiques", {})
+
+    for field in ("code_postal", "departement", "region"):
+        full["localisation"][field] = loc.get(field)
+    if act.get("libelle_secteur"):
+        full["activite"]["activite_entreprise"] = act["libelle_secteur"]
+        full["activite"]["mots_cles"] = act["libelle_secteur"].lower()
+    full["taille_entreprise"]["effectif_expression"] = size.get("acronyme") or (
+        "-".join(size["tranche_effectif"]) if isinstance(size.get("tranche_effectif"), list)
+        else size.get("tranche_effectif")
+    )
+    for field in ("ca_plus_recent", "resultat_net_plus_recent", "rentabilite_plus_recente"):
+        full["criteres_financiers"][field] = fin.get(field)
+    full["criteres_juridiques"]["date_creation_entreprise_min"] = jur.get("date_creation_entreprise")
+
+    for section, values in full.items():
+        if isinstance(values, dict):
+            values["present"] = any(v is not None for k, v in values.items() if k != "present")
+    return full
+
+
+def _load_dataset(dataset_path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    return dataset[:limit] if limit else dataset
+
+
+def estimate(dataset_path: str) -> Dict[str, Any]:
+    """
+    Offline estimate of extraction output tokens in both modes.
+
+    Serializes the expected outputs of the dataset as the model writes them
+    (indented JSON in full mode, one-line JSON in compact mode) and checks
+    that expand_compact() round-trips them.
+    """
+    from services.context_compactor import estimate_tokens
+
+    dataset = _load_dataset(dataset_path)
+    full_tokens, compact_tokens = [], []
+    mismatches = 0
+    for example in dataset:
+        full = _full_from_expected(example["expected_output"])
+        compact = to_compact(full)
+        full_tokens.append(estimate_tokens(json.dumps(full, ensure_ascii=False, indent=2)))
+        compact_tokens.append(estimate_tokens(json.dumps(compact, ensure_ascii=False)))
+        if expand_compact(compact) != full:
+            mismatches += 1
+
+    return {
+        "total": len(dataset),
+        "full_tokens_avg": sum(full_tokens) / len(full_tokens) if full_tokens else None,
+        "compact_tokens_avg": sum(compact_tokens) / len(compact_tokens) if compact_tokens else None,
+        "round_trip_mismatches": mismatches,
+    }
+
+
+async def benchmark(dataset_path: str, limit: int = 50) -> Dict[str, Dict[str, Any]]:
+    """
+    Live extraction in both output modes on the first `limit` queries.
+
+    Reports average completion tokens (from the OpenRouter usage block) and
+    end-to-end extraction latency (LLM call, expansion and post-processing).
+    Needs OPENROUTER_API_KEY; the extraction cache is bypassed.
+    """
+    from services.agent_service import AgentService
+    from services.location_matcher import get_location_matcher
+    from services.metrics import metrics
+
+    dataset = _load_dataset(dataset_path, limit)
+    get_location_matcher()  # Load the matcher before timing
+    report: Dict[str, Dict[str, Any]] = {}
+    for mode in OUTPUT_MODES:
+        latencies = []
+        errors = 0
+        tokens_before = metrics.counter("llm.extraction.completion_tokens")
+        reports_before = metrics.counter("llm.extraction.usage_reports")
+        for example in dataset:
+            message = type("Message", (), {"role": "user", "content": example["input"]})()
+            start = time.perf_counter()
+            try:
+                await AgentService._extract_with_llm([message], None, output_mode=mode)
+            except Exception as e:
+                print(f"[ExtractionSchema] {mode} failed on {example['input']!r}: {e}")
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+        reports = metrics.counter("llm.extraction.usage_reports") - reports_before
+        tokens = metrics.counter("llm.extraction.completion_tokens") - tokens_before
+        latencies.sort()
+        report[mode] = {
+            "queries": len(dataset),
+            "errors": errors,
+            "completion_tokens_avg": tokens / reports if reports else None,
+            "latency_ms_avg": 1000 * sum(latencies) / len(latencies) if latencies else None,
+            "latency_ms_p95": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+        }
+    return report
+
+
+def _format_number(value: Optional[float], unit: str = "") -> str:
+    """Rounded value for the reports, "n/a" when nothing was measured."""
+    return "n/a" if value is None else f"{value:.0f}{unit}"
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Extraction output schema tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    estimate_parser = subparsers.add_parser("estimate", help="Offline output-token estimate, full vs compact")
+    estimate_parser.add_argument("--dataset", default="../synthetic_dataset.json")
+    bench_parser = subparsers.add_parser("benchmark", help="Live tokens and latency, full vs compact")
+    bench_parser.add_argument("--dataset", default="../synthetic_dataset.json")
+    bench_parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == "estimate":
+        result = estimate(args.dataset)
+        print(f"Queries:          {result['total']}")
+        print(f"Full output:      ~{_format_number(result['full_tokens_avg'])} tokens avg")
+        print(f"Compact output:   ~{_format_number(result['compact_tokens_avg'])} tokens avg")
+        print(f"Round-trip diffs: {result['round_trip_mismatches']}")
+    else:
+        results = asyncio.run(benchmark(args.dataset, args.limit))
+        for mode, result in results.items():
+            tokens = result["completion_tokens_avg"]
+            print(f"{mode:<8} tokens avg {tokens if tokens is None else round(tokens, 1)}, "
+                  f"latency avg {_format_number(result['latency_ms_avg'], ' ms')}, "
+                  f"p95 {_format_number(result['latency_ms_p95'], ' ms')}, "
+                  f"errors {result['errors']}/{result['queries']}")
@@ -8,7 +8,8 @@ using the OpenRouter API.
 import os
 import json
 from typing import Any, Dict
-import requests
+
+from services.llm_client import get_llm_client, LLMError, LLM_USAGE_ACCOUNTING
 
 # ============================================================================
 # Configuration
@@ -142,39 +143,20 @@ class OpenRouterExtractorError(Exception):
 # API Calls
 # ============================================================================
 
-def call_openrouter_chat(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Appelle l'API OpenRouter et renvoie la réponse JSON brute."""
+async def call_openrouter_chat(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Appelle l'API OpenRouter (client async partagé) et renvoie la réponse JSON brute."""
     if not OPENROUTER_API_KEY:
         raise OpenRouterExtractorError(
             "OPENROUTER_API_KEY n'est pas définie dans les variables d'environnement."
         )
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
-
-    response = requests.post(
-        url=OPENROUTER_API_URL,
-        headers=headers,
-        data=json.dumps(payload),
-        timeout=60,
-    )
-
     try:
-        response.raise_for_status()
-    except requests.HTTPError as e:
-        raise OpenRouterExtractorError(
-            f"Erreur HTTP OpenRouter ({response.status_code}): {response.text}"
-        ) from e
-
-    try:
-        return response.json()
-    except json.JSONDecodeError as e:
-        raise OpenRouterExtractorError("Réponse OpenRouter non JSON.") from e
+        return await get_llm_client().post(payload, call_type="extract_endpoint")
+    except LLMError as e:
+        raise OpenRouterExtractorError(f"Erreur OpenRouter : {e}") from e
 
 
-def extract_criteria(user_query: str) -> Dict[str, Any]:
+async def extract_criteria(user_query: str) -> Dict[str, Any]:
     """
     Extrait les critères depuis une requête utilisateur via OpenRouter.
     """
@@ -189,8 +171,10 @@ def extract_criteria(user_query: str) -> Dict[str, Any]:
         "response_format": {"type": "json_object"},
         "temperature": 0.0,
     }
+    if LLM_USAGE_ACCOUNTING:
+        payload["usage"] = {"include": True}
 
-    raw = call_openrouter_chat(payload)
+    raw = await call_openrouter_chat(payload)
 
     try:
         content = raw["choices"][0]["message"]["content"]
@@ -0,0 +1,119 @@
+"""
+Incremental re-evaluation of the chat pipeline between turns.
+
+The pipeline is a dependency graph of stages, each keyed by the criteria
+fields it reads. Given previous_extraction and the new extraction, a stage
+is skipped (and its previous output reused) when:
+- its previous output is available (sent back by the frontend),
+- none of the fields it reads changed,
+- and none of the stages it depends on produced a different output.
+
+    location_match   <- localisation
+    size_transform   <- taille_entreprise
+    activity_match   <- activite.mots_cles
+    api_request      <- all criteria, activity_match
+    count            <- api_request
+    response         <- all criteria, count, activity_match
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.metrics import metrics
+
+CRITERIA_FIELDS = (
+    "localisation",
+    "activite",
+    "taille_entreprise",
+    "criteres_financiers",
+    "criteres_juridiques",
+)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A pipeline stage and what it reads"""
+    name: str
+    reads: Tuple[str, ...]  # Criteria fields, dotted for nested ones ("activite.mots_cles")
+    depends_on: Tuple[str, ...] = ()  # Upstream stages whose output it consumes
+
+
+STAGES: Dict[str, Stage] = {stage.name: stage for stage in [
+    Stage("location_match", ("localisation",)),
+    Stage("size_transform", ("taille_entreprise",)),
+    Stage("activity_match", ("activite.mots_cles",)),
+    Stage("api_request", CRITERIA_FIELDS, depends_on=("activity_match",)),
+    Stage("count", (), depends_on=("api_request",)),
+    Stage("response", CRITERIA_FIELDS, depends_on=("count", "activity_match")),
+]}
+
+
+def get_field(extraction: Optional[Dict[str, Any]], path: str) -> Any:
+    """Value of a dotted field path, None if missing."""
+    value: Any = extraction
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def changed_fields(
+    previous: Optional[Dict[str, Any]],
+    current: Optional[Dict[str, Any]],
+    paths: Iterable[str] = CRITERIA_FIELDS
+) -> List[str]:
+    """Fields whose value differs between two extractions."""
+    return [path for path in paths if get_field(previous, path) != get_field(current, path)]
+
+
+class IncrementalPlan:
+    """
+    Decides, stage by stage, whether to run or reuse the previous output.
+
+    Stages must be queried in dependency order. A stage that ran is assumed
+    to have changed its output unless output_unchanged() is called (e.g. the
+    activity matcher re-ran but selected the same NAF codes), so downstream
+    stages can still be skipped.
+    """
+
+    def __init__(
+        self,
+        previous_extraction: Optional[Dict[str, Any]],
+        extraction: Dict[str, Any],
+        reusable: Iterable[str] = ()
+    ):
+        """
+        Args:
+            previous_extraction: Extraction of the previous turn (None on the first turn)
+            extraction: Extraction of this turn
+            reusable: Stages whose previous output is available to reuse
+        """
+        self.previous = previous_extraction
+        self.current = extraction
+        self.reusable: Set[str] = set(reusable) if previous_extraction is not None else set()
+        self.ran: List[str] = []
+        self.skipped: List[str] = []
+        self._changed_outputs: Set[str] = set()
+
+    def inputs_changed(self, name: str) -> bool:
+        stage = STAGES[name]
+        if changed_fields(self.previous, self.current, stage.reads):
+            return True
+        return any(dep in self._changed_outputs for dep in stage.depends_on)
+
+    def should_run(self, name: str) -> bool:
+        """True if the stage must run; records the decision either way."""
+        run = name not in self.reusable or self.inputs_changed(name)
+        if run:
+            self.ran.append(name)
+            self._changed_outputs.add(name)
+        else:
+            self.skipped.append(name)
+            metrics.increment(f"pipeline.{name}.skipped")
+        metrics.increment(f"pipeline.{name}.total")
+        return run
+
+    def output_unchanged(self, name: str) -> None:
+        """The stage ran but produced the same output as the previous turn."""
+        self._changed_outputs.discard(name)
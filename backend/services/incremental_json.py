@@ -0,0 +1,175 @@
+"""
+Incremental JSON parser for streamed LLM output.
+
+Fed with arbitrary text chunks, it reports every value as soon as it is
+complete (scalars when their last character arrives, objects and arrays when
+they close), with its path from the root:
+
+    parser = IncrementalJSONParser()
+    parser.feed('{"activite": {"mots_cles": "resta')   # -> []
+    parser.feed('uration"}, ')                         # -> [(("activite", "mots_cles"), "restauration"),
+                                                       #     (("activite",), {"mots_cles": "restauration"})]
+
+Text before the first "{" or "[" (e.g. a markdown fence) and after the root
+value is ignored. The parser only drives early work: callers still decode
+the full text with json.loads once the stream ends.
+"""
+
+import json
+from typing import Any, List, Optional, Tuple, Union
+
+Path = Tuple[Union[str, int], ...]
+
+_WHITESPACE = " \t\r\n"
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class _Frame:
+    """An open object or array"""
+    __slots__ = ("value", "path", "key", "expect")
+
+    def __init__(self, value: Union[dict, list], path: Path):
+        self.value = value
+        self.path = path
+        self.key: Optional[str] = None
+        self.expect = "key" if isinstance(value, dict) else "value"
+
+
+class IncrementalJSONParser:
+    """Streaming JSON parser reporting completed values with their path."""
+
+    def __init__(self):
+        self._stack: List[_Frame] = []
+        self._mode: Optional[str] = None  # None, "string" or "literal"
+        self._buffer: List[str] = []
+        self._is_key = False
+        self._escape = False
+        self._unicode: Optional[str] = None  # Hex digits of a \\u escape
+        self._events: List[Tuple[Path, Any]] = []
+        self.value: Any = None  # Partial root value (containers are filled in place)
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """
+        Parse a chunk and return the values it completed, innermost first.
+
+        Raises:
+            ValueError: On malformed JSON
+        """
+        self._events = []
+        for char in chunk:
+            if self.done:
+                break
+            if self._mode == "string":
+                self._string_char(char)
+            elif self._mode == "literal" and char not in _WHITESPACE and char not in ",}]":
+                self._buffer.append(char)
+            else:
+                if self._mode == "literal":
+                    self._end_literal()
+                self._structural_char(char)
+        return self._events
+
+    # ------------------------------------------------------------------------
+    # Characters
+    # ------------------------------------------------------------------------
+
+    def _string_char(self, char: str) -> None:
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) == 4:
+                self._buffer.append(chr(int(self._unicode, 16)))
+                self._unicode = None
+        elif self._escape:
+            self._escape = False
+            if char == "u":
+                self._unicode = ""
+            else:
+                self._buffer.append(_ESCAPES.get(char, char))
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._mode = None
+            text = "".join(self._buffer)
+            if self._is_key:
+                top = self._stack[-1]
+                top.key = text
+                top.expect = "colon"
+            else:
+                self._complete(text)
+        else:
+            self._buffer.append(char)
+
+    def _structural_char(self, char: str) -> None:
+        if char in _WHITESPACE:
+            return
+        if not self._stack:
+            # Skip anything before the root value
+            if char in "{[":
+                self._open({} if char == "{" else [])
+            return
+
+        top = self._stack[-1]
+        if char in "{[":
+            self._open({} if char == "{" else [])
+        elif char in "}]":
+            frame = self._stack.pop()
+            self._complete(frame.value, assign=False, path=frame.path)
+        elif char == '"':
+            self._mode = "string"
+            self._buffer = []
+            self._is_key = isinstance(top.value, dict) and top.expect == "key"
+        elif char == ":":
+            top.expect = "value"
+        elif char == ",":
+            top.expect = "key" if isinstance(top.value, dict) else "value"
+        else:
+            self._mode = "literal"
+            self._buffer = [char]
+
+    def _end_literal(self) -> None:
+        self._mode = None
+        text = "".join(self._buffer)
+        try:
+            value = json.loads(text)
+        except ValueError:
+            raise ValueError(f"Invalid JSON literal: {text!r}")
+        self._complete(value)
+
+    # ------------------------------------------------------------------------
+    # Tree building
+    # ------------------------------------------------------------------------
+
+    def _child_path(self) -> Path:
+        if not self._stack:
+            return ()
+        top = self._stack[-1]
+        if isinstance(top.value, dict):
+            return top.path + (top.key,)
+        return top.path + (len(top.value),)
+
+    def _attach(self, value: Any) -> None:
+        """Store a value in the open container (or as the root)."""
+        if not self._stack:
+            self.value = value
+            return
+        top = self._stack[-1]
+        if isinstance(top.value, dict):
+            top.value[top.key] = value
+            top.key = None
+        else:
+            top.value.append(value)
+        top.expect = "comma"
+
+    def _open(self, container: Union[dict, list]) -> None:
+        path = self._child_path()
+        self._attach(container)
+        self._stack.append(_Frame(container, path))
+
+    def _complete(self, value: Any, assign: bool = True, path: Optional[Path] = None) -> None:
+        if assign:
+            path = self._child_path()
+            self._attach(value)
+        self._events.append((path, value))
+        if not self._stack:
+            self.done = True
@@ -0,0 +1,594 @@
+"""
+Async OpenRouter client.
+
+One shared `httpx.AsyncClient` with keep-alive connection pooling (and
+optional HTTP/2) for every LLM call, so a single worker can multiplex many
+in-flight conversations instead of blocking on `requests.post`.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from services.load_monitor import load_monitor
+from services.metrics import metrics
+from services.pipeline import DeadlineExceeded, remaining_timeout
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-2.5-flash-lite")
+
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"
+# Ask OpenRouter for the usage block (prompt/cached/completion tokens, cost)
+LLM_USAGE_ACCOUNTING = os.getenv("LLM_USAGE_ACCOUNTING", "true").lower() == "true"
+
+# Hedged requests: when a call has no answer (or, streamed, no first chunk)
+# after the recent p95 of its call type, a duplicate is sent, optionally to a
+# faster fallback model; the first valid answer wins, the other is cancelled
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "true").lower() == "true"
+OPENROUTER_FALLBACK_MODEL = os.getenv("OPENROUTER_FALLBACK_MODEL") or None  # None: same model
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+# Observations of a call type needed before its p95 is trusted
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Max share of a call type's calls that may be hedged ("extraction=0.1,naf_selection=0.05")
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))
+LLM_HEDGE_BUDGETS = os.getenv("LLM_HEDGE_BUDGETS", "extraction=0.1,naf_selection=0.1")
+
+
+class LLMError(Exception):
+    """Raised when an LLM call fails (HTTP error, timeout, malformed response)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# ============================================================================
+# SSE parsing
+# ============================================================================
+
+class SSELineSplitter:
+    """
+    Incremental line splitter for a byte stream.
+
+    Complete lines are returned as soon as their newline arrives; only the
+    trailing partial line is kept between chunks, so the work is linear in
+    the stream length.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """Add a chunk and return the complete lines it terminated."""
+        self._buffer += chunk
+        lines = []
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end == -1:
+                break
+            lines.append(self._buffer[start:end].decode("utf-8", errors="replace").rstrip("\r"))
+            start = end + 1
+        if start:
+            del self._buffer[:start]
+        return lines
+
+
+# ============================================================================
+# Usage accounting
+# ============================================================================
+
+def record_usage(call_type: str, usage: Optional[Dict[str, Any]]) -> bool:
+    """
+    Record an OpenRouter usage block under llm.{call_type}.*.
+
+    Counters: prompt_tokens, cached_tokens, completion_tokens, cost, and
+    prefix_cache_hits (calls where part of the prompt was served from the
+    provider cache). Returns True on such a hit so callers can split their
+    latency series between cached and uncached prompts.
+    """
+    if not usage:
+        return False
+    details = usage.get("prompt_tokens_details") or {}
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    cached_tokens = details.get("cached_tokens") or 0
+    metrics.increment(f"llm.{call_type}.usage_reports")
+    metrics.increment(f"llm.{call_type}.prompt_tokens", prompt_tokens)
+    metrics.increment(f"llm.{call_type}.cached_tokens", cached_tokens)
+    metrics.increment(f"llm.{call_type}.completion_tokens", usage.get("completion_tokens") or 0)
+    if usage.get("cost") is not None:
+        metrics.increment(f"llm.{call_type}.cost", usage["cost"])
+    if cached_tokens:
+        metrics.increment(f"llm.{call_type}.prefix_cache_hits")
+    return cached_tokens > 0
+
+
+def usage_stats() -> Dict[str, Dict[str, Any]]:
+    """Per call type token totals and share of prompt tokens served from cache."""
+    counters = metrics.snapshot()["counters"]
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name, value in counters.items():
+        if not (name.startswith("llm.") and name.endswith(".usage_reports")):
+            continue
+        call_type = name[len("llm."):-len(".usage_reports")]
+        prompt_tokens = counters.get(f"llm.{call_type}.prompt_tokens", 0)
+        cached_tokens = counters.get(f"llm.{call_type}.cached_tokens", 0)
+        stats[call_type] = {
+            "calls": value,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": counters.get(f"llm.{call_type}.completion_tokens", 0),
+            "cost": counters.get(f"llm.{call_type}.cost", 0),
+            "cached_ratio": cached_tokens / prompt_tokens if prompt_tokens else None,
+        }
+    return stats
+
+
+# ============================================================================
+# Hedging
+# ============================================================================
+
+def _parse_budgets(spec: str) -> Dict[str, float]:
+    """ "extraction=0.1,naf_selection=0.05" -> {"extraction": 0.1, "naf_selection": 0.05}"""
+    budgets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            call_type, value = item.split("=", 1)
+            budgets[call_type.strip()] = float(value)
+    return budgets
+
+
+_hedge_budgets = _parse_budgets(LLM_HEDGE_BUDGETS)
+
+
+def hedge_budget(call_type: str) -> float:
+    """Max share of the calls of a type that may be hedged."""
+    return _hedge_budgets.get(call_type, LLM_HEDGE_BUDGET)
+
+
+def hedge_delay(call_type: str, series: str = "latency") -> Optional[float]:
+    """
+    How long to wait before hedging a call, None if it must not be hedged.
+
+    The delay is the recent LLM_HEDGE_PERCENTILE of llm.{call_type}.{series}
+    ("latency" for whole calls, "ttft" for streams), at least
+    LLM_HEDGE_MIN_DELAY. No hedging until LLM_HEDGE_MIN_SAMPLES calls were seen.
+    """
+    if not LLM_HEDGING_ENABLED or hedge_budget(call_type) <= 0:
+        return None
+    name = f"llm.{call_type}.{series}"
+    if metrics.count(name) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    metrics.increment(f"llm.{call_type}.hedge.calls")
+    return max(LLM_HEDGE_MIN_DELAY, metrics.percentile(name, LLM_HEDGE_PERCENTILE))
+
+
+def _hedge_allowed(call_type: str) -> bool:
+    """True if hedging one more call stays within the call type's budget."""
+    fired = metrics.counter(f"llm.{call_type}.hedge.fired")
+    return fired < hedge_budget(call_type) * metrics.counter(f"llm.{call_type}.hedge.calls")
+
+
+def _is_valid_json(content: str) -> bool:
+    """JSON object, possibly wrapped in a markdown code block."""
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        return False
+    try:
+        json.loads(content[start:end + 1])
+        return True
+    except ValueError:
+        return False
+
+
+def hedge_stats() -> Dict[str, Dict[str, Any]]:
+    """Per call type: hedge-eligible calls, hedges fired and won."""
+    counters = metrics.snapshot()["counters"]
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name, value in counters.items():
+        if not (name.startswith("llm.") and name.endswith(".hedge.calls")):
+            continue
+        call_type = name[len("llm."):-len(".hedge.calls")]
+        fired = counters.get(f"llm.{call_type}.hedge.fired", 0)
+        won = counters.get(f"llm.{call_type}.hedge.won", 0)
+        stats[call_type] = {
+            "calls": value,
+            "fired": fired,
+            "won": won,
+            "fire_rate": fired / value if value else None,
+            "win_rate": won / fired if fired else None,
+            "budget": hedge_budget(call_type),
+        }
+    return stats
+
+
+# ============================================================================
+# Client
+# ============================================================================
+
+class LLMClient:
+    """Pooled async client for OpenRouter chat completions."""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_url: str = OPENROUTER_API_URL,
+        model: str = OPENROUTER_MODEL,
+        http2: bool = LLM_HTTP2,
+    ):
+        self.api_key = api_key or OPENROUTER_API_KEY
+        self.api_url = api_url
+        self.model = model
+        if http2 and not _http2_available():
+            print("[LLMClient] LLM_HTTP2 requested but 'h2' is not installed, using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared connection pool (created lazily)."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._client
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    @staticmethod
+    def _timeout(read_timeout: Optional[float]) -> httpx.Timeout:
+        """Per-call timeout, capped by the request deadline (see services.pipeline)."""
+        try:
+            read = remaining_timeout(read_timeout or LLM_READ_TIMEOUT)
+        except DeadlineExceeded as e:
+            raise LLMError(str(e)) from e
+        return httpx.Timeout(read, connect=min(LLM_CONNECT_TIMEOUT, read))
+
+    def build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        json_mode: bool = False,
+        model: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": temperature,
+        }
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        if LLM_USAGE_ACCOUNTING:
+            payload["usage"] = {"include": True}
+        return payload
+
+    async def post(
+        self,
+        payload: Dict[str, Any],
+        read_timeout: Optional[float] = None,
+        call_type: str = "other",
+    ) -> Dict[str, Any]:
+        """
+        Send a chat completion request and return the decoded JSON response.
+
+        Args:
+            payload: OpenRouter request body
+            read_timeout: Per-call read timeout in seconds (default LLM_READ_TIMEOUT)
+            call_type: Label used for metrics (e.g. "extraction", "naf_selection")
+
+        Raises:
+            LLMError: On missing API key, HTTP error, timeout or non-JSON response
+        """
+        if not self.api_key:
+            raise LLMError("OPENROUTER_API_KEY not set")
+
+        timeout = self._timeout(read_timeout)
+        start = time.perf_counter()
+        metrics.increment(f"llm.{call_type}.calls")
+        try:
+            with load_monitor.track_llm_call(call_type):
+                response = await self.client.post(
+                    self.api_url, headers=self._headers(), json=payload, timeout=timeout
+                )
+        except httpx.TimeoutException as e:
+            metrics.increment(f"llm.{call_type}.errors")
+            raise LLMError(f"OpenRouter timeout: {type(e).__name__}") from e
+        except httpx.TransportError as e:
+            metrics.increment(f"llm.{call_type}.errors")
+            raise LLMError(f"OpenRouter connection error: {e}") from e
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe(f"llm.{call_type}.latency", elapsed)
+
+        if response.status_code != 200:
+            metrics.increment(f"llm.{call_type}.errors")
+            raise LLMError(
+                f"OpenRouter HTTP {response.status_code}: {response.text[:500]}",
+                status_code=response.status_code,
+            )
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            metrics.increment(f"llm.{call_type}.errors")
+            raise LLMError("OpenRouter returned a non-JSON response") from e
+
+        if isinstance(data, dict) and data.get("usage"):
+            cached = record_usage(call_type, data["usage"])
+            metrics.observe(f"llm.{call_type}.latency.{'cached' if cached else 'uncached'}", elapsed)
+        return data
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        json_mode: bool = False,
+        read_timeout: Optional[float] = None,
+        call_type: str = "other",
+    ) -> str:
+        """
+        Run a chat completion and return the message content.
+
+        Hedged (see hedge_delay): in json_mode only a valid JSON answer wins
+        the race while the other request is still running.
+        """
+        async def attempt(model: Optional[str]) -> str:
+            data = await self.post(
+                self.build_payload(messages, temperature, json_mode=json_mode, model=model),
+                read_timeout=read_timeout,
+                call_type=call_type,
+            )
+            try:
+                return data["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError) as e:
+                raise LLMError(f"Unexpected OpenRouter response: {str(data)[:500]}") from e
+
+        delay = hedge_delay(call_type)
+        if delay is None:
+            return await attempt(None)
+        return await self._hedged(
+            attempt, delay, call_type, valid=_is_valid_json if json_mode else None
+        )
+
+    async def _hedged(
+        self,
+        attempt: Callable[[Optional[str]], Awaitable[Any]],
+        delay: float,
+        call_type: str,
+        valid: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Run attempt(None); if it is still running after `delay`, race it with
+        attempt(OPENROUTER_FALLBACK_MODEL).
+
+        The first successful (and `valid`) result wins and the other attempt is
+        cancelled. If neither qualifies, the primary's outcome is returned
+        (or its error raised) unless only the hedge succeeded.
+        """
+        primary = asyncio.create_task(attempt(None))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not _hedge_allowed(call_type):
+                return await primary
+
+            metrics.increment(f"llm.{call_type}.hedge.fired")
+            print(f"[LLMClient] {call_type}: no answer after {delay:.1f}s, hedging"
+                  + (f" with {OPENROUTER_FALLBACK_MODEL}" if OPENROUTER_FALLBACK_MODEL else ""))
+            hedge = asyncio.create_task(attempt(OPENROUTER_FALLBACK_MODEL))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: t is hedge):
+                    if task.exception() is None and (valid is None or valid(task.result())):
+                        metrics.increment(f"llm.{call_type}.hedge.{'won' if task is hedge else 'lost'}")
+                        return task.result()
+            metrics.increment(f"llm.{call_type}.hedge.lost")
+            if primary.exception() is not None and hedge.exception() is None:
+                return hedge.result()
+            return primary.result()
+        finally:
+            # Also on cancellation (client gone, deadline, singleflight): no
+            # request keeps running for nobody
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            # Let the loser unwind (close its connection) before returning
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        read_timeout: Optional[float] = None,
+        call_type: str = "response_stream",
+        json_mode: bool = False,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream a chat completion, yielding content deltas.
+
+        Uses the shared pool, so each streamed reply reuses a warm connection.
+        Hedged on the first chunk (see hedge_delay): the stream that starts
+        answering first is relayed, the other one is closed.
+
+        Raises:
+            LLMError: On missing API key, HTTP error, timeout or stream error event
+        """
+        def open_stream(model: Optional[str]) -> AsyncGenerator[str, None]:
+            payload = self.build_payload(messages, temperature, json_mode=json_mode, model=model)
+            return self._stream(payload, read_timeout, call_type)
+
+        delay = hedge_delay(call_type, "ttft")
+        if delay is None:
+            async for content in open_stream(None):
+                yield content
+            return
+
+        streams: List[AsyncGenerator[str, None]] = []
+
+        async def first_chunk(model: Optional[str]) -> Tuple[AsyncGenerator[str, None], Optional[str]]:
+            stream = open_stream(model)
+            streams.append(stream)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+
+        try:
+            stream, content = await self._hedged(first_chunk, delay, call_type)
+            for other in streams:
+                if other is not stream:
+                    await other.aclose()
+            if content is None:
+                return
+            yield content
+            async for content in stream:
+                yield content
+        finally:
+            for stream in streams:
+                await stream.aclose()
+
+    async def _stream(
+        self,
+        payload: Dict[str, Any],
+        read_timeout: Optional[float],
+        call_type: str,
+    ) -> AsyncGenerator[str, None]:
+        """One streamed completion (see stream_chat)."""
+        if not self.api_key:
+            raise LLMError("OPENROUTER_API_KEY not set")
+
+        payload["stream"] = True
+        timeout = self._timeout(read_timeout)
+
+        start = time.perf_counter()
+        first_chunk_at: Optional[float] = None
+        usage: Optional[Dict[str, Any]] = None
+        received = 0
+        metrics.increment(f"llm.{call_type}.calls")
+        try:
+            with load_monitor.track_llm_call(call_type):
+                async with self.client.stream(
+                    "POST", self.api_url, headers=self._headers(), json=payload, timeout=timeout
+                ) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        raise LLMError(
+                            f"OpenRouter HTTP {response.status_code}: {body[:500].decode('utf-8', errors='replace')}",
+                            status_code=response.status_code,
+                        )
+
+                    splitter = SSELineSplitter()
+                    async for chunk in response.aiter_bytes():
+                        received += len(chunk)
+                        for line in splitter.feed(chunk):
+                            # Skip empty lines and comments (OpenRouter sends these)
+                            if not line or line.startswith(":") or not line.startswith("data: "):
+                                continue
+
+                            data = line[6:]
+                            if data == "[DONE]":
+                                return
+
+                            try:
+                                data_obj = json.loads(data)
+                            except json.JSONDecodeError:
+                                continue  # Skip malformed lines
+
+                            if "error" in data_obj:
+                                raise LLMError(f"Stream error: {data_obj['error'].get('message', 'Unknown error')}")
+                            if data_obj.get("usage"):
+                                usage = data_obj["usage"]  # Sent in the last chunk
+                            content = (data_obj.get("choices") or [{}])[0].get("delta", {}).get("content")
+                            if content:
+                                if first_chunk_at is None:
+                                    first_chunk_at = time.perf_counter()
+                                    metrics.observe(f"llm.{call_type}.ttft", first_chunk_at - start)
+                                yield content
+
+        except httpx.TimeoutException as e:
+            metrics.increment(f"llm.{call_type}.errors")
+            raise LLMError(f"OpenRouter stream timeout: {type(e).__name__}") from e
+        except httpx.TransportError as e:
+            metrics.increment(f"llm.{call_type}.errors")
+            raise LLMError(f"OpenRouter stream connection error: {e}") from e
+        finally:
+            metrics.observe(f"llm.{call_type}.latency", time.perf_counter() - start)
+            metrics.increment(f"llm.{call_type}.bytes", received)
+            if usage:
+                cached = record_usage(call_type, usage)
+                if first_chunk_at is not None:
+                    metrics.observe(
+                        f"llm.{call_type}.ttft.{'cached' if cached else 'uncached'}",
+                        first_chunk_at - start,
+                    )
+
+    async def aclose(self) -> None:
+        """Close the connection pool."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+# ============================================================================
+# Module-level Singleton
+# ============================================================================
+
+_llm_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    """Get or create the shared LLMClient instance."""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+async def open_llm_client() -> LLMClient:
+    """Create the shared client at startup so the pool lives for the app lifespan."""
+    client = get_llm_client()
+    client.client  # Instantiate the pool now rather than on the first request
+    return client
+
+
+async def close_llm_client() -> None:
+    """Close the shared client (called from the shutdown event)."""
+    if _llm_client is not None:
+        await _llm_client.aclose()
@@ -0,0 +1,127 @@
+"""
+Load signals used to shed the optional LLM work.
+
+Tracks chat requests in progress, LLM calls in flight and the recent latency
+of the LLM calls that cannot be skipped (extraction, NAF selection). When
+any of them crosses its threshold the service is considered overloaded and
+the assistant message is built from templates instead of the
+response-generation LLM call (see services.response_templates).
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from services.metrics import metrics
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "true").lower() == "true"
+# Thresholds (0 disables a signal)
+LOAD_SHED_MAX_ACTIVE_REQUESTS = int(os.getenv("LOAD_SHED_MAX_ACTIVE_REQUESTS", "50"))
+LOAD_SHED_MAX_LLM_IN_FLIGHT = int(os.getenv("LOAD_SHED_MAX_LLM_IN_FLIGHT", "100"))
+LOAD_SHED_LLM_P95 = float(os.getenv("LOAD_SHED_LLM_P95", "8.0"))  # Seconds
+# Recent LLM calls the latency signal is computed on
+LOAD_SHED_WINDOW = int(os.getenv("LOAD_SHED_WINDOW", "50"))
+
+# Call types whose latency reflects the provider's health (never shed)
+SLO_CALL_TYPES = ("extraction", "naf_selection")
+
+# Set for background LLM calls (cache warm-up) that say nothing about user latency
+_latency_excluded: ContextVar[bool] = ContextVar("llm_latency_excluded", default=False)
+
+
+class LoadMonitor:
+    """In-process load signals (requests, LLM concurrency, LLM latency)."""
+
+    def __init__(self, window: int = LOAD_SHED_WINDOW):
+        self._lock = threading.Lock()
+        self.active_requests = 0
+        self.llm_in_flight = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    @contextmanager
+    def track_request(self) -> Iterator[None]:
+        """Count a chat request while it is processed."""
+        with self._lock:
+            self.active_requests += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active_requests -= 1
+
+    @contextmanager
+    def track_llm_call(self, call_type: str) -> Iterator[None]:
+        """
+        Count an LLM call in flight and record its latency.
+
+        Only calls that complete are timed: a cancelled hedge or a failed
+        call would skew the p95 down, and warm-up calls are excluded (see
+        exclude_latency).
+        """
+        start = time.perf_counter()
+        completed = False
+        with self._lock:
+            self.llm_in_flight += 1
+        try:
+            yield
+            completed = True
+        finally:
+            with self._lock:
+                self.llm_in_flight -= 1
+                if completed and call_type in SLO_CALL_TYPES and not _latency_excluded.get():
+                    self._latencies.append(time.perf_counter() - start)
+
+    @staticmethod
+    @contextmanager
+    def exclude_latency() -> Iterator[None]:
+        """Keep the LLM calls made in this context out of the latency signal."""
+        token = _latency_excluded.set(True)
+        try:
+            yield
+        finally:
+            _latency_excluded.reset(token)
+
+    def llm_p95(self) -> Optional[float]:
+        """p95 latency of the recent SLO call types, None without data."""
+        with self._lock:
+            values = sorted(self._latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+
+    def overload_reason(self) -> Optional[str]:
+        """The first signal over its threshold ("requests", "llm_in_flight", "llm_latency"), or None."""
+        if not LOAD_SHEDDING_ENABLED:
+            return None
+        if LOAD_SHED_MAX_ACTIVE_REQUESTS and self.active_requests > LOAD_SHED_MAX_ACTIVE_REQUESTS:
+            return "requests"
+        if LOAD_SHED_MAX_LLM_IN_FLIGHT and self.llm_in_flight > LOAD_SHED_MAX_LLM_IN_FLIGHT:
+            return "llm_in_flight"
+        p95 = self.llm_p95()
+        if LOAD_SHED_LLM_P95 and p95 is not None and p95 > LOAD_SHED_LLM_P95:
+            return "llm_latency"
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_requests": self.active_requests,
+            "llm_in_flight": self.llm_in_flight,
+            "llm_p95": self.llm_p95(),
+            "overloaded": self.overload_reason(),
+            "template_responses": metrics.counter("response.source.template"),
+        }
+
+
+# ============================================================================
+# Module-level Singleton
+# ============================================================================
+
+load_monitor = LoadMonitor()
@@ -4,11 +4,15 @@ Location Matcher Service for fuzzy matching of communes, departements, and regio
 Matches user input to exact values from reference lists using normalized text comparison.
 """
 
+import os
+import threading
 import unicodedata
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, List, Tuple
 
+from services.cache import TTLCache
+
 
 @dataclass
 class LocationCorrection:
@@ -38,6 +42,14 @@ COMMUNES_FILE = DATA_DIR / "communes.txt"
 DEPARTEMENTS_FILE = DATA_DIR / "departements.txt"
 REGIONS_FILE = DATA_DIR / "regions.txt"
 
+# Cross-list match results: the fuzzy scan over ~35k communes is the slow part
+# of location matching, and users ask for the same places over and over
+LOCATION_MATCH_CACHE_SIZE = int(os.getenv("LOCATION_MATCH_CACHE_SIZE", "10000"))
+LOCATION_MATCH_CACHE_TTL = int(os.getenv("LOCATION_MATCH_CACHE_TTL", "604800"))
+
+_location_match_cache = TTLCache("location_match", LOCATION_MATCH_CACHE_SIZE, LOCATION_MATCH_CACHE_TTL)
+_NO_MATCH = ()  # Cached "no match above threshold"
+
 # Department number to name mapping
 DEPARTEMENT_NUMBERS = {
     "01": "Ain", "02": "Aisne", "03": "Allier", "04": "Alpes-de-Haute-Provence",
@@ -243,6 +255,22 @@ class LocationMatcher:
         if not query:
             return None
 
+        cache_key = (normalize_text(query), preferred_type, threshold)
+        cached = _location_match_cache.get(cache_key)
+        if cached is not None:
+            return cached or None
+
+        result = self._scan_all(query, preferred_type, threshold)
+        _location_match_cache.set(cache_key, result or _NO_MATCH)
+        return result
+
+    def _scan_all(
+        self,
+        query: str,
+        preferred_type: Optional[str],
+        threshold: float
+    ) -> Optional[Tuple[str, str, float]]:
+        """Uncached find_best_match_across_all."""
         # Collect all matches with their scores
         all_matches: List[Tuple[str, str, float]] = []  # (value, type, score)
 
@@ -407,6 +435,7 @@ class LocationMatcher:
 # ============================================================================
 
 _location_matcher: Optional[LocationMatcher] = None
+_location_matcher_lock = threading.Lock()
 
 
 def get_location_matcher() -> LocationMatcher:
@@ -414,8 +443,12 @@ def get_location_matcher() -> LocationMatcher:
     global _location_matcher
 
     if _location_matcher is None:
-        _location_matcher = LocationMatcher()
-        _location_matcher.initialize()
+        # Initialization may run in a worker thread at startup
+        with _location_matcher_lock:
+            if _location_matcher is None:
+                matcher = LocationMatcher()
+                matcher.initialize()
+                _location_matcher = matcher
 
     return _location_matcher
 
@@ -0,0 +1,89 @@
+"""
+In-process metrics registry.
+
+Counters and rolling latency windows shared by the services, exposed as JSON
+on GET /metrics.
+"""
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+# Number of recent observations kept per timing series
+WINDOW_SIZE = 1000
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Metrics:
+    """Thread-safe counters and rolling observation windows."""
+
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._observations: Dict[str, Deque[float]] = {}
+        self._window_size = window_size
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """Add `value` to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one observation (e.g. a latency in seconds)."""
+        with self._lock:
+            window = self._observations.get(name)
+            if window is None:
+                window = self._observations[name] = deque(maxlen=self._window_size)
+            window.append(value)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def count(self, name: str) -> int:
+        """Number of observations in the window of a timing series."""
+        with self._lock:
+            window = self._observations.get(name)
+            return len(window) if window else 0
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        """Percentile (0-1) of the recent observations, or None if there are none."""
+        with self._lock:
+            window = self._observations.get(name)
+            values = sorted(window) if window else []
+        return _percentile(values, q) if values else None
+
+    def ratio(self, numerator: str, denominator: str) -> Optional[float]:
+        """Ratio of two counters, or None if the denominator is zero."""
+        with self._lock:
+            den = self._counters.get(denominator, 0)
+            return self._counters.get(numerator, 0) / den if den else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and summary statistics of every timing series."""
+        with self._lock:
+            counters = dict(self._counters)
+            observations = {name: sorted(window) for name, window in self._observations.items()}
+
+        timings = {}
+        for name, values in observations.items():
+            if not values:
+                continue
+            timings[name] = {
+                "count": len(values),
+                "avg": sum(values) / len(values),
+                "p50": _percentile(values, 0.50),
+                "p95": _percentile(values, 0.95),
+                "max": values[-1],
+            }
+        return {"counters": counters, "timings": timings}
+
+
+metrics = Metrics()
@@ -0,0 +1,222 @@
+"""
+Deterministic NAF selection gate.
+
+Decides from the embedding matches alone whether the top match is a safe
+pick, so the NAF-selection LLM call is only made for ambiguous cases.
+
+Features:
+- score of the top match
+- gap between the top match and the runner-up
+- lexical overlap between mots_cles and the top activity label
+
+Every decision is counted in services.metrics, and can be appended to a JSONL
+log (NAF_SELECTION_LOG_FILE) to tune the thresholds offline:
+    python -m services.naf_selector tune decisions.jsonl
+"""
+
+import json
+import os
+import random
+import re
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import List, Tuple
+
+from services.activity_matcher import normalize_text
+from services.metrics import metrics
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+NAF_AUTO_SELECT_ENABLED = os.getenv("NAF_AUTO_SELECT_ENABLED", "true").lower() == "true"
+NAF_AUTO_SELECT_MIN_SCORE = float(os.getenv("NAF_AUTO_SELECT_MIN_SCORE", "0.6"))
+NAF_AUTO_SELECT_MIN_GAP = float(os.getenv("NAF_AUTO_SELECT_MIN_GAP", "0.05"))
+NAF_AUTO_SELECT_MIN_OVERLAP = float(os.getenv("NAF_AUTO_SELECT_MIN_OVERLAP", "0.5"))
+# Fraction of confident cases still sent to the LLM to measure agreement
+NAF_SELECTION_AUDIT_RATE = float(os.getenv("NAF_SELECTION_AUDIT_RATE", "0.05"))
+NAF_SELECTION_LOG_FILE = os.getenv("NAF_SELECTION_LOG_FILE", "")
+
+STOPWORDS = {
+    "les", "des", "une", "pour", "par", "avec", "sans", "dans", "sur", "aux",
+    "autres", "autre", "activites", "activite", "services", "service", "n.c.a",
+    "nca", "entreprise", "entreprises", "secteur", "societe", "societes",
+}
+
+_log_lock = threading.Lock()
+
+
+# ============================================================================
+# Features
+# ============================================================================
+
+def _tokens(text: str) -> List[str]:
+    """Content tokens of a label or query (normalized, no stopwords)."""
+    words = re.split(r"[^a-z0-9]+", normalize_text(text))
+    return [w for w in words if len(w) >= 3 and w not in STOPWORDS]
+
+
+def _same_stem(a: str, b: str) -> bool:
+    """Crude French stemming: equal, or sharing a prefix of at least 5 chars."""
+    if a == b:
+        return True
+    prefix = min(len(a), len(b), 5)
+    return prefix >= 5 and a[:prefix] == b[:prefix]
+
+
+def lexical_overlap(query: str, activity: str) -> float:
+    """
+    Overlap (0-1) between query and activity content words.
+
+    Coverage is computed in both directions and the best one kept, since
+    mots_cles are often enriched with synonyms ("informatique logiciel
+    développement") while labels can be long.
+    """
+    query_tokens = _tokens(query)
+    activity_tokens = _tokens(activity)
+    if not query_tokens or not activity_tokens:
+        return 0.0
+
+    query_covered = sum(1 for q in query_tokens if any(_same_stem(q, a) for a in activity_tokens))
+    activity_covered = sum(1 for a in activity_tokens if any(_same_stem(a, q) for q in query_tokens))
+    return max(query_covered / len(query_tokens), activity_covered / len(activity_tokens))
+
+
+@dataclass
+class SelectionConfidence:
+    """Features and verdict of the deterministic gate"""
+    top_score: float  # Similarity of the best match
+    gap: float  # Best score minus runner-up score (top score if single match)
+    overlap: float  # Lexical overlap between query and best match
+    confident: bool  # True if the top match can be selected without the LLM
+
+
+def assess_confidence(activity_query: str, matches: List[tuple]) -> SelectionConfidence:
+    """
+    Compute the gate features for a list of (activity, score, naf_codes) matches.
+
+    Matches are expected sorted by decreasing score, as returned by the
+    activity matcher.
+    """
+    if not matches:
+        return SelectionConfidence(top_score=0.0, gap=0.0, overlap=0.0, confident=False)
+
+    top_activity, top_score, top_codes = matches[0]
+    runner_up = matches[1][1] if len(matches) > 1 else 0.0
+    gap = top_score - runner_up
+    overlap = lexical_overlap(activity_query, top_activity)
+
+    confident = (
+        NAF_AUTO_SELECT_ENABLED
+        and bool(top_codes)
+        and top_score >= NAF_AUTO_SELECT_MIN_SCORE
+        and gap >= NAF_AUTO_SELECT_MIN_GAP
+        and overlap >= NAF_AUTO_SELECT_MIN_OVERLAP
+    )
+    return SelectionConfidence(top_score=top_score, gap=gap, overlap=overlap, confident=confident)
+
+
+def should_audit() -> bool:
+    """Randomly keep a confident case for the LLM to measure agreement."""
+    return random.random() < NAF_SELECTION_AUDIT_RATE
+
+
+# ============================================================================
+# Decision tracking
+# ============================================================================
+
+def record_decision(
+    activity_query: str,
+    matches: List[tuple],
+    confidence: SelectionConfidence,
+    source: str,
+    selected_indices: List[int],
+    no_good_match: bool = False
+) -> None:
+    """
+    Count a selection and optionally log it for offline tuning.
+
+    Args:
+        source: "auto" (gate), "llm" (ambiguous case) or "audit" (confident case
+            checked by the LLM)
+        selected_indices: Final selection
+    """
+    metrics.increment("naf_selection.total")
+    metrics.increment(f"naf_selection.{source}")
+
+    if source in ("llm", "audit"):
+        # Would the gate's choice (top match only) have matched the LLM?
+        agrees = selected_indices == [0] and not no_good_match
+        metrics.increment(f"naf_selection.{source}_top1_agree" if agrees else f"naf_selection.{source}_top1_disagree")
+
+    if not NAF_SELECTION_LOG_FILE:
+        return
+
+    entry = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "query": activity_query,
+        "candidates": [activity for activity, _, _ in matches],
+        "scores": [round(score, 4) for _, score, _ in matches],
+        **asdict(confidence),
+        "source": source,
+        "selected_indices": selected_indices,
+        "no_good_match": no_good_match,
+    }
+    try:
+        with _log_lock, open(NAF_SELECTION_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"[NafSelector] Failed to write decision log: {e}")
+
+
+# ============================================================================
+# Offline tuning
+# ============================================================================
+
+def tune(log_path: str) -> List[Tuple[float, float, float, float, float, int]]:
+    """
+    Replay LLM decisions from a log over a grid of thresholds.
+
+    Returns rows of (min_score, min_gap, min_overlap, skip_rate, agreement, n_skipped)
+    where agreement is the share of skipped cases in which the LLM chose
+    exactly the top match.
+    """
+    with open(log_path, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    labelled = [e for e in entries if e["source"] in ("llm", "audit")]
+    if not labelled:
+        return []
+
+    rows = []
+    for min_score in (0.45, 0.5, 0.55, 0.6, 0.65, 0.7):
+        for min_gap in (0.0, 0.02, 0.05, 0.08, 0.1):
+            for min_overlap in (0.0, 0.25, 0.5, 0.75):
+                skipped = [
+                    e for e in labelled
+                    if e["top_score"] >= min_score and e["gap"] >= min_gap and e["overlap"] >= min_overlap
+                ]
+                if not skipped:
+                    continue
+                agree = sum(1 for e in skipped if e["selected_indices"] == [0] and not e["no_good_match"])
+                rows.append((min_score, min_gap, min_overlap,
+                             len(skipped) / len(labelled), agree / len(skipped), len(skipped)))
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="NAF selection gate tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    tune_parser = subparsers.add_parser("tune", help="Grid-search thresholds on a decision log")
+    tune_parser.add_argument("log_file")
+    tune_parser.add_argument("--min-agreement", type=float, default=0.9)
+    args = parser.parse_args()
+
+    rows = tune(args.log_file)
+    rows = [r for r in rows if r[4] >= args.min_agreement]
+    rows.sort(key=lambda r: r[3], reverse=True)
+    print(f"{'score':>6} {'gap':>5} {'overlap':>7} {'skip':>6} {'agree':>6} {'n':>5}")
+    for min_score, min_gap, min_overlap, skip_rate, agreement, n in rows[:20]:
+        print(f"{min_score:>6.2f} {min_gap:>5.2f} {min_overlap:>7.2f} {skip_rate:>6.1%} {agreement:>6.1%} {n:>5}")
@@ -0,0 +1,217 @@
+"""
+Async stage executor with request deadlines.
+
+A pipeline is a graph of named stages. Each stage is an async function of
+the PipelineRun (request inputs and the outputs of the stages it depends
+on). Running a pipeline starts every stage as soon as its dependencies have
+finished, so independent stages overlap:
+
+    pipeline = Pipeline("chat", [
+        PipelineStage("extraction", extract),
+        PipelineStage("embedding", embed, depends_on=("extraction",)),
+        ...
+    ])
+    run = pipeline.start({"messages": messages})
+    await pipeline.run(run, until=("count",))   # Stops after "count"
+    await pipeline.run(run)                      # Resumes with the rest
+
+The whole run shares one Deadline. It bounds the run itself and, through a
+context variable inherited by stage tasks and worker threads, the timeouts
+of the network calls made by the stages (see remaining_timeout()).
+"""
+
+import asyncio
+import os
+import time
+from contextvars import Context, ContextVar, copy_context
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.metrics import metrics
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+# Overall time budget of a request through the pipeline, in seconds
+PIPELINE_DEADLINE = float(os.getenv("PIPELINE_DEADLINE", "45"))
+
+
+# ============================================================================
+# Deadlines
+# ============================================================================
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs past its deadline."""
+
+
+class Deadline:
+    """A point in time a request must be done by"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left (0 once expired)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("pipeline_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline of the pipeline run the caller belongs to, if any."""
+    return _current_deadline.get()
+
+
+def without_deadline() -> Context:
+    """
+    Copy of the current context with no request deadline.
+
+    For work shared by several requests (see services.singleflight): each
+    request enforces its own deadline while waiting, the shared work must
+    not stop at the first one's.
+    """
+    context = copy_context()
+    context.run(_current_deadline.set, None)
+    return context
+
+
+def remaining_timeout(timeout: float) -> float:
+    """
+    Timeout for a network call: `timeout`, capped by the request deadline.
+
+    Outside a pipeline run `timeout` is returned unchanged.
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"Request deadline of {deadline.seconds:g}s exceeded")
+    return min(timeout, remaining)
+
+
+# ============================================================================
+# Executor
+# ============================================================================
+
+@dataclass(frozen=True)
+class PipelineStage:
+    """A named step and the stages whose outputs it needs"""
+    name: str
+    run: Callable[["PipelineRun"], Awaitable[Any]]
+    depends_on: Tuple[str, ...] = ()
+
+
+class PipelineRun:
+    """State of one request through a pipeline"""
+
+    def __init__(self, inputs: Dict[str, Any], deadline: Deadline):
+        self.inputs = inputs
+        self.deadline = deadline
+        self.outputs: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}  # Stage -> seconds
+        self.state: Dict[str, Any] = {}  # Scratch space shared by the stages
+        self.halted = False
+
+    def __getitem__(self, stage: str) -> Any:
+        return self.outputs[stage]
+
+    def halt(self) -> None:
+        """Stop after the running stages (e.g. the request was rejected)."""
+        self.halted = True
+
+    def timings_ms(self) -> Dict[str, int]:
+        return {name: round(seconds * 1000) for name, seconds in self.timings.items()}
+
+
+class Pipeline:
+    """Runs a graph of stages, each as soon as its dependencies are done."""
+
+    def __init__(self, name: str, stages: List[PipelineStage]):
+        self.name = name
+        self.stages: Dict[str, PipelineStage] = {}
+        # Declaration order must be a valid topological order
+        for stage in stages:
+            for dep in stage.depends_on:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown or later stage '{dep}'")
+            self.stages[stage.name] = stage
+
+    def start(self, inputs: Dict[str, Any], deadline: Optional[float] = None) -> PipelineRun:
+        """New run; its deadline starts now (default PIPELINE_DEADLINE)."""
+        return PipelineRun(inputs, Deadline(PIPELINE_DEADLINE if deadline is None else deadline))
+
+    def _required(self, until: Optional[Iterable[str]]) -> Set[str]:
+        """The target stages and everything they depend on."""
+        if until is None:
+            return set(self.stages)
+        required: Set[str] = set()
+        pending = list(until)
+        while pending:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                pending.extend(self.stages[name].depends_on)
+        return required
+
+    async def _run_stage(self, stage: PipelineStage, run: PipelineRun) -> Any:
+        start = time.perf_counter()
+        try:
+            return await stage.run(run)
+        finally:
+            elapsed = time.perf_counter() - start
+            run.timings[stage.name] = elapsed
+            metrics.observe(f"pipeline.{stage.name}.latency", elapsed)
+
+    async def run(self, run: PipelineRun, until: Optional[Iterable[str]] = None) -> PipelineRun:
+        """
+        Run the stages needed for `until` (default: all) that have no output yet.
+
+        A stage error cancels the other running stages and is re-raised.
+
+        Raises:
+            DeadlineExceeded: If the run's deadline passes first
+        """
+        required = self._required(until)
+        pending = [name for name in self.stages if name in required and name not in run.outputs]
+        running: Dict[asyncio.Task, str] = {}
+        token = _current_deadline.set(run.deadline)
+        try:
+            while True:
+                if not run.halted:
+                    for name in list(pending):
+                        if all(dep in run.outputs for dep in self.stages[name].depends_on):
+                            pending.remove(name)
+                            task = asyncio.create_task(self._run_stage(self.stages[name], run))
+                            running[task] = name
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(
+                    running, timeout=run.deadline.remaining(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    metrics.increment(f"pipeline.{self.name}.deadline_exceeded")
+                    stages = ", ".join(sorted(running.values()))
+                    print(f"[Pipeline] {self.name}: deadline of {run.deadline.seconds:g}s exceeded in {stages}")
+                    raise DeadlineExceeded(
+                        f"Request deadline of {run.deadline.seconds:g}s exceeded (running: {stages})"
+                    )
+                for task in done:
+                    name = running.pop(task)
+                    run.outputs[name] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            _current_deadline.reset(token)
+        return run
@@ -0,0 +1,188 @@
+"""
+Readiness tracking for components initialized in the background.
+
+The API starts serving immediately; slow components (activity embeddings,
+location reference lists) initialize in background tasks. Endpoints that
+need a component await it with a bounded timeout.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Maximum time an endpoint waits for a component before answering 503
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "10"))
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class ComponentNotReadyError(Exception):
+    """Raised when a component is still initializing after the wait timeout."""
+
+    def __init__(self, component: str, state: str):
+        super().__init__(f"Component '{component}' is not ready ({state})")
+        self.component = component
+        self.state = state
+
+
+@dataclass
+class ComponentStatus:
+    """Initialization state of one component"""
+    name: str
+    state: str = PENDING  # "pending", "ready" or "failed"
+    detail: Optional[str] = None  # Human-readable status or error
+    started_at: Optional[float] = None  # time.monotonic() when initialization started
+    duration: Optional[float] = None  # Seconds spent initializing
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "detail": self.detail,
+            "duration_s": round(self.duration, 3) if self.duration is not None else None,
+        }
+
+
+class ReadinessRegistry:
+    """Tracks background initialization of named components."""
+
+    def __init__(self):
+        self._status: Dict[str, ComponentStatus] = {}
+        self._done: Dict[str, asyncio.Event] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._probes: Dict[str, Callable[[], bool]] = {}
+
+    def start(
+        self,
+        name: str,
+        initializer: Callable[[], Awaitable[bool]],
+        describe: Optional[Callable[[], str]] = None,
+        probe: Optional[Callable[[], bool]] = None
+    ) -> asyncio.Task:
+        """
+        Run `initializer` in a background task and track its outcome.
+
+        Args:
+            name: Component name
+            initializer: Coroutine factory returning True on success
+            describe: Optional callable giving a status detail once ready
+            probe: Optional check promoting a failed component to ready once it
+                recovered (e.g. a later lazy initialization succeeded)
+        """
+        status = ComponentStatus(name=name, started_at=time.monotonic())
+        self._status[name] = status
+        done = self._done[name] = asyncio.Event()
+        if probe:
+            self._probes[name] = probe
+
+        async def run() -> None:
+            try:
+                ok = await initializer()
+                status.state = READY if ok else FAILED
+                if ok and describe:
+                    status.detail = describe()
+                elif not ok:
+                    status.detail = "initialization returned no data"
+            except Exception as e:
+                status.state = FAILED
+                status.detail = f"error: {e}"
+            finally:
+                status.duration = time.monotonic() - status.started_at
+                done.set()
+                print(f"[Readiness] {name}: {status.state} in {status.duration:.2f}s")
+
+        task = asyncio.get_running_loop().create_task(run(), name=f"init-{name}")
+        self._tasks[name] = task
+        return task
+
+    def _refresh(self, status: ComponentStatus) -> ComponentStatus:
+        """Re-check a failed component with its probe."""
+        probe = self._probes.get(status.name)
+        if status.state == FAILED and probe and probe():
+            status.state = READY
+            status.detail = "recovered"
+        return status
+
+    def is_ready(self, name: str) -> bool:
+        status = self._status.get(name)
+        return status is not None and self._refresh(status).state == READY
+
+    async def wait(self, *names: str, timeout: float = READINESS_TIMEOUT) -> None:
+        """
+        Wait until the given components have finished initializing.
+
+        A failed component does not raise: callers degrade as they did before
+        background initialization (e.g. no activity matching). Components that
+        were never started are not waited for.
+
+        Raises:
+            ComponentNotReadyError: If a component is still pending after `timeout`
+        """
+        deadline = time.monotonic() + timeout
+        for name in names:
+            done = self._done.get(name)
+            if done is None or done.is_set():
+                continue
+            try:
+                await asyncio.wait_for(done.wait(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise ComponentNotReadyError(name, self._status[name].state) from None
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Status of every tracked component."""
+        return {name: self._refresh(status).to_dict() for name, status in self._status.items()}
+
+    @property
+    def all_ready(self) -> bool:
+        return bool(self._status) and all(self.is_ready(name) for name in self._status)
+
+
+# ============================================================================
+# Module-level Singleton
+# ============================================================================
+
+readiness = ReadinessRegistry()
+
+ACTIVITY_MATCHER = "activity_matcher"
+LOCATION_MATCHER = "location_matcher"
+
+
+def start_background_initialization() -> None:
+    """Initialize the matchers in background tasks (called from the startup event)."""
+    from services import activity_matcher
+    from services.activity_matcher import get_activity_matcher
+    from services.location_matcher import get_location_matcher
+
+    async def init_activity_matcher() -> bool:
+        return (await get_activity_matcher())._initialized
+
+    async def init_location_matcher() -> bool:
+        # File parsing is blocking, keep it off the event loop
+        matcher = await asyncio.to_thread(get_location_matcher)
+        if matcher._initialized:
+            # The rule-based extractor indexes the same lists; the vague
+            # classifier trains on top of it
+            from services.rule_extractor import get_rule_extractor
+            from services.vague_classifier import get_vague_classifier
+            await asyncio.to_thread(get_rule_extractor)
+            await asyncio.to_thread(get_vague_classifier)
+        return matcher._initialized
+
+    def describe_locations() -> str:
+        matcher = get_location_matcher()
+        return f"{len(matcher.communes)} communes, {len(matcher.departements)} deps, {len(matcher.regions)} regions"
+
+    def activity_matcher_recovered() -> bool:
+        matcher = activity_matcher._activity_matcher
+        return matcher is not None and matcher._initialized
+
+    readiness.start(
+        ACTIVITY_MATCHER,
+        init_activity_matcher,
+        describe=lambda: "file-based",
+        probe=activity_matcher_recovered,
+    )
+    readiness.start(LOCATION_MATCHER, init_location_matcher, describe=describe_locations)
@@ -0,0 +1,170 @@
+"""
+Deterministic assistant messages, without the response-generation LLM call.
+
+Follows the instructions of RESPONSE_GENERATION_PROMPT from the data the
+pipeline already holds (count, criteria, activity matches, location
+corrections):
+1. count > 1000: suggest criteria to narrow the search
+2. count = 0: suggest broadening or correcting the criteria
+3. corrections made: mention them
+4. selected activity matches with a low score (< 50%): suggest checking them
+5. at most 3 sentences
+
+Used when the service sheds load, when a request asks for it, and as the
+fallback when the response LLM call fails.
+"""
+
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from services.agent_service import ActivityMatch, LocationCorrectionInfo
+
+LOW_SCORE_THRESHOLD = 0.5
+MAX_SENTENCES = 3
+
+FIELD_LABELS = {
+    "region": "la région",
+    "departement": "le département",
+    "commune": "la commune",
+    "code_postal": "le code postal",
+}
+
+
+def format_count(count: int) -> str:
+    """1234567 -> "1 234 567" """
+    return f"{count:,}".replace(",", " ")
+
+
+def _values(value: Any) -> str:
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    return str(value)
+
+
+def _scope(extraction_result: Dict[str, Any]) -> str:
+    """ " dans le secteur « Restauration » en Bretagne (PME)" """
+    scope = ""
+    act = extraction_result.get("activite") or {}
+    if act.get("present") and act.get("activite_entreprise"):
+        scope += f" dans le secteur « {act['activite_entreprise']} »"
+
+    loc = extraction_result.get("localisation") or {}
+    if loc.get("present"):
+        if loc.get("commune"):
+            scope += f" à {_values(loc['commune'])}"
+        elif loc.get("code_postal"):
+            scope += f" dans le {_values(loc['code_postal'])}"
+        elif loc.get("departement"):
+            scope += f" dans le département {_values(loc['departement'])}"
+        elif loc.get("region"):
+            scope += f" en {_values(loc['region'])}"
+
+    taille = extraction_result.get("taille_entreprise") or {}
+    if taille.get("present") and taille.get("acronyme"):
+        scope += f" ({taille['acronyme']})"
+    return scope
+
+
+def _count_sentence(company_count: int, extraction_result: Dict[str, Any]) -> str:
+    scope = _scope(extraction_result)
+    if company_count == 0:
+        return f"Aucune entreprise ne correspond à votre recherche{scope}."
+    if company_count == 1:
+        return f"J'ai trouvé 1 entreprise{scope}."
+    return f"J'ai trouvé {format_count(company_count)} entreprises{scope}."
+
+
+def _corrections_sentence(location_corrections: Optional[List["LocationCorrectionInfo"]]) -> Optional[str]:
+    parts = []
+    for c in location_corrections or []:
+        if c.field_changed:
+            label = FIELD_LABELS.get(c.corrected_field, c.corrected_field)
+            parts.append(f"« {c.original} » comme {label} « {c.corrected} »")
+        elif c.original != c.corrected:
+            parts.append(f"« {c.original} » comme « {c.corrected} »")
+    if not parts:
+        return None
+    return f"J'ai interprété {', '.join(parts)}."
+
+
+def _activity_sentence(activity_matches: List["ActivityMatch"]) -> Optional[str]:
+    selected = [m for m in activity_matches if m.selected]
+    if activity_matches and not selected:
+        return ("Aucune activité ne correspond précisément à votre demande : "
+                "vérifiez ou sélectionnez les activités proposées.")
+    low = [m for m in selected if m.score < LOW_SCORE_THRESHOLD]
+    if not low:
+        return None
+    labels = ", ".join(f"« {m.activity} » ({m.score * 100:.0f} %)" for m in low)
+    return f"La correspondance avec {labels} est approximative : vérifiez les activités sélectionnées."
+
+
+def _refinements(extraction_result: Dict[str, Any]) -> List[str]:
+    """Criteria not given yet that would narrow the search, most useful first."""
+    suggestions = []
+    loc = extraction_result.get("localisation") or {}
+    if not loc.get("present"):
+        suggestions.append("une région, un département ou une commune")
+    elif loc.get("region") and not any(loc.get(k) for k in ("departement", "commune", "code_postal")):
+        suggestions.append("un département ou une commune")
+    if not (extraction_result.get("taille_entreprise") or {}).get("present"):
+        suggestions.append("la taille (TPE, PME, ETI, GE)")
+    if not (extraction_result.get("criteres_financiers") or {}).get("present"):
+        suggestions.append("un chiffre d'affaires minimum")
+    if not (extraction_result.get("criteres_juridiques") or {}).get("present"):
+        suggestions.append("la forme juridique ou la date de création")
+    return suggestions
+
+
+def _suggestion_sentence(company_count: int, extraction_result: Dict[str, Any]) -> Optional[str]:
+    if company_count == 0:
+        given = [
+            label for key, label in (
+                ("localisation", "la zone géographique"),
+                ("taille_entreprise", "la taille"),
+                ("criteres_financiers", "les critères financiers"),
+                ("criteres_juridiques", "les critères juridiques"),
+            )
+            if (extraction_result.get(key) or {}).get("present")
+        ]
+        if given:
+            return f"Essayez d'élargir {' ou '.join(given[:2])}, ou de reformuler l'activité."
+        return "Essayez de reformuler ou d'élargir l'activité recherchée."
+    if company_count > 1000:
+        suggestions = _refinements(extraction_result)
+        if suggestions:
+            return f"Pour affiner, précisez par exemple {', ou '.join(suggestions[:2])}."
+        return "Pour affiner, ajustez la localisation ou les critères financiers."
+    if company_count > 500:
+        return "Vous pouvez encore affiner si besoin (taille, chiffre d'affaires, localisation...)."
+    return None
+
+
+def build_template_response(
+    company_count: int,
+    extraction_result: Dict[str, Any],
+    activity_matches: Optional[List["ActivityMatch"]] = None,
+    location_corrections: Optional[List["LocationCorrectionInfo"]] = None,
+) -> str:
+    """
+    Assistant message for a search result, in at most MAX_SENTENCES sentences.
+
+    The count sentence always comes first; when too many remarks apply the
+    refinement suggestion (for empty or very large results) is kept over the
+    corrections, themselves kept over the activity warning.
+    """
+    count = _count_sentence(company_count, extraction_result)
+    corrections = _corrections_sentence(location_corrections)
+    activity = _activity_sentence(activity_matches or [])
+    suggestion = _suggestion_sentence(company_count, extraction_result)
+
+    # (priority, position, sentence): the largest priorities are dropped first
+    urgent = company_count == 0 or company_count > 1000
+    candidates = [
+        (0, 0, count),
+        (1 if urgent else 4, 3, suggestion),
+        (2, 1, corrections),
+        (3, 2, activity),
+    ]
+    kept = sorted((c for c in candidates if c[2]), key=lambda c: c[0])[:MAX_SENTENCES]
+    return " ".join(sentence for _, _, sentence in sorted(kept, key=lambda c: c[1]))
@@ -0,0 +1,618 @@
+"""
+Rule-based fast-path extractor.
+
+Most first-turn queries are simple ("PME informatique à Lyon", "restauration
+en Bretagne avec plus de 2M€ de CA"). This extractor handles them without the
+LLM and returns the same extraction_result schema as AgentService.process_message
+(after location matching and size transform), with a confidence score.
+
+Components:
+- Location spotter: exact n-gram lookup over the commune / departement / region
+  lists, after a location cue ("à", "en", "dans le"...), plus postal codes and
+  departement numbers
+- Size: TPE/PME/ETI/GE acronyms and "N à M salariés"-style expressions,
+  resolved with size_matcher.parse_size_expression
+- Regexes for the CA threshold and creation dates
+- Activity lexical index: the words left over must be known activity
+  vocabulary, otherwise confidence drops and the LLM takes over
+
+Evaluation on the synthetic dataset:
+    python -m services.rule_extractor evaluate --dataset ../synthetic_dataset.json
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from services.activity_matcher import ACTIVITIES_FILE, NAF_MAPPING_FILE, normalize_text
+from services.location_matcher import DEPARTEMENT_NUMBERS, get_location_matcher
+from services.size_matcher import transform_size_field
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+RULE_EXTRACTOR_ENABLED = os.getenv("RULE_EXTRACTOR_ENABLED", "true").lower() == "true"
+# Below this confidence the query goes to the LLM
+RULE_EXTRACTOR_MIN_CONFIDENCE = float(os.getenv("RULE_EXTRACTOR_MIN_CONFIDENCE", "0.9"))
+
+# Longest location name in tokens ("Saint-Pierre et Miquelon", "Provence-Alpes-Cote d'Azur"...)
+MAX_LOCATION_TOKENS = 6
+
+# Words introducing a location. Communes only after "à"-like cues: "en" and
+# "dans" introduce regions and departements, and also appear inside activity
+# labels ("articles en bois").
+LOCATION_CUES = {"a", "au", "aux", "en", "dans", "sur", "vers", "pres", "autour", "proche"}
+COMMUNE_CUES = {"a", "au", "aux", "sur", "vers", "pres", "autour", "proche"}
+# Words introducing a departement number only ("entreprises du 69")
+NUMBER_CUES = {"du"}
+# Words allowed between the cue and the location name ("dans le", "en région")
+LOCATION_SKIP = {"le", "la", "les", "l'", "de", "du", "d'", "region", "departement", "ville", "commune"}
+# Separators between several locations ("à Lyon et Marseille")
+LOCATION_SEPARATORS = {"et", "ou"}
+
+# Words trimmed at both ends of the activity
+EDGE_WORDS = {
+    "basees", "basee", "bases", "situees", "situee", "situes", "implantees", "implantee",
+    "localisees", "localisee", "presentes", "avec", "ayant", "qui", "un", "une", "des", "de",
+    "du", "d'", "les", "le", "la", "l'", "dans", "en", "a", "au", "aux", "et", "ou", "pour",
+    "par", "sur", "svp", "merci",
+}
+# Request phrasing and generic nouns, trimmed before the activity only
+# (trailing "entreprises" can belong to the activity: "soutien aux entreprises")
+LEADING_WORDS = EDGE_WORDS | {
+    "je", "j'", "cherche", "recherche", "rechercher", "trouve", "trouver", "trouvez", "trouve-moi",
+    "trouvez-moi", "pourriez-vous", "pouvez-vous", "peux-tu", "liste", "lister", "listez", "liste-moi",
+    "affiche", "affichez", "afficher", "affiche-moi", "montre-moi", "montrez-moi", "donne-moi",
+    "donnez-moi", "extraction", "extraire", "quelles", "quels", "sont", "voudrais", "veux",
+    "entreprises", "entreprise", "societes", "societe", "boites", "boite", "structures", "secteur",
+    "domaine", "toutes", "tous", "cible", "y", "a-t-il", "sortir", "sors", "sors-moi",
+}
+
+# Words the schema cannot express: leave these queries to the LLM
+NEGATION_WORDS = {"sauf", "hors", "pas", "non", "excepte", "exclure", "excluant", "sans"}
+
+# Leftover words that don't count against the activity coverage
+NEUTRAL_WORDS = LEADING_WORDS | {"n.c.a.", "nca", "autres", "autre"}
+
+ACRONYMS = {"tpe": "TPE", "pme": "PME", "eti": "ETI", "ge": "GE", "mic": "MIC"}
+SIZE_PHRASES = re.compile(r"(?:les )?(?:grands? groupes?|grandes entreprises)")
+
+_TOKEN_RE = re.compile(r"(?:[^\W\d_]\.){2,}|\d+(?:[.,]\d+)?|[^\W\d_]'|[^\W\d_]+(?:-[^\W\d_]+)*|[€<>=]")
+
+_EMPLOYEES = r"(?:salaries?|employes?|personnes|collaborateurs)"
+_NUMBER = r"(\d+(?:[.,]\d+)?(?: \d{3})*)"
+_AMOUNT_UNIT = r"(k|m|md|mds|mille|million|millions|milliard|milliards)?(?: ?(?:€|euros?|eur))?"
+_CA = r"(?:ca|chiffre d' affaires)(?: annuel)?"
+_AT_LEAST = r"(?:d' au moins|au moins|au minimum|minimum|min|de plus de|plus de|superieur a|superieurs a|> =|>|de)"
+
+# Patterns run on the space-joined normalized tokens
+CA_PATTERNS = [
+    re.compile(rf"(?:avec (?:un )?)?{_CA} (?:{_AT_LEAST} )?{_NUMBER} {_AMOUNT_UNIT}"),
+    re.compile(rf"(?:avec )?(?:{_AT_LEAST} )?{_NUMBER} {_AMOUNT_UNIT} (?:de )?{_CA}"),
+]
+SIZE_PATTERNS = [
+    (re.compile(rf"(?:avec )?(?:de |entre )?(\d+) (?:a|-|et|ou) (\d+) {_EMPLOYEES}"), "{0}-{1}"),
+    (re.compile(rf"(?:avec )?(?:plus de|au moins|> =|>) (\d+) {_EMPLOYEES}"), ">{0}"),
+    (re.compile(rf"(?:avec )?(?:moins de|< =|<) (\d+) {_EMPLOYEES}"), "<{0}"),
+    (re.compile(rf"(?:avec )?(\d+) {_EMPLOYEES}"), "{0}"),
+]
+_CREATED = r"(?:creees?|crees?|fondees?|immatriculees?)"
+DATE_PATTERNS = [
+    (re.compile(rf"(?:{_CREATED} )?entre (\d{{4}}) et (\d{{4}})"), "between"),
+    (re.compile(rf"{_CREATED} en (\d{{4}})"), "year"),
+    (re.compile(rf"(?:{_CREATED} )?(?:depuis|apres) (\d{{4}})"), "after"),
+    (re.compile(rf"(?:{_CREATED} )?avant (\d{{4}})"), "before"),
+    (re.compile(r"(?:de |ayant )?plus de (\d+) ans"), "older"),
+    (re.compile(r"(?:de |ayant )?moins de (\d+) ans"), "younger"),
+]
+POSTAL_CODE_RE = re.compile(r"^(?:0[1-9]|[1-8]\d|9[0-8])\d{3}$")
+
+
+# ============================================================================
+# Tokenization
+# ============================================================================
+
+@dataclass
+class Token:
+    text: str  # As typed
+    norm: str  # Lowercase, no accents
+    span: Tuple[int, int] = (0, 0)  # Position in the query
+    start: int = 0  # Offset in the joined normalized string
+    consumed: bool = False
+
+
+def tokenize(text: str) -> List[Token]:
+    """Split a query into tokens; elisions ("l'", "d'") are separate tokens."""
+    text = text.replace("’", "'")
+    tokens = [
+        Token(text=m.group(), norm=normalize_text(m.group()), span=m.span())
+        for m in _TOKEN_RE.finditer(text)
+    ]
+    offset = 0
+    for token in tokens:
+        token.start = offset
+        offset += len(token.norm) + 1
+    return tokens
+
+
+def _key(text: str) -> str:
+    """Lookup key of a reference name, tokenized like queries."""
+    return " ".join(t.norm for t in tokenize(text))
+
+
+def _parse_amount(number: str, unit: Optional[str]) -> float:
+    value = float(number.replace(" ", "").replace(",", "."))
+    unit = (unit or "").strip()
+    if unit in ("k", "mille"):
+        value *= 1_000
+    elif unit in ("m", "million", "millions"):
+        value *= 1_000_000
+    elif unit in ("md", "mds", "milliard", "milliards"):
+        value *= 1_000_000_000
+    return value
+
+
+# ============================================================================
+# Extractor
+# ============================================================================
+
+@dataclass
+class RuleExtraction:
+    """Result of the rule-based extractor"""
+    extraction_result: Optional[Dict[str, Any]]  # Same schema as process_message, None if nothing found
+    confidence: float  # 0-1, compare to RULE_EXTRACTOR_MIN_CONFIDENCE
+    unknown_words: List[str] = field(default_factory=list)  # Leftover words not in the activity vocabulary
+
+
+class RuleExtractor:
+    """Deterministic extractor built on the location lists and activity labels."""
+
+    def __init__(self):
+        self._locations: Dict[str, Tuple[str, str]] = {}  # key -> (field, canonical value)
+        self._activity_words: Set[str] = set()
+        self._activity_stems: Set[str] = set()
+        self._activity_bigrams: Set[Tuple[str, str]] = set()  # ("non", "metalliques"), ("hors", "assurance")
+        self._initialized = False
+
+    def initialize(self) -> bool:
+        """Build the location and activity indexes (blocking)."""
+        location_matcher = get_location_matcher()
+        if not location_matcher._initialized:
+            return False
+
+        # Lower priority first: a region named like a commune stays a region
+        for field_name, values in (
+            ("commune", location_matcher.communes),
+            ("departement", location_matcher.departements),
+            ("region", location_matcher.regions),
+        ):
+            for value in values:
+                self._locations[_key(value)] = (field_name, value)
+
+        labels: List[str] = []
+        if ACTIVITIES_FILE.exists():
+            with open(ACTIVITIES_FILE, "r", encoding="utf-8") as f:
+                labels.extend(line.strip() for line in f if line.strip())
+        if NAF_MAPPING_FILE.exists():
+            with open(NAF_MAPPING_FILE, "r", encoding="utf-8") as f:
+                labels.extend(k for k in json.load(f) if not k.startswith("_"))
+        for label in labels:
+            label_tokens = tokenize(label)
+            self._activity_bigrams.update(zip((t.norm for t in label_tokens), (t.norm for t in label_tokens[1:])))
+            for token in label_tokens:
+                for word in token.norm.split("-"):
+                    self._activity_words.add(word)
+                    if len(word) >= 5:
+                        self._activity_stems.add(word[:5])
+
+        self._initialized = True
+        print(f"[RuleExtractor] Indexed {len(self._locations)} location names, "
+              f"{len(self._activity_words)} activity words")
+        return True
+
+    def _is_activity_word(self, word: str) -> bool:
+        """Known activity vocabulary (exact word, or same 5-letter stem)."""
+        parts = [p for p in word.split("-") if p]
+        return bool(parts) and all(
+            p in self._activity_words or (len(p) >= 5 and p[:5] in self._activity_stems)
+            for p in parts
+        )
+
+    # ------------------------------------------------------------------
+    # Spotters
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _consume_span(tokens: List[Token], start: int, end: int) -> List[Token]:
+        """Mark the tokens overlapping [start, end) of the joined string as consumed."""
+        span = [t for t in tokens if not t.consumed and t.start < end and t.start + len(t.norm) > start]
+        for t in span:
+            t.consumed = True
+        return span
+
+    def _spot_patterns(self, tokens: List[Token], joined: str, patterns: List[re.Pattern]) -> List[re.Match]:
+        """Find non-overlapping matches on unconsumed tokens and consume them."""
+        found = []
+        for pattern in patterns:
+            for match in pattern.finditer(joined):
+                span = [t for t in tokens if t.start < match.end() and t.start + len(t.norm) > match.start()]
+                if any(t.consumed for t in span):
+                    continue
+                for t in span:
+                    t.consumed = True
+                found.append(match)
+        return found
+
+    def _spot_locations(self, tokens: List[Token]) -> Dict[str, List[str]]:
+        """Exact n-gram lookup of place names after a location cue."""
+        found: Dict[str, List[str]] = {"commune": [], "departement": [], "region": [], "code_postal": []}
+
+        def lookup(i: int, communes: bool = True) -> Optional[Tuple[int, str, str]]:
+            """Longest place name starting at token i: (end, field, value)."""
+            if i >= len(tokens) or tokens[i].consumed:
+                return None
+            if tokens[i].norm.isdigit():
+                number = tokens[i].norm
+                if POSTAL_CODE_RE.match(number):
+                    return i + 1, "code_postal", number
+                dept = DEPARTEMENT_NUMBERS.get(number.zfill(2))
+                if dept:
+                    canonical = self._locations.get(_key(dept), ("departement", dept))[1]
+                    return i + 1, "departement", canonical
+                return None
+            for n in range(min(MAX_LOCATION_TOKENS, len(tokens) - i), 0, -1):
+                window = tokens[i:i + n]
+                if any(t.consumed for t in window):
+                    continue
+                entry = self._locations.get(" ".join(t.norm for t in window))
+                if entry and (communes or entry[0] != "commune"):
+                    return i + n, entry[0], entry[1]
+            return None
+
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            postal = token.norm.isdigit() and POSTAL_CODE_RE.match(token.norm) and not token.consumed
+            # "du 69": departement numbers only
+            number_cue = (token.norm in NUMBER_CUES and i + 1 < len(tokens) and tokens[i + 1].norm.isdigit())
+            if token.consumed or (token.norm not in LOCATION_CUES and not postal and not number_cue):
+                i += 1
+                continue
+
+            # Cue, then up to 3 skip words ("dans le", "en région de la")
+            j = i if postal else i + 1
+            communes = token.norm in COMMUNE_CUES
+            match = lookup(j, communes)
+            while match is None and j < len(tokens) and j - i <= 3 and tokens[j].norm in LOCATION_SKIP:
+                j += 1
+                match = lookup(j, communes)
+            if match is None:
+                i += 1
+                continue
+
+            span_start = i
+            while match is not None:
+                end, field_name, value = match
+                if value not in found[field_name]:
+                    found[field_name].append(value)
+                for t in tokens[span_start:end]:
+                    t.consumed = True
+                # Chained locations: "à Lyon et Marseille", "en Bretagne, Normandie"
+                span_start = end
+                if end < len(tokens) and tokens[end].norm in LOCATION_SEPARATORS:
+                    match = lookup(end + 1, communes)
+                else:
+                    match = lookup(end, communes)
+            i = span_start
+        return found
+
+    # ------------------------------------------------------------------
+    # Extraction
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _activity_text(query: str, tokens: List[Token], leftover: List[Token]) -> Optional[str]:
+        """Leftover words as typed (punctuation kept), one segment per contiguous run."""
+        if not leftover:
+            return None
+        segments = []
+        run_start = run_end = None
+        kept = set(id(t) for t in leftover)
+        for token in tokens[tokens.index(leftover[0]):tokens.index(leftover[-1]) + 1]:
+            if id(token) in kept:
+                run_start = token.span[0] if run_start is None else run_start
+                run_end = token.span[1]
+            elif run_start is not None:
+                segments.append(query[run_start:run_end])
+                run_start = None
+        if run_start is not None:
+            segments.append(query[run_start:run_end])
+        return " ".join(s.strip(" ,;") for s in segments) or None
+
+    def extract(self, query: str) -> RuleExtraction:
+        """Extract criteria from a single user message."""
+        if not self._initialized:
+            return RuleExtraction(extraction_result=None, confidence=0.0)
+
+        tokens = tokenize(query)
+        if not tokens:
+            return RuleExtraction(extraction_result=None, confidence=0.0)
+        joined = " ".join(t.norm for t in tokens)
+
+        # Financial criteria
+        ca = None
+        for match in self._spot_patterns(tokens, joined, CA_PATTERNS):
+            ca = _parse_amount(match.group(1), match.group(2))
+
+        # Company size
+        size_expression = None
+        for token in tokens:
+            if not token.consumed and token.norm in ACRONYMS and (token.text.isupper() or token.norm != "ge"):
+                size_expression = ACRONYMS[token.norm]
+                token.consumed = True
+        for _ in self._spot_patterns(tokens, joined, [SIZE_PHRASES]):
+            size_expression = "GE"
+        for pattern, template in SIZE_PATTERNS:
+            for match in self._spot_patterns(tokens, joined, [pattern]):
+                size_expression = template.format(*match.groups())
+
+        # Creation dates
+        date_min = date_max = None
+        current_year = datetime.now().year
+        for pattern, kind in DATE_PATTERNS:
+            for match in self._spot_patterns(tokens, joined, [pattern]):
+                if kind == "between":
+                    date_min, date_max = sorted(match.groups())
+                elif kind == "year":
+                    date_min = date_max = match.group(1)
+                elif kind == "after":
+                    date_min = match.group(1)
+                elif kind == "before":
+                    date_max = match.group(1)
+                elif kind == "older":
+                    date_max = str(current_year - int(match.group(1)))
+                elif kind == "younger":
+                    date_min = str(current_year - int(match.group(1)))
+
+        locations = self._spot_locations(tokens)
+
+        # Activity: what is left, trimmed of request phrasing
+        leftover = [t for t in tokens if not t.consumed]
+        while leftover and leftover[0].norm in LEADING_WORDS:
+            leftover.pop(0)
+        while leftover and leftover[-1].norm in EDGE_WORDS:
+            leftover.pop()
+        activity_text = self._activity_text(query, tokens, leftover)
+
+        content_words = [t.norm for t in leftover if t.norm not in NEUTRAL_WORDS and not t.norm.isdigit()]
+        unknown = [w for w in content_words if not self._is_activity_word(w)]
+        # Numbers left over mean an amount, size or date we did not understand
+        unknown += [t.norm for t in leftover if t.norm.isdigit()]
+
+        has_location = any(locations.values())
+        has_criteria = bool(activity_text or has_location or size_expression or ca or date_min or date_max)
+        if not has_criteria:
+            return RuleExtraction(extraction_result=None, confidence=0.0)
+
+        known = len(content_words) - len([w for w in unknown if not w.isdigit()])
+        confidence = known / len(content_words) if content_words else 1.0
+        if any(t.norm.isdigit() for t in leftover):
+            confidence = 0.0
+        # Size or financial criteria alone ("une PME"): the LLM decides whether to ask for more
+        if not (activity_text or has_location):
+            confidence = min(confidence, 0.5)
+        # Exclusions can't be expressed in the schema (unless part of a label: "non metalliques")
+        for current, following in zip(tokens, tokens[1:] + [None]):
+            if current.norm in NEGATION_WORDS and (
+                following is None or (current.norm, following.norm) not in self._activity_bigrams
+            ):
+                confidence *= 0.3
+                break
+
+        def joined_or_none(values: List[str]) -> Optional[str]:
+            return ", ".join(values) if values else None
+
+        extraction = {
+            "localisation": {
+                "present": has_location,
+                "code_postal": joined_or_none(locations["code_postal"]),
+                "departement": joined_or_none(locations["departement"]),
+                "region": joined_or_none(locations["region"]),
+                "commune": joined_or_none(locations["commune"]),
+            },
+            "activite": {
+                "present": activity_text is not None,
+                "activite_entreprise": activity_text,
+                "mots_cles": activity_text.lower() if activity_text else None,
+            },
+            "taille_entreprise": {
+                "present": size_expression is not None,
+                "effectif_expression": size_expression,
+            },
+            "criteres_financiers": {
+                "present": ca is not None,
+                "ca_plus_recent": ca,
+                "resultat_net_plus_recent": None,
+                "rentabilite_plus_recente": None,
+            },
+            "criteres_juridiques": {
+                "present": bool(date_min or date_max),
+                "categorie_juridique": None,
+                "siege_entreprise": None,
+                "date_creation_entreprise_min": date_min,
+                "date_creation_entreprise_max": date_max,
+                "capital": None,
+                "nombre_etablissements": None,
+            },
+        }
+        # Same post-processing as the LLM path (locations are already canonical).
+        # Quiet: the correction is discarded, and the vague classifier runs
+        # this on every training example
+        extraction, _ = transform_size_field(extraction, verbose=False)
+        if size_expression and not extraction["taille_entreprise"].get("tranche_effectif"):
+            # Not an INSEE range boundary ("50 salariés"): the LLM picks a range
+            confidence = 0.0
+        return RuleExtraction(extraction_result=extraction, confidence=confidence, unknown_words=unknown)
+
+
+# ============================================================================
+# Module-level Singleton
+# ============================================================================
+
+_rule_extractor: Optional[RuleExtractor] = None
+_rule_extractor_lock = threading.Lock()
+
+
+def get_rule_extractor() -> RuleExtractor:
+    """Get or create the singleton RuleExtractor instance."""
+    global _rule_extractor
+
+    # Retried until the location lists are available
+    if _rule_extractor is None or not _rule_extractor._initialized:
+        with _rule_extractor_lock:
+            if _rule_extractor is None or not _rule_extractor._initialized:
+                extractor = RuleExtractor()
+                extractor.initialize()
+                _rule_extractor = extractor
+
+    return _rule_extractor
+
+
+# ============================================================================
+# Evaluation
+# ============================================================================
+
+# Size labels of the synthetic dataset that are not acronyms
+SIZE_LABELS = {"grand groupe": "GE"}
+
+
+def _expected_fields(expected: Dict[str, Any]) -> Dict[str, Any]:
+    """Comparable fields of a synthetic_dataset.json expected_output."""
+    loc = expected.get("localisation", {})
+    act = expected.get("activite", {})
+    size = expected.get("taille_entreprise", {})
+    fin = expected.get("criteres_financiers", {})
+    jur = expected.get("criteres_juridiques", {})
+    return {
+        "location": {
+            f: normalize_text(str(loc[f])) for f in ("code_postal", "departement", "region")
+            if loc.get("present") and loc.get(f)
+        },
+        "activity": normalize_text(act.get("libelle_secteur") or "") if act.get("present") else None,
+        "size": SIZE_LABELS.get(size.get("acronyme"), size.get("acronyme")) or size.get("tranche_effectif")
+        if size.get("present") else None,
+        "ca": fin.get("ca_plus_recent") if fin.get("present") else None,
+        "creation_year": (jur.get("date_creation_entreprise") or "")[:4] or None if jur.get("present") else None,
+    }
+
+
+def _extracted_fields(extraction: Dict[str, Any]) -> Dict[str, Any]:
+    """Same comparable fields from an extraction_result."""
+    loc = extraction["localisation"]
+    size = extraction["taille_entreprise"]
+    jur = extraction["criteres_juridiques"]
+    size_value = None
+    if size.get("present"):
+        tranches = size.get("tranche_effectif") or []
+        size_value = size.get("acronyme") or (tranches[0] if len(tranches) == 1 else tranches)
+    return {
+        "location": {
+            f: normalize_text(loc[f]) for f in ("code_postal", "departement", "region", "commune")
+            if loc.get(f)
+        },
+        "activity": normalize_text(extraction["activite"]["activite_entreprise"] or "")
+        if extraction["activite"]["present"] else None,
+        "size": size_value,
+        "ca": extraction["criteres_financiers"]["ca_plus_recent"],
+        "creation_year": jur.get("date_creation_entreprise_min") if jur.get("present") else None,
+    }
+
+
+def evaluate(dataset_path: str, min_confidence: float = RULE_EXTRACTOR_MIN_CONFIDENCE) -> Dict[str, Any]:
+    """
+    Run the extractor on a synthetic dataset.
+
+    Returns coverage (share of queries above the threshold), field accuracy on
+    the covered queries, and latency.
+    """
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+
+    extractor = get_rule_extractor()
+    fields = ("location", "activity", "size", "ca", "creation_year")
+    correct = {f: 0 for f in fields}
+    exact = 0
+    covered = 0
+    latencies = []
+    errors = []
+
+    for example in dataset:
+        start = time.perf_counter()
+        result = extractor.extract(example["input"])
+        latencies.append(time.perf_counter() - start)
+        if result.extraction_result is None or result.confidence < min_confidence:
+            continue
+        covered += 1
+
+        expected = _expected_fields(example["expected_output"])
+        got = _extracted_fields(result.extraction_result)
+        ok = {f: expected[f] == got[f] for f in fields}
+        for f in fields:
+            correct[f] += ok[f]
+        if all(ok.values()):
+            exact += 1
+        else:
+            errors.append({
+                "input": example["input"],
+                "fields": {f: {"expected": expected[f], "got": got[f]} for f in fields if not ok[f]},
+            })
+
+    latencies.sort()
+    return {
+        "total": len(dataset),
+        "covered": covered,
+        "coverage": covered / len(dataset) if dataset else 0.0,
+        "exact_accuracy": exact / covered if covered else None,
+        "field_accuracy": {f: correct[f] / covered if covered else None for f in fields},
+        "latency_ms_avg": 1000 * sum(latencies) / len(latencies) if latencies else None,
+        "latency_ms_p95": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rule-based extractor tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    eval_parser = subparsers.add_parser("evaluate", help="Accuracy and latency on a synthetic dataset")
+    eval_parser.add_argument("--dataset", default="../synthetic_dataset.json")
+    eval_parser.add_argument("--min-confidence", type=float, default=RULE_EXTRACTOR_MIN_CONFIDENCE)
+    eval_parser.add_argument("--show-errors", type=int, default=10)
+    extract_parser = subparsers.add_parser("extract", help="Run the extractor on one query")
+    extract_parser.add_argument("query")
+    args = parser.parse_args()
+
+    if args.command == "extract":
+        result = get_rule_extractor().extract(args.query)
+        print(f"confidence={result.confidence:.2f} unknown={result.unknown_words}")
+        print(json.dumps(result.extraction_result, ensure_ascii=False, indent=2))
+    else:
+        report = evaluate(args.dataset, args.min_confidence)
+        print(f"Queries:   {report['total']}")
+        print(f"Coverage:  {report['coverage']:.1%} ({report['covered']} above {args.min_confidence})")
+        if report["covered"]:
+            print(f"Exact:     {report['exact_accuracy']:.1%}")
+            for name, accuracy in report["field_accuracy"].items():
+                print(f"  {name:<14} {accuracy:.1%}")
+        print(f"Latency:   avg {report['latency_ms_avg']:.3f} ms, p95 {report['latency_ms_p95']:.3f} ms")
+        for error in report["errors"][:args.show_errors]:
+            print(f"\n  {error['input']}")
+            for name, diff in error["fields"].items():
+                print(f"    {name}: expected {diff['expected']!r}, got {diff['got']!r}")
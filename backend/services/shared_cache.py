@@ -0,0 +1,304 @@
+"""
+Shared cache tier for multi-replica deployments.
+
+Each replica keeps its in-process LRU (services.cache); TieredCache puts
+this tier behind it so a value computed by one replica is reused by the
+others. Backends (CACHE_SHARED_URL):
+- redis://[:password@]host[:port][/db]: any server speaking the Redis
+  protocol (Redis, Valkey, KeyDB...), through the small RESP client below
+- memory://: InMemoryBackend, a pure-Python stand-in (tests, local runs)
+
+Values are stored as bytes by a codec: msgpack when installed (JSON
+otherwise) for structured values, float16 blobs for embeddings. Shared TTLs
+default to the cache's own TTL and can be set per namespace
+(CACHE_SHARED_TTLS="query_embedding=604800,naf_selection=86400").
+"""
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Optional: values are stored as JSON instead
+    msgpack = None
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+# Shared tier URL (empty: in-process caches only)
+CACHE_SHARED_URL = os.getenv("CACHE_SHARED_URL", "")
+# Socket timeout of a shared-tier command, in seconds
+CACHE_SHARED_TIMEOUT = float(os.getenv("CACHE_SHARED_TIMEOUT", "0.5"))
+# Idle connections kept open to the server
+CACHE_SHARED_POOL_SIZE = int(os.getenv("CACHE_SHARED_POOL_SIZE", "8"))
+# After a connection error the tier is skipped for this many seconds
+CACHE_SHARED_RETRY_AFTER = float(os.getenv("CACHE_SHARED_RETRY_AFTER", "5"))
+
+
+def _parse_ttls(raw: str) -> Dict[str, float]:
+    """ "query_embedding=604800,naf_selection=86400" -> {namespace: seconds} """
+    ttls = {}
+    for item in raw.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            ttls[name.strip()] = float(value)
+    return ttls
+
+
+CACHE_SHARED_TTLS = _parse_ttls(os.getenv("CACHE_SHARED_TTLS", ""))
+
+
+def shared_ttl(namespace: str, default: float) -> float:
+    """Shared-tier TTL of a cache namespace."""
+    return CACHE_SHARED_TTLS.get(namespace, default)
+
+
+# ============================================================================
+# Codecs
+# ============================================================================
+
+class JsonCodec:
+    """Structured values as UTF-8 JSON (tuples come back as lists)"""
+    name = "json"
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """Structured values as msgpack (tuples come back as lists)"""
+    name = "msgpack"
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+class Float16Codec:
+    """Vectors as float16 blobs (half the size, ~1e-3 precision), read back as float32"""
+    name = "f16"
+
+    def dumps(self, value: Any) -> bytes:
+        return np.asarray(value, dtype=np.float16).tobytes()
+
+    def loads(self, data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+
+
+VALUE_CODEC = MsgpackCodec() if msgpack is not None else JsonCodec()
+EMBEDDING_CODEC = Float16Codec()
+
+
+# ============================================================================
+# In-memory backend
+# ============================================================================
+
+class InMemoryBackend:
+    """Process-local stand-in for a Redis server (same semantics, no network)."""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry[1]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def set_if_absent(self, key: str, value: bytes, ttl: float) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._data[key] = (time.monotonic() + ttl, value)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# ============================================================================
+# Redis backend
+# ============================================================================
+
+class SharedCacheError(Exception):
+    """Error reply from the shared-tier server."""
+
+
+class _RespConnection:
+    """One socket speaking RESP2"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    def command(self, *args: Any) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self) -> Any:
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by the shared cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise SharedCacheError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("connection closed by the shared cache server")
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise ConnectionError(f"unexpected reply from the shared cache server: {line[:40]!r}")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    """
+    Minimal Redis-protocol client: GET, SET (PX, NX) and DEL over a pool of
+    blocking sockets. Thread-safe, never called on the event loop: the async
+    TieredCache API runs it in worker threads and the *_sync API refuses to
+    run on a running loop.
+
+    After a connection error every command fails fast for
+    CACHE_SHARED_RETRY_AFTER seconds, so a down server costs one timeout,
+    not one per request.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        pool_size: int = CACHE_SHARED_POOL_SIZE,
+        timeout: float = CACHE_SHARED_TIMEOUT,
+    ):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.username = parsed.username or None
+        self.password = parsed.password
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[_RespConnection]" = queue.LifoQueue(maxsize=pool_size)
+        self._down_until = 0.0
+
+    def _connect(self) -> _RespConnection:
+        conn = _RespConnection(socket.create_connection((self.host, self.port), timeout=self.timeout))
+        try:
+            if self.password:
+                auth: List[Any] = [self.username, self.password] if self.username else [self.password]
+                conn.command("AUTH", *auth)
+            if self.db:
+                conn.command("SELECT", self.db)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def execute(self, *args: Any) -> Any:
+        """Run one command (ConnectionError while the server is unreachable)."""
+        if time.monotonic() < self._down_until:
+            raise ConnectionError("shared cache server unreachable, retrying later")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        try:
+            if conn is None:
+                conn = self._connect()
+            reply = conn.command(*args)
+        except SharedCacheError:
+            self._release(conn)
+            raise
+        except (OSError, ConnectionError):
+            if conn is not None:
+                conn.close()
+            self._down_until = time.monotonic() + CACHE_SHARED_RETRY_AFTER
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn: _RespConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.execute("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.execute("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    def set_if_absent(self, key: str, value: bytes, ttl: float) -> bool:
+        return self.execute("SET", key, value, "NX", "PX", max(1, int(ttl * 1000))) is not None
+
+    def delete(self, key: str) -> None:
+        self.execute("DEL", key)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def create_shared_backend(url: str = CACHE_SHARED_URL):
+    """Backend for a CACHE_SHARED_URL, None when empty."""
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return InMemoryBackend()
+    if scheme == "redis":
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported CACHE_SHARED_URL scheme: {scheme!r} (redis:// or memory://)")
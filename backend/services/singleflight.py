@@ -0,0 +1,145 @@
+"""
+Request coalescing ("singleflight").
+
+Concurrent identical calls (same canonical key) share one execution: the
+first caller runs it, the others wait for its outcome (result or error).
+Nothing is kept once the call completes, so this complements the TTL caches
+rather than replacing them: it covers the window where the first call is
+still in flight, e.g. many users sending the same query at once.
+
+    _llm_flights = SingleFlight("llm")
+    content = await _llm_flights.do(request_key(model, messages), lambda: call())
+
+SingleFlight is for coroutines (asyncio), ThreadSingleFlight for blocking
+functions called from worker threads. Counters (GET /metrics):
+singleflight.{name}.calls, .coalesced and .cancelled.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from services.metrics import metrics
+from services.pipeline import without_deadline
+
+T = TypeVar("T")
+
+
+def request_key(*parts: Any) -> str:
+    """Canonical hash of a request (dict key order and whitespace do not matter)."""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# ============================================================================
+# Async
+# ============================================================================
+
+class _Flight:
+    """A shared in-flight call and how many callers wait for it"""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent identical coroutine calls."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn() or join the identical call already in flight.
+
+        Cancellation safe: a cancelled caller only stops waiting. The shared
+        call keeps running for the other callers and is cancelled once
+        none is left. It runs without the first caller's request deadline,
+        which the callers joining later do not share.
+        """
+        metrics.increment(f"singleflight.{self.name}.calls")
+        flight = self._flights.get(key)
+        if flight is None:
+            task = without_deadline().run(lambda: asyncio.ensure_future(fn()))
+            flight = self._flights[key] = _Flight(task)
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            metrics.increment(f"singleflight.{self.name}.coalesced")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+                metrics.increment(f"singleflight.{self.name}.cancelled")
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # The outcome was delivered to the waiters (if any are left)
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+
+# ============================================================================
+# Threads
+# ============================================================================
+
+class _ThreadFlight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ThreadSingleFlight:
+    """Coalesces concurrent identical blocking calls made from several threads."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _ThreadFlight] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """Run fn() or wait for the identical call running in another thread."""
+        metrics.increment(f"singleflight.{self.name}.calls")
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _ThreadFlight()
+
+        if not leader:
+            metrics.increment(f"singleflight.{self.name}.coalesced")
+            flight.done.wait()
+        else:
+            try:
+                flight.result = fn()
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
@@ -209,7 +209,7 @@ def parse_size_expression(expression: str) -> Optional[SizeMatchResult]:
     return None
 
 
-def transform_size_field(extraction_result: dict) -> Tuple[dict, Optional[str]]:
+def transform_size_field(extraction_result: dict, verbose: bool = True) -> Tuple[dict, Optional[str]]:
     """
     Transform the taille_entreprise field in an extraction result.
 
@@ -217,6 +217,7 @@ def transform_size_field(extraction_result: dict) -> Tuple[dict, Optional[str]]:
 
     Args:
         extraction_result: The extraction result dict
+        verbose: Log transformations and unparsed expressions
 
     Returns:
         Tuple of (modified extraction_result, correction description or None)
@@ -251,11 +252,13 @@ def transform_size_field(extraction_result: dict) -> Tuple[dict, Optional[str]]:
         if result.original_expression.upper() not in ACRONYM_RANGES:
             # It was an expression, not an acronym - note the transformation
             correction = f"'{result.original_expression}' → {len(result.tranches)} tranches INSEE"
-            print(f"[SizeMatcher] {correction}")
+            if verbose:
+                print(f"[SizeMatcher] {correction}")
 
         return extraction_result, correction
     else:
-        print(f"[SizeMatcher] Could not parse expression: '{expression}'")
+        if verbose:
+            print(f"[SizeMatcher] Could not parse expression: '{expression}'")
         return extraction_result, None
 
 
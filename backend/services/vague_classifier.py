@@ -0,0 +1,359 @@
+"""
+Vague-query classifier.
+
+Greetings, help requests and off-topic messages ("bonjour", "aide-moi",
+"quel temps fait-il") only get a rejection from the extraction LLM. This
+classifier recognizes the clear cases in-process and answers them from a
+template pool; anything uncertain still goes to the LLM.
+
+Model: logistic regression (numpy) over a handful of keyword features and the
+criteria found by the rule-based extractor, trained at startup on the
+labelled messages of data/vague_queries.json. A message is only answered
+locally if all its words are greeting, help, off-topic or filler vocabulary:
+a real search with words outside it ("salut, je cherche des garages") always
+goes to the LLM.
+
+    python -m services.vague_classifier evaluate
+    python -m services.vague_classifier classify "bonjour"
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.rule_extractor import ACRONYMS, RuleExtraction, RuleExtractor, get_rule_extractor, tokenize
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+VAGUE_CLASSIFIER_ENABLED = os.getenv("VAGUE_CLASSIFIER_ENABLED", "true").lower() == "true"
+# Minimum P(vague) to answer without the LLM
+VAGUE_CLASSIFIER_MIN_PROBABILITY = float(os.getenv("VAGUE_CLASSIFIER_MIN_PROBABILITY", "0.9"))
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+TRAINING_FILE = DATA_DIR / "vague_queries.json"
+
+GREETING_WORDS = {
+    "bonjour", "bonsoir", "salut", "hello", "coucou", "hey", "hi", "yo", "merci", "ok", "okay",
+    "cool", "super", "va", "ca",
+}
+HELP_WORDS = {
+    "aide", "aide-moi", "aider", "help", "comment", "marche", "fonctionne", "fonctionnement",
+    "es-tu", "sers", "faire", "peux-tu", "besoin", "robot", "quoi",
+}
+OFF_TOPIC_WORDS = {
+    "meteo", "temps", "pluie", "recette", "recettes", "blague", "heure", "match", "foot", "film",
+    "musique", "poeme", "traduis", "traduire", "anglais", "neuf", "actualite", "politique",
+}
+GENERIC_SEARCH_WORDS = {
+    "entreprise", "entreprises", "societe", "societes", "boite", "boites", "cherche", "trouve",
+    "trouve-moi", "liste", "importe", "veux",
+}
+# Function words and small talk that carry no search criterion
+FILLER_WORDS = {
+    "je", "tu", "il", "elle", "on", "nous", "vous", "moi", "toi", "me", "te", "se", "ne", "pas",
+    "un", "une", "des", "de", "du", "le", "la", "les", "en", "et", "ou", "au", "aux", "a", "y",
+    "ce", "cet", "cette", "mon", "ma", "mes", "ton", "ta", "tes", "votre", "vos", "qui", "que",
+    "quel", "quelle", "quels", "quelles", "est", "es", "suis", "sont", "ai", "as", "avez", "pour",
+    "avec", "mais", "bien", "tres", "beaucoup", "svp", "stp", "plait", "sais", "rien", "fait",
+    "fait-il", "est-il", "donne", "donne-moi", "raconte", "raconte-moi", "ecris", "ecris-moi",
+    "dis", "dis-moi", "gagne", "hier", "demain", "aujourd'hui", "peux", "peut", "pouvez",
+    "voudrais", "chose", "quelque", "tout", "tous",
+}
+# A message is answered locally only if all its words are in this vocabulary:
+# words the training set has never seen are not evidence of vagueness
+VAGUE_VOCABULARY = (
+    GREETING_WORDS | HELP_WORDS | OFF_TOPIC_WORDS | GENERIC_SEARCH_WORDS | FILLER_WORDS | set(ACRONYMS)
+)
+
+FEATURE_NAMES = [
+    "greeting", "help", "off_topic", "generic_search", "location", "size_only",
+    "financial_or_date", "activity_words", "vague_words", "question", "short", "acronym",
+]
+
+# Rejection messages by category (same register as the LLM's rejections)
+TEMPLATES: Dict[str, List[str]] = {
+    "greeting": [
+        "Bonjour ! Je peux vous aider à trouver des entreprises françaises. Quel secteur d'activité vous intéresse, et dans quelle zone géographique ?",
+        "Bonjour ! Dites-moi quel type d'entreprises vous recherchez : secteur d'activité, localisation, taille...",
+    ],
+    "help": [
+        "Je recherche des entreprises françaises à partir de vos critères : secteur d'activité, localisation, taille (TPE, PME, ETI...) ou chiffre d'affaires. Par exemple : « PME informatique en Bretagne ».",
+        "Décrivez simplement les entreprises que vous cherchez, par exemple « restaurants à Lyon » ou « ETI du BTP en Ile-de-France avec plus de 10M€ de CA ».",
+    ],
+    "off_topic": [
+        "Je suis spécialisé dans la recherche d'entreprises françaises et ne peux pas répondre à cette question. Quel secteur d'activité ou quelle région vous intéresse ?",
+        "Cette question sort de mon domaine : je recherche des entreprises françaises. Essayez par exemple « PME du conseil à Paris ».",
+    ],
+    "generic": [
+        "Pouvez-vous préciser votre recherche ? (secteur d'activité, localisation, taille...)",
+        "Quel type d'entreprises recherchez-vous ? Précisez au moins un critère : secteur d'activité, localisation, taille ou chiffre d'affaires.",
+    ],
+}
+
+
+@dataclass
+class VagueVerdict:
+    """Classification of one message"""
+    probability: float  # P(vague)
+    category: str  # "greeting", "help", "off_topic" or "generic"
+    message: Optional[str] = None  # Template answer if the message is confidently vague
+
+    @property
+    def is_vague(self) -> bool:
+        return self.message is not None
+
+
+class VagueClassifier:
+    """Keyword features + logistic regression."""
+
+    def __init__(self):
+        self.weights: Optional[np.ndarray] = None
+        self.bias: float = 0.0
+        self._initialized = False
+
+    # ------------------------------------------------------------------
+    # Features
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _words(text: str) -> List[str]:
+        return [w for t in tokenize(text) for w in re.split(r"[^a-z0-9-]+", t.norm) if w]
+
+    @staticmethod
+    def _is_vague_word(word: str) -> bool:
+        return word in VAGUE_VOCABULARY or all(part in VAGUE_VOCABULARY for part in word.split("-") if part)
+
+    @classmethod
+    def only_vague_words(cls, text: str) -> bool:
+        """True if every word of the message is greeting, help, off-topic or filler vocabulary."""
+        return all(cls._is_vague_word(w) for w in cls._words(text))
+
+    @classmethod
+    def features(cls, text: str, rules: Optional[RuleExtraction], extractor: RuleExtractor) -> np.ndarray:
+        """Feature vector (see FEATURE_NAMES) of one message."""
+        words = cls._words(text)
+        n = len(words)
+
+        def share(vocabulary: set) -> float:
+            return min(1.0, sum(1 for w in words if w in vocabulary) / max(n, 1) * 2)
+
+        extraction = rules.extraction_result if rules else None
+        has_location = bool(extraction and extraction["localisation"]["present"])
+        has_activity = bool(extraction and extraction["activite"]["present"])
+        has_size = bool(extraction and extraction["taille_entreprise"]["present"])
+        has_other = bool(extraction and (
+            extraction["criteres_financiers"]["present"] or extraction["criteres_juridiques"]["present"]
+        ))
+
+        keyword_vocabulary = GREETING_WORDS | HELP_WORDS | OFF_TOPIC_WORDS | GENERIC_SEARCH_WORDS
+        content = [w for w in words if len(w) >= 3 and w not in keyword_vocabulary]
+        activity_words = sum(1 for w in content if extractor._is_activity_word(w)) if has_activity else 0
+
+        return np.array([
+            share(GREETING_WORDS),
+            share(HELP_WORDS),
+            share(OFF_TOPIC_WORDS),
+            share(GENERIC_SEARCH_WORDS),
+            float(has_location),
+            float(has_size and not (has_location or has_activity or has_other)),
+            float(has_other),
+            min(activity_words, 3) / 3,
+            sum(1 for w in words if cls._is_vague_word(w)) / max(n, 1),
+            float("?" in text),
+            float(n <= 3),
+            # Sector jargon typed in capitals ("BTP", "ESN"), size acronyms excluded
+            float(any(t.text.isupper() and len(t.text) >= 2 and t.norm not in ACRONYMS for t in tokenize(text))),
+        ])
+
+    @staticmethod
+    def _category(x: np.ndarray) -> str:
+        """Template category from the dominant keyword feature."""
+        scores = {"greeting": x[0], "help": x[1], "off_topic": x[2]}
+        category, score = max(scores.items(), key=lambda item: item[1])
+        return category if score > 0 else "generic"
+
+    # ------------------------------------------------------------------
+    # Training
+    # ------------------------------------------------------------------
+
+    def fit(self, X: np.ndarray, y: np.ndarray, epochs: int = 2000, lr: float = 0.5, l2: float = 1e-3) -> None:
+        """Batch gradient descent on the log loss (full batch, deterministic)."""
+        w = np.zeros(X.shape[1])
+        b = 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(X @ w + b)))
+            error = p - y
+            w -= lr * (X.T @ error / len(y) + l2 * w)
+            b -= lr * error.mean()
+        self.weights, self.bias = w, b
+
+    @staticmethod
+    def load_examples(path: Path = TRAINING_FILE) -> List[Tuple[str, int]]:
+        """(text, label) pairs, label 1 = vague."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [(t, 1) for t in data["vague"]] + [(t, 0) for t in data["search"]]
+
+    def initialize(self) -> bool:
+        """Train on the labelled examples (a few milliseconds)."""
+        if not TRAINING_FILE.exists():
+            print(f"[VagueClassifier] Training file not found: {TRAINING_FILE}")
+            return False
+        extractor = get_rule_extractor()
+        if not extractor._initialized:
+            return False
+
+        examples = self.load_examples()
+        X = np.array([self.features(t, extractor.extract(t), extractor) for t, _ in examples])
+        y = np.array([label for _, label in examples], dtype=float)
+        self.fit(X, y)
+        self._initialized = True
+        print(f"[VagueClassifier] Trained on {len(examples)} examples")
+        return True
+
+    # ------------------------------------------------------------------
+    # Inference
+    # ------------------------------------------------------------------
+
+    def predict_proba(self, x: np.ndarray) -> float:
+        return float(1.0 / (1.0 + np.exp(-(x @ self.weights + self.bias))))
+
+    def classify(
+        self,
+        text: str,
+        rules: Optional[RuleExtraction] = None,
+        min_probability: float = VAGUE_CLASSIFIER_MIN_PROBABILITY
+    ) -> VagueVerdict:
+        """
+        Classify a first-turn message.
+
+        Args:
+            text: User message
+            rules: Rule-based extraction of the same message, if already computed
+            min_probability: P(vague) above which a template answer is returned,
+                provided every word is vague vocabulary (only_vague_words)
+        """
+        if not self._initialized:
+            return VagueVerdict(probability=0.0, category="generic")
+
+        extractor = get_rule_extractor()
+        if rules is None:
+            rules = extractor.extract(text)
+        x = self.features(text, rules, extractor)
+        probability = self.predict_proba(x)
+        category = self._category(x)
+
+        message = None
+        if probability >= min_probability and self.only_vague_words(text):
+            # Deterministic pick: the same message always gets the same answer
+            pool = TEMPLATES[category]
+            message = pool[zlib.crc32(text.strip().lower().encode("utf-8")) % len(pool)]
+        return VagueVerdict(probability=probability, category=category, message=message)
+
+
+# ============================================================================
+# Module-level Singleton
+# ============================================================================
+
+_vague_classifier: Optional[VagueClassifier] = None
+_vague_classifier_lock = threading.Lock()
+
+
+def get_vague_classifier() -> VagueClassifier:
+    """Get or create the singleton VagueClassifier instance."""
+    global _vague_classifier
+
+    # Retried until the rule-based extractor is available
+    if _vague_classifier is None or not _vague_classifier._initialized:
+        with _vague_classifier_lock:
+            if _vague_classifier is None or not _vague_classifier._initialized:
+                classifier = VagueClassifier()
+                classifier.initialize()
+                _vague_classifier = classifier
+
+    return _vague_classifier
+
+
+# ============================================================================
+# Evaluation
+# ============================================================================
+
+def evaluate(min_probability: float = VAGUE_CLASSIFIER_MIN_PROBABILITY) -> Dict[str, float]:
+    """
+    Leave-one-out evaluation on the training file.
+
+    Returns the share of vague messages answered locally (recall), the share of
+    local answers that were really vague (precision) and the latency.
+    """
+    extractor = get_rule_extractor()
+    examples = VagueClassifier.load_examples()
+    X = np.array([VagueClassifier.features(t, extractor.extract(t), extractor) for t, _ in examples])
+    y = np.array([label for _, label in examples], dtype=float)
+
+    answered = correct = 0
+    mistakes = []
+    for i in range(len(examples)):
+        mask = np.arange(len(examples)) != i
+        model = VagueClassifier()
+        model.fit(X[mask], y[mask])
+        if model.predict_proba(X[i]) >= min_probability and VagueClassifier.only_vague_words(examples[i][0]):
+            answered += 1
+            if y[i] == 1:
+                correct += 1
+            else:
+                mistakes.append(examples[i][0])
+
+    classifier = get_vague_classifier()
+    start = time.perf_counter()
+    for text, _ in examples:
+        classifier.classify(text)
+    latency = (time.perf_counter() - start) / len(examples)
+
+    n_vague = int(y.sum())
+    return {
+        "examples": len(examples),
+        "recall": correct / n_vague if n_vague else 0.0,
+        "precision": correct / answered if answered else 1.0,
+        "latency_ms": 1000 * latency,
+        "false_positives": mistakes,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vague-query classifier tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    eval_parser = subparsers.add_parser("evaluate", help="Leave-one-out evaluation on the training file")
+    eval_parser.add_argument("--min-probability", type=float, default=VAGUE_CLASSIFIER_MIN_PROBABILITY)
+    classify_parser = subparsers.add_parser("classify", help="Classify one message")
+    classify_parser.add_argument("message")
+    args = parser.parse_args()
+
+    if args.command == "classify":
+        verdict = get_vague_classifier().classify(args.message)
+        print(f"P(vague)={verdict.probability:.3f} category={verdict.category}")
+        print(verdict.message or "-> LLM")
+    else:
+        report = evaluate(args.min_probability)
+        print(f"Examples:  {report['examples']}")
+        print(f"Recall:    {report['recall']:.1%} of vague messages answered locally")
+        print(f"Precision: {report['precision']:.1%}")
+        print(f"Latency:   {report['latency_ms']:.3f} ms")
+        for text in report["false_positives"]:
+            print(f"  false positive: {text}")
+        classifier = get_vague_classifier()
+        print("\nWeights:")
+        for name, weight in zip(FEATURE_NAMES, classifier.weights):
+            print(f"  {name:<18} {weight:+.2f}")
+        print(f"  {'bias':<18} {classifier.bias:+.2f}")
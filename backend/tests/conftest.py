@@ -0,0 +1,6 @@
+"""Unit tests of the backend services (run from backend/: python -m pytest tests)."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
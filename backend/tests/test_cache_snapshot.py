@@ -0,0 +1,118 @@
+"""Cache snapshot: value encoding, expiry conversion and damaged files."""
+
+import json
+import struct
+import time
+
+import numpy as np
+import pytest
+
+from services import cache_snapshot
+from services.cache import TTLCache
+from services.cache_snapshot import MAGIC, FORMAT_VERSION, decode, encode, restore_snapshot, save_snapshot
+
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, -7, 2 ** 40, 1.5, "", "Crêperie", b"\x00\xff",
+    [1, "a"], (1, "a"), ("model", None, "mots cles", 5, 0.3),
+    {"count": 3, "data": {"nested": [1, 2]}},
+    [("Restauration", 0.55, ["56.10A"])],
+])
+def test_round_trip(value):
+    decoded = decode(encode(value))
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+def test_tuples_and_lists_stay_distinct():
+    assert isinstance(decode(encode((1, 2))), tuple)
+    assert isinstance(decode(encode([1, 2])), list)
+    assert isinstance(decode(encode([(1, 2)]))[0], tuple)
+
+
+@pytest.mark.parametrize("array", [
+    np.arange(6, dtype=np.float32).reshape(2, 3),
+    np.array([0.5, -1.0], dtype=np.float16),
+    np.array([1, 2, 3], dtype=np.int64),
+    np.zeros((0,), dtype=np.float32),
+])
+def test_numpy_round_trip(array):
+    decoded = decode(encode(array))
+    assert decoded.dtype == array.dtype
+    assert decoded.shape == array.shape
+    np.testing.assert_array_equal(decoded, array)
+
+
+def test_unsupported_type_raises():
+    with pytest.raises(TypeError):
+        encode(object())
+
+
+@pytest.fixture
+def no_cache_modules(monkeypatch):
+    # Only the caches created by the test itself
+    monkeypatch.setattr(cache_snapshot, "CACHE_MODULES", ())
+
+
+def test_save_and_restore_converts_expiries(tmp_path, no_cache_modules):
+    cache = TTLCache("test_snapshot_expiry", 10, 100, version="v1")
+    cache.set(("k", 1), {"value": [1, 2]})
+    cache.set("short", "x", ttl=0.01)
+    expires_at = cache._data[("k", 1)][0]
+    time.sleep(0.02)
+
+    path = tmp_path / "snapshot.bin"
+    assert save_snapshot(str(path))["test_snapshot_expiry"] == 1
+    cache.clear()
+    assert restore_snapshot(str(path))["test_snapshot_expiry"] == 1
+
+    assert cache.get(("k", 1)) == {"value": [1, 2]}
+    assert cache.get("short") is None
+    # Epoch in the file, monotonic in the cache: same deadline (clock read jitter only)
+    assert cache._data[("k", 1)][0] == pytest.approx(expires_at, abs=0.05)
+
+
+def test_version_change_discards_entries(tmp_path, no_cache_modules):
+    cache = TTLCache("test_snapshot_version", 10, 100, version="model-a")
+    cache.set("k", "v")
+    path = tmp_path / "snapshot.bin"
+    save_snapshot(str(path))
+    cache.clear()
+    cache.version = "model-b"
+    assert "test_snapshot_version" not in restore_snapshot(str(path))
+    assert cache.get("k") is None
+
+
+def _write_snapshot(path, name, version, records):
+    body = bytearray()
+    for expires_at, key_data, value in records:
+        value_data = encode(value)
+        body += struct.pack("<d", expires_at)
+        body += struct.pack("<I", len(key_data)) + key_data
+        body += struct.pack("<I", len(value_data)) + value_data
+    header = json.dumps({"caches": {name: {
+        "version": version, "offset": 0, "length": len(body), "entries": len(records),
+    }}}).encode("utf-8")
+    path.write_bytes(MAGIC + struct.pack("<H", FORMAT_VERSION) + struct.pack("<I", len(header)) + header + body)
+
+
+def test_unhashable_keys_are_skipped(tmp_path, no_cache_modules):
+    cache = TTLCache("test_snapshot_keys", 10, 100)
+    later = time.time() + 100
+    path = tmp_path / "snapshot.bin"
+    _write_snapshot(path, "test_snapshot_keys", "", [
+        (later, encode(["a", "list"]), "unhashable"),
+        (later, encode(("a", {"b": 1})), "contains a dict"),
+        (time.time() - 1, encode("old"), "expired"),
+        (later, encode("good"), "kept"),
+    ])
+    assert restore_snapshot(str(path)) == {"test_snapshot_keys": 1}
+    assert cache.get("good") == "kept"
+    assert cache.get("old") is None
+
+
+def test_corrupt_file_keeps_earlier_caches(tmp_path, no_cache_modules):
+    TTLCache("test_snapshot_corrupt", 10, 100)
+    path = tmp_path / "snapshot.bin"
+    _write_snapshot(path, "test_snapshot_corrupt", "", [(time.time() + 100, b"?", "bad tag")])
+    assert restore_snapshot(str(path)) == {}
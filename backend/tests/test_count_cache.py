@@ -0,0 +1,125 @@
+"""Company count cache: canonical keys, stale-while-revalidate, negative caching."""
+
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+
+from services import company_api_client
+from services.api_transformer import canonical_api_request
+from services.company_api_client import CompanyAPIClient, CompanyAPIError
+
+REQUEST = {
+    "activity": {"present": True, "activity_codes_list": ["56.10C", "56.10A", "56.10A"]},
+    "location": {"present": True, "region": ["Bretagne"]},
+    "size": {"present": False, "acronyme": []},
+    "legal": {"present": True, "headquarters": False, "category": None},
+}
+# Same question: other key order, duplicates and empty sections removed, spaces
+SAME_REQUEST = {
+    "legal": {"headquarters": False, "present": True},
+    "location": {"region": [" Bretagne"], "present": True},
+    "activity": {"activity_codes_list": ["56.10A", "56.10C"], "present": True},
+}
+
+
+def test_equivalent_requests_have_the_same_canonical_form():
+    assert canonical_api_request(REQUEST) == canonical_api_request(SAME_REQUEST) == {
+        "activity": {"present": True, "activity_codes_list": ["56.10A", "56.10C"]},
+        "location": {"present": True, "region": ["Bretagne"]},
+        "legal": {"present": True, "headquarters": False},
+    }
+
+
+def test_canonical_form_keeps_meaningful_differences():
+    other = json.loads(json.dumps(SAME_REQUEST))
+    other["legal"]["headquarters"] = True
+    assert canonical_api_request(other) != canonical_api_request(SAME_REQUEST)
+    other = json.loads(json.dumps(SAME_REQUEST))
+    other["location"]["region"].append("Normandie")
+    assert canonical_api_request(other) != canonical_api_request(SAME_REQUEST)
+
+
+def test_sections_without_criteria_are_dropped():
+    assert canonical_api_request({"size": {"present": True, "tranche": []}, "activity": {"present": False}}) == {}
+
+
+class FakeCountAPI:
+    """Mock transport counting calls; criteria with "bad" get a 456."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if json.loads(request.content).get("bad"):
+            return httpx.Response(456, text="")
+        return httpx.Response(200, json={"count_legal": 100 + self.calls, "count_semantic": 1})
+
+
+@pytest.fixture
+def api():
+    fake = FakeCountAPI()
+    # A base URL of its own: cache keys do not collide with other tests
+    client = CompanyAPIClient(base_url=f"http://count-{uuid.uuid4().hex}", api_key="k")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    return client, fake
+
+
+def test_equivalent_requests_hit_the_cache(api):
+    client, fake = api
+
+    async def main():
+        first = await client.count_companies_async(REQUEST)
+        second = await client.count_companies_async(SAME_REQUEST)
+        return first.count, second.count
+
+    assert asyncio.run(main()) == (101, 101)
+    assert fake.calls == 1
+
+
+def test_criteria_mismatch_is_cached(api):
+    client, fake = api
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(CompanyAPIError) as error:
+                await client.count_companies_async({"bad": True})
+            assert error.value.status_code == 456
+
+    asyncio.run(main())
+    assert fake.calls == 1
+
+
+def test_stale_count_is_served_then_refreshed_once(api, monkeypatch):
+    client, fake = api
+
+    async def main():
+        assert (await client.count_companies_async(REQUEST)).count == 101
+        monkeypatch.setattr(company_api_client, "COUNT_CACHE_TTL", 0)
+        # Stale: served at once, one background refresh for both calls
+        assert (await client.count_companies_async(REQUEST)).count == 101
+        assert (await client.count_companies_async(SAME_REQUEST)).count == 101
+        await asyncio.sleep(0.05)
+        monkeypatch.setattr(company_api_client, "COUNT_CACHE_TTL", 3600)
+        return (await client.count_companies_async(REQUEST)).count
+
+    assert asyncio.run(main()) == 102
+    assert fake.calls == 2
+
+
+def test_hit_rate_is_reported(api):
+    client, _ = api
+    before = company_api_client.count_cache_stats()
+
+    async def main():
+        for _ in range(4):
+            await client.count_companies_async(REQUEST)
+
+    asyncio.run(main())
+    after = company_api_client.count_cache_stats()
+    assert after["requests"] - before["requests"] == 4
+    assert after["misses"] - before["misses"] == 1
+    assert after["hit_rate"] is not None
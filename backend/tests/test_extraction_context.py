@@ -0,0 +1,53 @@
+"""Extraction prompt: older turns are only compacted when previous criteria summarise them."""
+
+import asyncio
+
+import pytest
+
+from services import agent_service, context_compactor
+from services.agent_service import AgentService
+
+
+def conversation(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i}"})
+        messages.append({"role": "assistant", "content": f"réponse {i}"})
+    messages.append({"role": "user", "content": "dernière question"})
+    return messages
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """User prompts sent to the extraction LLM (which always rejects)."""
+    sent = []
+
+    async def fake_call_llm(llm_messages, call_type="other", temperature=0.0):
+        sent.append(llm_messages[-1]["content"])
+        return '{"action": "reject", "message": "?"}'
+
+    monkeypatch.setattr(agent_service, "EXTRACTION_STREAMING", False)
+    monkeypatch.setattr(context_compactor, "CONTEXT_COMPACTION_ENABLED", True)
+    monkeypatch.setattr(context_compactor, "CONTEXT_KEEP_TURNS", 2)
+    monkeypatch.setattr(AgentService, "_call_llm", staticmethod(fake_call_llm))
+    return sent
+
+
+def test_older_turns_dropped_with_previous_criteria(prompts):
+    previous = {"activite": {"present": True, "activite_entreprise": "Boulangerie"}}
+    asyncio.run(AgentService._extract_with_llm(conversation(4), previous, output_mode="full"))
+
+    prompt = prompts[0]
+    assert "question 0" not in prompt
+    assert "question 3" in prompt and "dernière question" in prompt
+    assert context_compactor.OLDER_TURNS_NOTE.format(count=6) in prompt
+    assert "CRITÈRES ACTUELS" in prompt
+
+
+def test_full_history_without_previous_criteria(prompts):
+    asyncio.run(AgentService._extract_with_llm(conversation(4), None, output_mode="full"))
+
+    prompt = prompts[0]
+    assert all(f"question {i}" in prompt for i in range(4))
+    assert "résumé(s) par les critères actuels" not in prompt
+    assert "CRITÈRES ACTUELS" not in prompt
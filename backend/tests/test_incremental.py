@@ -0,0 +1,95 @@
+"""IncrementalPlan: which pipeline stages re-run when the criteria change."""
+
+import copy
+
+from services.agent_service import AgentService
+from services.incremental import IncrementalPlan, changed_fields
+
+ALL_REUSABLE = ["activity_match", "api_request", "count", "response"]
+
+PREVIOUS = {
+    "localisation": {"present": True, "region": "Bretagne"},
+    "activite": {"present": True, "activite_entreprise": "Restauration", "mots_cles": "restauration"},
+    "taille_entreprise": {"present": False},
+    "criteres_financiers": {"present": False},
+    "criteres_juridiques": {"present": False},
+}
+
+
+def plan_for(current, reusable=ALL_REUSABLE, previous=PREVIOUS):
+    return IncrementalPlan(previous, current, reusable)
+
+
+def decisions(plan, stages=("location_match", "activity_match", "api_request", "count", "response")):
+    return {stage: plan.should_run(stage) for stage in stages}
+
+
+def test_unchanged_criteria_reuse_everything_reusable():
+    plan = plan_for(copy.deepcopy(PREVIOUS))
+    assert decisions(plan) == {
+        # Never sent back by the frontend: always recomputed
+        "location_match": True,
+        "activity_match": False,
+        "api_request": False,
+        "count": False,
+        "response": False,
+    }
+
+
+def test_location_change_keeps_activity_matches():
+    current = copy.deepcopy(PREVIOUS)
+    current["localisation"]["region"] = "Normandie"
+    assert decisions(plan_for(current)) == {
+        "location_match": True,
+        "activity_match": False,
+        "api_request": True,
+        "count": True,
+        "response": True,
+    }
+
+
+def test_activity_change_invalidates_downstream_stages():
+    current = copy.deepcopy(PREVIOUS)
+    current["activite"]["mots_cles"] = "boulangerie"
+    plan = plan_for(current)
+    assert plan.should_run("activity_match")
+    assert plan.should_run("api_request")
+    assert plan.should_run("count")
+
+
+def test_rerun_with_same_output_lets_downstream_skip():
+    current = copy.deepcopy(PREVIOUS)
+    # Label changed, keywords did not: the activity stage is not even re-run
+    current["activite"]["activite_entreprise"] = "Restaurants"
+    plan = plan_for(current, reusable=["activity_match", "count"])
+    assert not plan.should_run("activity_match")
+    assert plan.should_run("api_request")  # Not reusable: always runs
+    plan.output_unchanged("api_request")
+    assert not plan.should_run("count")
+
+
+def test_missing_previous_output_forces_the_stage():
+    plan = plan_for(copy.deepcopy(PREVIOUS), reusable=["activity_match"])
+    assert not plan.should_run("activity_match")
+    assert plan.should_run("count")
+
+
+def test_first_turn_runs_everything():
+    plan = plan_for(copy.deepcopy(PREVIOUS), previous=None)
+    assert all(decisions(plan).values())
+    assert plan.skipped == []
+
+
+def test_changed_fields_uses_dotted_paths():
+    current = copy.deepcopy(PREVIOUS)
+    current["activite"]["activite_entreprise"] = "Restaurants"
+    assert changed_fields(PREVIOUS, current) == ["activite"]
+    assert changed_fields(PREVIOUS, current, ["activite.mots_cles"]) == []
+
+
+def test_response_is_never_reusable():
+    # Same criteria, but the new message (explanation, thanks...) still needs an answer
+    reusable = AgentService.reusable_stages([{"activity": "boulangerie"}], previous_company_count=42)
+    assert reusable == ["activity_match", "api_request", "count"]
+    plan = plan_for(copy.deepcopy(PREVIOUS), reusable)
+    assert plan.should_run("response")
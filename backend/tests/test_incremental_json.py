@@ -0,0 +1,68 @@
+"""Incremental JSON parser: same result as json.loads, whatever the chunking."""
+
+import json
+
+import pytest
+
+from services.incremental_json import IncrementalJSONParser
+
+EXTRACTION = {
+    "action": "extract",
+    "localisation": {"present": True, "region": "Bretagne", "commune": None},
+    "activite": {"present": True, "mots_cles": "crêperie \"bio\"", "codes": ["56.10A", "56.10C"]},
+    "criteres_financiers": {"present": True, "ca_plus_recent": 1.5e6, "seuil": -3},
+    "notes": [],
+    "extra": {},
+}
+
+
+def parse(text, chunk_size):
+    parser = IncrementalJSONParser()
+    events = []
+    for i in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[i:i + chunk_size]))
+    return parser, events
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1000])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_matches_json_loads(chunk_size, indent):
+    text = json.dumps(EXTRACTION, ensure_ascii=False, indent=indent)
+    parser, events = parse(text, chunk_size)
+    assert parser.done
+    assert parser.value == EXTRACTION
+    assert events[-1] == ((), EXTRACTION)
+
+
+def test_reports_sections_as_soon_as_they_close():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"activite": {"mots_cles": "resta') == []
+    events = parser.feed('uration"}, "localisation": {')
+    assert events == [
+        (("activite", "mots_cles"), "restauration"),
+        (("activite",), {"mots_cles": "restauration"}),
+    ]
+    assert not parser.done
+
+
+def test_literals_complete_on_their_delimiter():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"n": [1, tr') == [(("n", 0), 1)]
+    assert parser.feed("ue]") == [(("n", 1), True), (("n",), [1, True])]
+
+
+def test_escapes_split_across_chunks():
+    parser, _ = parse('{"s": "a\\"b\\u00e9\\n"}', 1)
+    assert parser.value == {"s": 'a"bé\n'}
+
+
+def test_ignores_text_around_the_root_value():
+    parser, _ = parse('```json\n{"a": 1}\n```\nmore {"b": 2}', 3)
+    assert parser.value == {"a": 1}
+    assert parser.done
+
+
+def test_malformed_literal_raises():
+    parser = IncrementalJSONParser()
+    with pytest.raises(ValueError):
+        parser.feed('{"a": tru}')
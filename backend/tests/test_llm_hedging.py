@@ -0,0 +1,62 @@
+"""Hedged LLM calls: no attempt outlives its caller."""
+
+import asyncio
+
+from services import llm_client
+from services.llm_client import LLMClient
+
+
+class FakeAttempts:
+    """attempt(model) sleeping `durations[model]`, recording how each one ended."""
+
+    def __init__(self, durations):
+        self.durations = durations
+        self.outcomes = {}
+
+    async def __call__(self, model):
+        try:
+            await asyncio.sleep(self.durations[model])
+        except asyncio.CancelledError:
+            self.outcomes[model] = "cancelled"
+            raise
+        self.outcomes[model] = "finished"
+        return f"answer from {model}"
+
+
+def test_caller_cancelled_before_the_hedge_delay_cancels_the_attempt():
+    attempts = FakeAttempts({None: 2.0})
+
+    async def main():
+        call = asyncio.ensure_future(LLMClient(api_key="k")._hedged(attempts, 1.0, "test_cancel"))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        # Checked before asyncio.run() cancels leftover tasks
+        return dict(attempts.outcomes)
+
+    assert asyncio.run(main()) == {None: "cancelled"}
+
+
+def test_caller_cancelled_during_the_race_cancels_both_attempts(monkeypatch):
+    monkeypatch.setattr(llm_client, "_hedge_allowed", lambda call_type: True)
+    monkeypatch.setattr(llm_client, "OPENROUTER_FALLBACK_MODEL", "fallback")
+    attempts = FakeAttempts({None: 2.0, "fallback": 2.0})
+
+    async def main():
+        call = asyncio.ensure_future(LLMClient(api_key="k")._hedged(attempts, 0.02, "test_race"))
+        await asyncio.sleep(0.1)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        return dict(attempts.outcomes)
+
+    assert asyncio.run(main()) == {None: "cancelled", "fallback": "cancelled"}
+
+
+def test_hedge_wins_and_the_primary_is_cancelled(monkeypatch):
+    monkeypatch.setattr(llm_client, "_hedge_allowed", lambda call_type: True)
+    monkeypatch.setattr(llm_client, "OPENROUTER_FALLBACK_MODEL", "fallback")
+    attempts = FakeAttempts({None: 2.0, "fallback": 0.01})
+
+    result = asyncio.run(LLMClient(api_key="k")._hedged(attempts, 0.02, "test_win"))
+    assert result == "answer from fallback"
+    assert attempts.outcomes == {None: "cancelled", "fallback": "finished"}
@@ -0,0 +1,39 @@
+"""LLM latency signal: only completed user-facing calls are timed."""
+
+import asyncio
+
+import pytest
+
+from services.load_monitor import LoadMonitor
+
+
+def test_completed_call_is_timed():
+    monitor = LoadMonitor()
+    with monitor.track_llm_call("extraction"):
+        pass
+    assert monitor.llm_p95() is not None
+    assert monitor.llm_in_flight == 0
+
+
+def test_failed_and_cancelled_calls_are_not_timed():
+    monitor = LoadMonitor()
+    with pytest.raises(RuntimeError):
+        with monitor.track_llm_call("extraction"):
+            raise RuntimeError("provider error")
+    with pytest.raises(asyncio.CancelledError):
+        with monitor.track_llm_call("extraction"):
+            raise asyncio.CancelledError()
+    assert monitor.llm_p95() is None
+    assert monitor.llm_in_flight == 0
+
+
+def test_warm_up_calls_are_not_timed():
+    monitor = LoadMonitor()
+    with monitor.exclude_latency():
+        with monitor.track_llm_call("extraction"):
+            pass
+    assert monitor.llm_p95() is None
+
+    with monitor.track_llm_call("extraction"):
+        pass
+    assert monitor.llm_p95() is not None
@@ -0,0 +1,69 @@
+"""Rule-based fast-path extractor: confident on simple queries, defers otherwise."""
+
+import pytest
+
+from services.rule_extractor import RULE_EXTRACTOR_MIN_CONFIDENCE, get_rule_extractor, tokenize
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    extractor = get_rule_extractor()
+    assert extractor._initialized
+    return extractor
+
+
+def confident(extractor, query):
+    result = extractor.extract(query)
+    assert result.extraction_result is not None
+    assert result.confidence >= RULE_EXTRACTOR_MIN_CONFIDENCE, result
+    return result.extraction_result
+
+
+def test_region_activity_and_revenue(extractor):
+    extraction = confident(extractor, "restauration en Bretagne avec plus de 2M€ de CA")
+    assert extraction["localisation"]["region"] == "Bretagne"
+    assert extraction["activite"]["mots_cles"] == "restauration"
+    assert extraction["criteres_financiers"] == {
+        "present": True,
+        "ca_plus_recent": 2_000_000,
+        "resultat_net_plus_recent": None,
+        "rentabilite_plus_recente": None,
+    }
+
+
+def test_commune(extractor):
+    extraction = confident(extractor, "boulangeries à Rennes")
+    assert extraction["localisation"]["commune"] == "Rennes"
+    assert extraction["activite"]["activite_entreprise"] == "boulangeries"
+
+
+def test_departement_number(extractor):
+    extraction = confident(extractor, "entreprises du 69")
+    assert extraction["localisation"]["departement"] == "Rhone"
+    assert not extraction["activite"]["present"]
+
+
+def test_size_acronym_is_transformed(extractor):
+    extraction = confident(extractor, "TPE restauration")
+    size = extraction["taille_entreprise"]
+    assert size["acronyme"] == "TPE"
+    assert size["tranche_effectif"] == ["0 salarie", "1 ou 2 salaries", "3 a 5 salaries", "6 a 9 salaries"]
+    # Same schema as the LLM path
+    assert set(extraction) == {
+        "localisation", "activite", "taille_entreprise", "criteres_financiers", "criteres_juridiques",
+    }
+
+
+@pytest.mark.parametrize("query", [
+    "restaurants sauf fast-food à Paris",  # Exclusions are not expressible
+    "entreprise informatique avec 50 salariés",  # Not an INSEE range boundary
+    "plomberie à Lyonn",  # Unknown location
+    "bonjour",  # No known activity vocabulary
+])
+def test_defers_to_llm(extractor, query):
+    result = extractor.extract(query)
+    assert result.extraction_result is None or result.confidence < RULE_EXTRACTOR_MIN_CONFIDENCE
+
+
+def test_tokenize_splits_elisions():
+    assert [t.norm for t in tokenize("l'Hérault")] == ["l'", "herault"]
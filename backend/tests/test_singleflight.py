@@ -0,0 +1,141 @@
+"""Request coalescing: identical concurrent calls share one execution."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services import pipeline
+from services.pipeline import Deadline, current_deadline, remaining_timeout
+from services.singleflight import SingleFlight, ThreadSingleFlight, request_key
+
+
+def test_request_key_is_canonical():
+    assert request_key("m", {"a": 1, "b": [1, 2]}) == request_key("m", {"b": [1, 2], "a": 1})
+    assert request_key("m", {"a": 1}) != request_key("m", {"a": 2})
+    assert request_key("m", [1, 2]) != request_key("m", [2, 1])
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight("test_share")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"count": 3}
+
+    async def main():
+        return await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert results == [{"count": 3}] * 5
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
+
+
+def test_errors_reach_every_waiter_and_are_not_kept():
+    flights = SingleFlight("test_errors")
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(flights.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        # Completed calls are forgotten: the next one runs again
+        with pytest.raises(RuntimeError):
+            await flights.do("k", fail)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flights = SingleFlight("test_cancel_one")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flights.do("k", work))
+        second = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_last_waiter_cancelling_cancels_the_call():
+    flights = SingleFlight("test_cancel_all")
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        caller = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert cancelled == [1]
+    assert flights.in_flight() == 0
+
+
+def test_threads_share_one_execution():
+    flights = ThreadSingleFlight("test_threads")
+    calls = []
+    results = []
+    started = threading.Barrier(5)
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return 42
+
+    def caller():
+        started.wait()
+        results.append(flights.do("k", work))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [42] * 5
+    assert len(calls) == 1
+
+
+def test_shared_call_ignores_the_first_callers_deadline():
+    flights = SingleFlight("test_deadlines")
+    seen = []
+
+    async def work():
+        seen.append(current_deadline())
+        await asyncio.sleep(0.1)
+        # Past the first caller's deadline, well before the second one's
+        return remaining_timeout(10.0)
+
+    async def caller(seconds):
+        pipeline._current_deadline.set(Deadline(seconds))
+        return await flights.do("k", work)
+
+    async def main():
+        short = asyncio.create_task(caller(0.05))
+        await asyncio.sleep(0)
+        return await asyncio.gather(short, caller(5.0))
+
+    assert asyncio.run(main()) == [10.0, 10.0]
+    assert seen == [None]
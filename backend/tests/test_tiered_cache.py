@@ -0,0 +1,79 @@
+"""TieredCache: shared tier, stampede protection and the blocking-API contract."""
+
+import asyncio
+import time
+
+import pytest
+
+from services.cache import TieredCache, set_shared_backend
+from services.shared_cache import InMemoryBackend
+
+
+@pytest.fixture
+def shared_tier():
+    backend = InMemoryBackend()
+    set_shared_backend(backend)
+    yield backend
+    set_shared_backend(None)
+
+
+def test_sync_api_refuses_to_run_on_the_event_loop():
+    cache = TieredCache("test_sync_on_loop", 10, 60)
+
+    async def on_loop():
+        with pytest.raises(RuntimeError):
+            cache.get_or_compute_sync("k", lambda: 1)
+        with pytest.raises(RuntimeError):
+            cache.get_sync("k")
+        # Worker threads are fine
+        return await asyncio.to_thread(cache.get_or_compute_sync, "k", lambda: 1)
+
+    assert asyncio.run(on_loop()) == 1
+    assert cache.get_sync("k") == 1
+
+
+def test_value_computed_by_one_replica_is_reused_by_another(shared_tier):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"value": 42}
+
+    replica_a = TieredCache("test_replicas", 10, 60)
+    replica_b = TieredCache("test_replicas", 10, 60)
+    assert replica_a.get_or_compute_sync("k", compute) == {"value": 42}
+    assert replica_b.get_or_compute_sync("k", compute) == {"value": 42}
+    assert len(calls) == 1
+
+
+def test_concurrent_async_misses_compute_once(shared_tier):
+    cache = TieredCache("test_stampede", 10, 60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "v"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["v"] * 5
+    assert len(calls) == 1
+
+
+def test_versions_do_not_share_entries(shared_tier):
+    TieredCache("test_versions", 10, 60, version="model-a").set_sync("k", "a")
+    assert TieredCache("test_versions", 10, 60, version="model-b").get_sync("k") is None
+
+
+def test_shared_hit_keeps_the_entry_ttl_locally(shared_tier):
+    # A short ttl_for() TTL (e.g. a negative count entry) set by one replica
+    replica_a = TieredCache("test_shared_ttl", 10, 60)
+    replica_b = TieredCache("test_shared_ttl", 10, 60)
+    replica_a.set_sync("k", "short-lived", ttl=0.2)
+
+    assert replica_b.get_sync("k") == "short-lived"
+    time.sleep(0.3)
+    assert replica_b.local.get("k") is None
+    assert replica_b.get_sync("k") is None
@@ -0,0 +1,49 @@
+"""Vague-query classifier: real searches are never answered from a template."""
+
+import pytest
+
+from services.vague_classifier import VagueClassifier, get_vague_classifier
+
+# Searches wrapped in small talk, or with words the training set has never seen
+SEARCHES = [
+    "salut ça va? je cherche des garages",
+    "hello, restos Lyon",
+    "entreprises de plus de 50 salariés",
+]
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    classifier = get_vague_classifier()
+    assert classifier._initialized
+    return classifier
+
+
+@pytest.mark.parametrize("query", SEARCHES)
+def test_searches_go_to_llm(classifier, query):
+    verdict = classifier.classify(query)
+    assert not verdict.is_vague, f"P(vague)={verdict.probability:.3f}"
+
+
+# Phrasings absent from data/vague_queries.json
+HELD_OUT_SEARCHES = [
+    "coucou, plombiers Lille",
+    "bonjour des fleuristes",
+]
+
+
+@pytest.mark.parametrize("query", HELD_OUT_SEARCHES)
+def test_held_out_searches_go_to_llm(classifier, query):
+    assert query not in {text for text, _ in VagueClassifier.load_examples()}
+    verdict = classifier.classify(query)
+    assert not verdict.is_vague, f"P(vague)={verdict.probability:.3f}"
+
+
+@pytest.mark.parametrize("query", ["bonjour", "quel temps fait-il ?"])
+def test_clear_vague_messages_answered_locally(classifier, query):
+    assert classifier.classify(query).is_vague
+
+
+def test_unknown_words_are_not_vague_vocabulary():
+    assert VagueClassifier.only_vague_words("bonjour, comment ça marche ?")
+    assert not VagueClassifier.only_vague_words("bonjour, des garages")
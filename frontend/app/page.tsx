@@ -13,6 +13,7 @@ export default function Home() {
   const {
     messages,
     extraction,
+    partialExtraction,
     companyCount,
     activityMatches,
     isLoading,
@@ -28,8 +29,10 @@ export default function Home() {
 
   // Transition happens as soon as user sends first message
   const hasStarted = messages.length > 0
+  // Criteria streamed during this turn are shown until the final ones arrive
+  const displayedExtraction = partialExtraction ?? extraction
   // Criteria section only shows when we have results
-  const hasResults = extraction !== null
+  const hasResults = displayedExtraction !== null
   // Color based on count
   const isGoodCount = companyCount !== null && companyCount <= 500
 
@@ -87,7 +90,7 @@ export default function Home() {
       >
         <div className="h-full overflow-y-auto">
           <SearchFieldsPanel
-            extraction={extraction}
+            extraction={displayedExtraction}
             companyCount={companyCount}
             activityMatches={activityMatches}
             isLoading={isLoading}
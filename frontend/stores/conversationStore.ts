@@ -40,6 +40,8 @@ interface ConversationState {
   // State
   messages: ChatMessage[]
   extraction: ExtractionResult | null
+  // Criteria streamed before the final metadata event: display only, never sent back
+  partialExtraction: ExtractionResult | null
   companyCount: number | null
   countSemantic: number | null
   nafCodes: string[] | null
@@ -69,6 +71,7 @@ export const useConversationStore = create<ConversationState>((set, get) => ({
   // Initial state
   messages: [],
   extraction: null,
+  partialExtraction: null,
   companyCount: null,
   countSemantic: null,
   nafCodes: null,
@@ -113,8 +116,8 @@ export const useConversationStore = create<ConversationState>((set, get) => ({
         content: m.content,
       }))
 
-      // Get current extraction and activity matches for caching
-      const { extraction, activityMatches } = get()
+      // Get current extraction, activity matches and counts for caching
+      const { extraction, activityMatches, companyCount, countSemantic } = get()
 
       const response = await fetch(`${API_URL}/api/v1/chat/stream`, {
         method: 'POST',
@@ -123,6 +126,8 @@ export const useConversationStore = create<ConversationState>((set, get) => ({
           messages: messageHistory,
           previous_extraction: extraction,
           previous_activity_matches: activityMatches,
+          previous_company_count: companyCount,
+          previous_count_semantic: countSemantic,
         }),
       })
 
@@ -174,13 +179,31 @@ export const useConversationStore = create<ConversationState>((set, get) => ({
             const data = JSON.parse(eventData)
 
             switch (eventType) {
+              case 'partial': {
+                // Criteria sections extracted so far (not post-processed): shown
+                // until the metadata event, but never stored as the extraction
+                const currentState = get()
+                set({
+                  partialExtraction: {
+                    ...(currentState.partialExtraction ?? currentState.extraction ?? {}),
+                    ...data.extraction_result,
+                  },
+                })
+                break
+              }
+
               case 'metadata': {
                 const currentState = get()
+                set({ partialExtraction: null })
                 if (!data.rejected) {
+                  // Counts belong to the extraction they were made for: a new
+                  // extraction without a count (failed count) clears them, or the
+                  // next turn would reuse them as previous_company_count
+                  const newExtraction = data.extraction_result != null
                   set({
                     extraction: data.extraction_result ?? currentState.extraction,
-                    companyCount: data.company_count ?? currentState.companyCount,
-                    countSemantic: data.count_semantic ?? currentState.countSemantic,
+                    companyCount: newExtraction ? data.company_count ?? null : currentState.companyCount,
+                    countSemantic: newExtraction ? data.count_semantic ?? null : currentState.countSemantic,
                     nafCodes: data.naf_codes ?? currentState.nafCodes,
                     activityMatches: data.activity_matches ?? currentState.activityMatches,
                   })
@@ -218,6 +241,7 @@ export const useConversationStore = create<ConversationState>((set, get) => ({
               }
 
               case 'error': {
+                set({ partialExtraction: null })
                 throw new Error(data.message || 'Stream error')
               }
             }
@@ -227,6 +251,9 @@ export const useConversationStore = create<ConversationState>((set, get) => ({
         }
       }
 
+      // Stream ended without a metadata event: drop the partial criteria
+      set({ partialExtraction: null })
+
       // If no content was streamed, ensure loading is stopped
       if (!assistantMessageAdded) {
         set({ isLoading: false })
@@ -234,7 +261,7 @@ export const useConversationStore = create<ConversationState>((set, get) => ({
 
     } catch (error) {
       const errorMessage = error instanceof Error ? error.message : 'An error occurred'
-      set({ error: errorMessage, isLoading: false })
+      set({ error: errorMessage, isLoading: false, partialExtraction: null })
       console.error('Error sending message:', error)
     }
   },
@@ -290,6 +317,7 @@ export const useConversationStore = create<ConversationState>((set, get) => ({
     set({
       messages: [],
       extraction: null,
+      partialExtraction: null,
       companyCount: null,
       countSemantic: null,
       nafCodes: null,